@@ -0,0 +1,159 @@
+from threading import Lock
+import numpy as np
+from flaskr.ML.face_recognition.face_matcher import DEFAULT_TOLERANCE
+
+ENCODING_SIZE = 128
+
+
+class _Cluster:
+    """Encodings of one partition kept in a growable contiguous float32 matrix"""
+
+    def __init__(self):
+        self.vectors = np.empty((16, ENCODING_SIZE), dtype=np.float32)
+        self.norms = np.empty(16, dtype=np.float32)
+        self.labels = []
+
+    def __len__(self):
+        return len(self.labels)
+
+    def append(self, label, vector):
+        size = len(self.labels)
+        if size == len(self.vectors):
+            self.vectors = np.resize(self.vectors, (size * 2, ENCODING_SIZE))
+            self.norms = np.resize(self.norms, size * 2)
+        self.vectors[size] = vector
+        self.norms[size] = vector @ vector
+        self.labels.append(label)
+        return size
+
+    def pop(self, position):
+        """Removes the row at position by moving the last row there, returns the label of the moved row"""
+        last = len(self.labels) - 1
+        self.vectors[position] = self.vectors[last]
+        self.norms[position] = self.norms[last]
+        self.labels[position] = self.labels[last]
+        self.labels.pop()
+        return self.labels[position] if position < last else None
+
+
+class ANNIndex:
+    """
+    Approximate nearest neighbour index over face encodings (inverted file).
+
+    The encodings are partitioned with k-means into about sqrt(n) clusters and
+    a query only scans the nprobe clusters with the closest centroids. A higher
+    nprobe gives better recall at the cost of latency, nprobe >= number of
+    clusters is an exact search.
+
+    Below exact_threshold encodings the index keeps a single partition, which
+    is the same exact search as FaceMatcher. Inserts and deletes are incremental,
+    the partitions are retrained when the index grew by retrain_factor since
+    the last training so they stay balanced.
+    """
+
+    def __init__(self, nprobe=8, exact_threshold=5000, retrain_factor=2.0, tolerance=DEFAULT_TOLERANCE):
+        self.nprobe = nprobe
+        self.exact_threshold = exact_threshold
+        self.retrain_factor = retrain_factor
+        self.tolerance = tolerance
+
+        self.lock = Lock()
+        self._centroids = None  # None while the index does exact search
+        self._clusters = [_Cluster()]
+        self._positions = {}  # label: (cluster, position)
+        self._trained_size = 0
+
+    def __len__(self):
+        return len(self._positions)
+
+    @property
+    def exact(self):
+        return self._centroids is None
+
+    def add(self, label, encoding):
+        """Inserts or replaces the encoding of label"""
+        vector = np.asarray(encoding, dtype=np.float32).reshape(ENCODING_SIZE)
+        with self.lock:
+            if label in self._positions:
+                self._remove(label)
+            cluster = 0 if self.exact else int(np.argmin(self._centroid_distances(vector[np.newaxis])[0]))
+            self._positions[label] = (cluster, self._clusters[cluster].append(label, vector))
+
+            if len(self) >= self.exact_threshold and len(self) >= self._trained_size * self.retrain_factor:
+                self._train()
+
+    def remove(self, label):
+        with self.lock:
+            if label in self._positions:
+                self._remove(label)
+
+    def search(self, encodings):
+        """
+        Returns (labels, distances) of the closest known encoding of every query.
+        Queries with nothing within tolerance get the label None.
+        """
+        queries = np.asarray(encodings, dtype=np.float32).reshape(-1, ENCODING_SIZE)
+        labels = [None] * len(queries)
+        distances = np.full(len(queries), np.inf, dtype=np.float32)
+        with self.lock:
+            if len(self) == 0:
+                return labels, distances
+
+            if self.exact:
+                probes = np.zeros((len(queries), 1), dtype=int)
+            else:
+                nprobe = min(self.nprobe, len(self._clusters))
+                probes = np.argpartition(self._centroid_distances(queries), nprobe - 1, axis=1)[:, :nprobe]
+
+            for query_index, query in enumerate(queries):
+                query_norm = query @ query
+                best_squared_distance = np.inf
+                for cluster_index in probes[query_index]:
+                    cluster = self._clusters[cluster_index]
+                    size = len(cluster)
+                    if size == 0:
+                        continue
+                    squared_distances = cluster.norms[:size] - 2 * (cluster.vectors[:size] @ query)
+                    position = int(np.argmin(squared_distances))
+                    if squared_distances[position] < best_squared_distance:
+                        best_squared_distance = squared_distances[position]
+                        labels[query_index] = cluster.labels[position]
+                distances[query_index] = np.sqrt(max(best_squared_distance + query_norm, 0))
+
+        for query_index, distance in enumerate(distances):
+            if distance > self.tolerance:
+                labels[query_index] = None
+        return labels, distances
+
+    def _remove(self, label):
+        cluster_index, position = self._positions.pop(label)
+        moved_label = self._clusters[cluster_index].pop(position)
+        if moved_label is not None:
+            self._positions[moved_label] = (cluster_index, position)
+
+    def _centroid_distances(self, vectors):
+        return self._centroid_norms - 2 * (vectors @ self._centroids.T)
+
+    def _train(self, iterations=10, sample_per_cluster=64):
+        labels = [label for cluster in self._clusters for label in cluster.labels]
+        vectors = np.concatenate([cluster.vectors[:len(cluster)] for cluster in self._clusters])
+        cluster_count = int(np.sqrt(len(vectors)))
+
+        # Lloyd's k-means on a sample, then every encoding goes to its closest centroid
+        rng = np.random.default_rng(0)
+        sample = vectors[rng.choice(len(vectors), min(len(vectors), cluster_count * sample_per_cluster), replace=False)]
+        centroids = sample[rng.choice(len(sample), cluster_count, replace=False)].copy()
+        for _ in range(iterations):
+            assignments = np.argmin((centroids * centroids).sum(axis=1) - 2 * (sample @ centroids.T), axis=1)
+            for cluster_index in range(cluster_count):
+                members = sample[assignments == cluster_index]
+                if len(members) > 0:
+                    centroids[cluster_index] = members.mean(axis=0)
+
+        self._centroids = centroids
+        self._centroid_norms = (centroids * centroids).sum(axis=1)
+        self._clusters = [_Cluster() for _ in range(cluster_count)]
+        self._positions = {}
+        for label, vector, cluster_index in zip(labels, vectors, np.argmin(self._centroid_distances(vectors), axis=1)):
+            self._positions[label] = (int(cluster_index), self._clusters[cluster_index].append(label, vector))
+        self._trained_size = len(vectors)
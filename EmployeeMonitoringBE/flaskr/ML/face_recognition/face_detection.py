@@ -0,0 +1,59 @@
+import face_recognition
+import numpy as np
+from flaskr.ML.face_recognition.face_tracker import iou_matrix
+
+CNN = "cnn"
+HOG = "hog"
+# HOG proposes candidate regions, the CNN confirms and refines only those regions
+CASCADE = "cascade"
+DETECTION_MODES = (CNN, HOG, CASCADE)
+
+# Space added around a HOG candidate before the CNN looks at it, relative to the candidate size
+CASCADE_MARGIN = 0.5
+# CNN boxes overlapping an accepted one at least this much are the same face found from another candidate
+CASCADE_DUPLICATE_IOU = 0.5
+
+
+def detect_faces(rgb_image, mode=CNN):
+    """Face locations (top, right, bottom, left) in an RGB image"""
+    if mode == HOG:
+        return face_recognition.face_locations(rgb_image, model="hog")
+    if mode == CASCADE:
+        return detect_faces_cascade(rgb_image)
+    return face_recognition.face_locations(rgb_image, model="cnn")
+
+
+def detect_faces_in_regions(rgb_image, regions, mode=CNN):
+    """
+    Face locations in the whole image, only looking inside the (top, right, bottom, left) regions.
+    Regions must not overlap or a face on both could be found twice
+    """
+    face_locations = []
+    for top, right, bottom, left in regions:
+        face_locations.extend((face_top + top, face_right + left, face_bottom + top, face_left + left)
+                              for face_top, face_right, face_bottom, face_left
+                              in detect_faces(np.ascontiguousarray(rgb_image[top:bottom, left:right]), mode))
+    return face_locations
+
+
+def detect_faces_cascade(rgb_image):
+    """
+    Runs the cheap HOG detector on the whole image and the CNN only around its candidates.
+    Frames without people cost a single HOG pass, candidates the CNN does not
+    confirm are dropped as HOG false positives.
+    """
+    height, width = rgb_image.shape[:2]
+    face_locations = []
+    for top, right, bottom, left in face_recognition.face_locations(rgb_image, model="hog"):
+        margin_y = int((bottom - top) * CASCADE_MARGIN)
+        margin_x = int((right - left) * CASCADE_MARGIN)
+        region_top, region_left = max(top - margin_y, 0), max(left - margin_x, 0)
+        region_bottom, region_right = min(bottom + margin_y, height), min(right + margin_x, width)
+        region = np.ascontiguousarray(rgb_image[region_top:region_bottom, region_left:region_right])
+
+        for cnn_top, cnn_right, cnn_bottom, cnn_left in face_recognition.face_locations(region, model="cnn"):
+            location = (cnn_top + region_top, cnn_right + region_left, cnn_bottom + region_top, cnn_left + region_left)
+            # Candidates close to each other can share a face, found with slightly different boxes
+            if not face_locations or iou_matrix([location], face_locations).max() < CASCADE_DUPLICATE_IOU:
+                face_locations.append(location)
+    return face_locations
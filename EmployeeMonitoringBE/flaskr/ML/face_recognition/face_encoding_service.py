@@ -0,0 +1,151 @@
+import multiprocessing
+import os
+import queue
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from threading import Lock, Semaphore, Thread, active_count
+from flaskr.ML.model_registry import get_model_registry, FACE_MODELS
+
+# Extra space kept around a face when cropping it, relative to the face size,
+# so the landmark predictor still sees the whole face
+CROP_MARGIN = 0.25
+
+
+def crop_face(image, face_location):
+    """Returns the crop around face_location and the location of the face inside the crop"""
+    top, right, bottom, left = face_location
+    margin_y = int((bottom - top) * CROP_MARGIN)
+    margin_x = int((right - left) * CROP_MARGIN)
+    crop_top = max(top - margin_y, 0)
+    crop_left = max(left - margin_x, 0)
+    crop_bottom = min(bottom + margin_y, image.shape[0])
+    crop_right = min(right + margin_x, image.shape[1])
+    crop = image[crop_top:crop_bottom, crop_left:crop_right].copy()
+    return crop, (top - crop_top, right - crop_left, bottom - crop_top, left - crop_left)
+
+
+def _load_models():
+    # Importing face_recognition loads the dlib models, forked workers already have them
+    import face_recognition
+
+
+def _encode_batch(faces):
+    """Runs in a worker process, faces is a list of (crop, location)"""
+    import face_recognition
+    return [face_recognition.face_encodings(crop, [location])[0] for crop, location in faces]
+
+
+class FaceEncodingService:
+    """
+    Encodes the faces found by every camera in a pool of worker processes,
+    so the 128-d encodings are not computed under the GIL of the Flask process.
+
+    Camera threads submit the face crops of a frame and get a Future back.
+    A dispatcher thread groups the crops of all the cameras into batches of
+    up to batch_size faces and sends them to the pool. At most one batch per
+    worker is in flight, while the pool is busy the queue keeps filling so
+    the next batches get bigger instead of queueing more round trips.
+
+    When the process already holds the face models (ModelRegistry) and runs no other thread,
+    as in a gunicorn worker's post_fork, the workers are forked from it at once and share the
+    warmed models with it. Otherwise forking the threaded server is not safe and the workers
+    are started by a forkserver, which loads one copy of the models for all of them.
+    """
+
+    def __init__(self, workers=None, batch_size=16, batch_timeout=0.005):
+        self.workers = workers or os.cpu_count()
+        self.batch_size = batch_size
+        self.batch_timeout = batch_timeout
+
+        start_methods = multiprocessing.get_all_start_methods()
+        self.shares_models = "fork" in start_methods and active_count() == 1 \
+            and get_model_registry().is_loaded(FACE_MODELS)
+        if self.shares_models:
+            context = multiprocessing.get_context("fork")
+        elif "forkserver" in start_methods:
+            context = multiprocessing.get_context("forkserver")
+            context.set_forkserver_preload(["face_recognition"])
+        else:
+            context = multiprocessing.get_context("spawn")
+        self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=context, initializer=_load_models)
+        if self.shares_models:
+            # A fork pool starts all its workers on the first task, before any thread of this service exists
+            self._pool.submit(_load_models).result()
+        self._requests = queue.Queue()
+        self._in_flight = Semaphore(self.workers)
+
+        self.batches = 0
+        self.faces_encoded = 0
+
+        Thread(target=self._dispatch, daemon=True).start()
+
+    def encode(self, image, face_locations) -> Future:
+        """Future of the list of encodings of the faces at face_locations in the RGB image"""
+        future = Future()
+        if not face_locations:
+            future.set_result([])
+            return future
+        self._requests.put(([crop_face(image, location) for location in face_locations], future))
+        return future
+
+    def get_stats(self):
+        return {
+            "workers": self.workers,
+            "shares_models": self.shares_models,
+            "queued_requests": self._requests.qsize(),
+            "batches": self.batches,
+            "faces_encoded": self.faces_encoded,
+            "average_batch_size": self.faces_encoded / self.batches if self.batches else 0
+        }
+
+    def _dispatch(self):
+        while True:
+            requests = [self._requests.get()]
+            faces = len(requests[0][0])
+            deadline = time.monotonic() + self.batch_timeout
+            while faces < self.batch_size:
+                try:
+                    request = self._requests.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+                requests.append(request)
+                faces += len(request[0])
+
+            self._in_flight.acquire()
+            batch = [face for crops, _ in requests for face in crops]
+            try:
+                pool_future = self._pool.submit(_encode_batch, batch)
+            except Exception as e:
+                self._in_flight.release()
+                for _, future in requests:
+                    future.set_exception(e)
+                continue
+            pool_future.add_done_callback(lambda pool_future, requests=requests: self._distribute(pool_future, requests))
+
+    def _distribute(self, pool_future, requests):
+        """Hands every camera back the encodings of its own crops"""
+        self._in_flight.release()
+        try:
+            encodings = pool_future.result()
+        except Exception as e:
+            for _, future in requests:
+                future.set_exception(e)
+            return
+
+        self.batches += 1
+        self.faces_encoded += len(encodings)
+        start = 0
+        for crops, future in requests:
+            future.set_result(encodings[start:start + len(crops)])
+            start += len(crops)
+
+
+face_encoding_service = None
+face_encoding_service_lock = Lock()
+def get_face_encoding_service():
+    global face_encoding_service
+    with face_encoding_service_lock:
+        if face_encoding_service == None:
+            workers = os.getenv("FACE_ENCODING_WORKERS")
+            face_encoding_service = FaceEncodingService(workers=int(workers) if workers else None)
+    return face_encoding_service
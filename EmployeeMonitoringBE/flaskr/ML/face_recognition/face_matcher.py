@@ -0,0 +1,40 @@
+import numpy as np
+
+# Same default as face_recognition.compare_faces
+DEFAULT_TOLERANCE = 0.6
+
+
+class FaceMatcher:
+    """
+    Matches face encodings against a gallery of known encodings.
+    The gallery is kept as one contiguous float32 matrix with its squared norms
+    precomputed, so all the faces of a frame are matched with one matrix product:
+    ||face - known||^2 = ||face||^2 - 2 * face . known + ||known||^2
+    """
+
+    def __init__(self, known_face_encodings, tolerance=DEFAULT_TOLERANCE):
+        self.tolerance = tolerance
+        self.gallery = np.ascontiguousarray(np.asarray(known_face_encodings, dtype=np.float32).reshape(-1, 128))
+        self.gallery_norms = np.einsum("ij,ij->i", self.gallery, self.gallery)
+
+    def __len__(self):
+        return self.gallery.shape[0]
+
+    def match(self, face_encodings):
+        """
+        Returns (best_indices, best_distances), one entry per face.
+        Faces with no known face within tolerance get the index -1.
+        """
+        faces = np.asarray(face_encodings, dtype=np.float32).reshape(-1, 128)
+        if len(faces) == 0 or len(self) == 0:
+            return np.full(len(faces), -1), np.full(len(faces), np.inf, dtype=np.float32)
+
+        squared_distances = faces @ self.gallery.T
+        squared_distances *= -2
+        squared_distances += self.gallery_norms
+        squared_distances += np.einsum("ij,ij->i", faces, faces)[:, np.newaxis]
+
+        best_indices = np.argmin(squared_distances, axis=1)
+        best_distances = np.sqrt(np.maximum(squared_distances[np.arange(len(faces)), best_indices], 0))
+        best_indices[best_distances > self.tolerance] = -1
+        return best_indices, best_distances
@@ -1,7 +1,19 @@
 # https://pypi.org/project/face-recognition/
 import face_recognition
+import numpy as np
+import cv2 as cv
+from flaskr.ML.face_recognition.face_encoding_service import get_face_encoding_service
+from flaskr.ML.face_recognition.face_tracker import FaceTracker
+from flaskr.ML.face_recognition.face_detection import CNN, detect_faces, detect_faces_in_regions
 # TODO: Make sure yo uhave CUDA Enabled
 
+# Frames are analyzed at a quarter of their size, locations are scaled back
+ANALYSIS_SCALE = 4
+
+def get_analysis_size(frame):
+    """(width, height) of the downscaled frame the faces are detected on"""
+    return round(frame.shape[1] / ANALYSIS_SCALE), round(frame.shape[0] / ANALYSIS_SCALE)
+
 # Func1:
 # Get a picture of an employee face
 # Encode it and save the encoded face in the database ( saving can be done in router, encoding here)
@@ -15,8 +27,43 @@ def encode_picture(image):
     else:
         raise Exception("No face detected")
 # Func2:
-# Recognize the face of an employee
-# Extract the encoded part from the db
-# employees is a list of employees
-def recognize_faces(image, employees: list):
-    pass
+# Recognize the faces in a BGR frame
+# known_faces identifies the encodings, e.g. the FaceGallery of the tenant
+# Returns a list of ((top, right, bottom, left), employee_id, name) in the coordinates of the full frame,
+# employee_id is None for unknown faces
+# The encodings are computed by the process pool, batched with the faces of the other cameras
+# With a face_tracker only the new tracks and the ones due for verification are encoded,
+# the others keep the identity found on a previous frame
+# detection_mode is one of face_detection.DETECTION_MODES
+# regions [(top, right, bottom, left)] in the coordinates of the downscaled frame limit the detection to those regions,
+# e.g. the zones of the camera or the persons found on the frame. None detects in the whole frame
+def recognize_faces(frame, known_faces, face_tracker: FaceTracker = None, detection_mode=CNN, regions=None):
+    small_frame = cv.resize(frame, (0, 0), fx=1 / ANALYSIS_SCALE, fy=1 / ANALYSIS_SCALE)
+    rgb_small_frame = np.ascontiguousarray(small_frame[:, :, ::-1])
+    if regions is None:
+        face_locations = detect_faces(rgb_small_frame, detection_mode)
+    else:
+        face_locations = detect_faces_in_regions(rgb_small_frame, regions, detection_mode)
+
+    if face_tracker is None:
+        face_encodings = get_face_encoding_service().encode(rgb_small_frame, face_locations).result()
+        identities = known_faces.identify(face_encodings)
+    else:
+        tracks = face_tracker.update(face_locations)
+        to_encode = face_tracker.select_for_encoding(tracks)
+        face_encodings = get_face_encoding_service().encode(rgb_small_frame, [face_locations[i] for i in to_encode]).result()
+        for index, (employee_id, name) in zip(to_encode, known_faces.identify(face_encodings)):
+            face_tracker.set_identity(tracks[index], employee_id, name)
+        identities = [(track.employee_id, track.name) for track in tracks]
+
+    return [(tuple(coordinate * ANALYSIS_SCALE for coordinate in location), employee_id, name)
+            for location, (employee_id, name) in zip(face_locations, identities)]
+
+# Func3:
+# Draw the recognized faces over the frame, in place
+def draw_faces(frame, faces):
+    for (top, right, bottom, left), _, name in faces:
+        cv.rectangle(frame, (left, top), (right, bottom), (0, 0, 255), 2)
+        cv.rectangle(frame, (left, bottom - 35), (right, bottom), (0, 0, 255), cv.FILLED)
+        font = cv.FONT_HERSHEY_DUPLEX
+        cv.putText(frame, name, (left + 6, bottom - 6), font, 1.0, (255, 255, 255), 1)
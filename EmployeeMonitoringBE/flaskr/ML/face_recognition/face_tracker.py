@@ -0,0 +1,120 @@
+import itertools
+import numpy as np
+
+
+class Track:
+    def __init__(self, track_id, location):
+        self.id = track_id
+        self.location = location  # (top, right, bottom, left)
+        self.employee_id = None
+        self.name = None  # None until the face was encoded once
+        self.frames_since_encoding = 0
+        self.missed = 0
+
+
+def iou_matrix(locations_a, locations_b):
+    """Intersection over union of every pair of (top, right, bottom, left) boxes"""
+    a = np.asarray(locations_a, dtype=np.float32).reshape(-1, 1, 4)
+    b = np.asarray(locations_b, dtype=np.float32).reshape(1, -1, 4)
+    height = np.clip(np.minimum(a[..., 2], b[..., 2]) - np.maximum(a[..., 0], b[..., 0]), 0, None)
+    width = np.clip(np.minimum(a[..., 1], b[..., 1]) - np.maximum(a[..., 3], b[..., 3]), 0, None)
+    intersection = height * width
+    area_a = (a[..., 2] - a[..., 0]) * (a[..., 1] - a[..., 3])
+    area_b = (b[..., 2] - b[..., 0]) * (b[..., 1] - b[..., 3])
+    return intersection / np.maximum(area_a + area_b - intersection, 1e-6)
+
+
+def centroid_distance_matrix(locations_a, locations_b):
+    """Distance between box centres of every pair, relative to the size of the first box"""
+    a = np.asarray(locations_a, dtype=np.float32).reshape(-1, 1, 4)
+    b = np.asarray(locations_b, dtype=np.float32).reshape(1, -1, 4)
+    centre_y = ((a[..., 0] + a[..., 2]) - (b[..., 0] + b[..., 2])) / 2
+    centre_x = ((a[..., 1] + a[..., 3]) - (b[..., 1] + b[..., 3])) / 2
+    size = np.maximum(a[..., 2] - a[..., 0], a[..., 1] - a[..., 3])
+    return np.hypot(centre_y, centre_x) / np.maximum(size, 1)
+
+
+class FaceTracker:
+    """
+    Gives every face of a camera a persistent track id across analyzed frames,
+    so the identity found by the encoder is carried forward instead of encoding
+    every face on every frame.
+
+    Detections are matched to the tracks greedily by IoU, faces that moved
+    too much for their boxes to overlap are matched by centroid distance.
+    A track needs an encoding when it is new, and then every reencode_every
+    frames to verify the identity (unknown_reencode_every while unidentified).
+    Tracks not seen for max_missed frames are dropped.
+    """
+
+    def __init__(self, iou_threshold=0.3, max_centroid_distance=0.5,
+                 reencode_every=15, unknown_reencode_every=3, max_missed=5):
+        self.iou_threshold = iou_threshold
+        self.max_centroid_distance = max_centroid_distance
+        self.reencode_every = reencode_every
+        self.unknown_reencode_every = unknown_reencode_every
+        self.max_missed = max_missed
+
+        self.tracks = []
+        self._track_ids = itertools.count(1)
+        self.encodings_requested = 0
+        self.encodings_skipped = 0
+
+    def update(self, face_locations):
+        """Returns the track of every location, in the same order"""
+        matched_tracks = [None] * len(face_locations)
+        unmatched_tracks = set(range(len(self.tracks)))
+
+        if self.tracks and face_locations:
+            track_locations = [track.location for track in self.tracks]
+            for scores, threshold, higher_is_better in (
+                    (iou_matrix(track_locations, face_locations), self.iou_threshold, True),
+                    (centroid_distance_matrix(track_locations, face_locations), self.max_centroid_distance, False)):
+                order = np.argsort(-scores if higher_is_better else scores, axis=None)
+                for track_index, location_index in zip(*np.unravel_index(order, scores.shape)):
+                    score = scores[track_index, location_index]
+                    if (score < threshold) if higher_is_better else (score > threshold):
+                        break
+                    if track_index in unmatched_tracks and matched_tracks[location_index] is None:
+                        matched_tracks[location_index] = self.tracks[track_index]
+                        unmatched_tracks.discard(track_index)
+
+        for track_index in unmatched_tracks:
+            self.tracks[track_index].missed += 1
+        self.tracks = [track for track in self.tracks if track.missed <= self.max_missed]
+
+        for location_index, location in enumerate(face_locations):
+            track = matched_tracks[location_index]
+            if track is None:
+                track = Track(next(self._track_ids), location)
+                self.tracks.append(track)
+                matched_tracks[location_index] = track
+            track.location = location
+            track.missed = 0
+            track.frames_since_encoding += 1
+        return matched_tracks
+
+    def needs_encoding(self, track):
+        if track.name is None:
+            return True
+        reencode_every = self.unknown_reencode_every if track.employee_id is None else self.reencode_every
+        return track.frames_since_encoding >= reencode_every
+
+    def select_for_encoding(self, tracks):
+        """Indexes of the tracks that need an encoding on this frame"""
+        selected = [index for index, track in enumerate(tracks) if self.needs_encoding(track)]
+        self.encodings_requested += len(selected)
+        self.encodings_skipped += len(tracks) - len(selected)
+        return selected
+
+    def set_identity(self, track, employee_id, name):
+        track.employee_id = employee_id
+        track.name = name
+        track.frames_since_encoding = 0
+
+    def get_stats(self):
+        return {
+            "tracks": len(self.tracks),
+            "encodings": self.encodings_requested,
+            "encodings_skipped": self.encodings_skipped
+        }
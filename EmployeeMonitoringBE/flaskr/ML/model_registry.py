@@ -0,0 +1,162 @@
+import os
+import time
+from threading import Lock
+import numpy as np
+
+# dlib's HOG and CNN face detectors, landmark predictor and face encoder, face_recognition loads them together
+FACE_MODELS = "face_models"
+PPE_DETECTOR = "ppe_detector"
+MODELS = (FACE_MODELS, PPE_DETECTOR)
+
+# Size of the blank images the models are warmed up with
+WARM_UP_SIZE = 160
+
+
+def get_memory_usage():
+    """
+    (resident, shared) bytes of the current process, None's when /proc is not available.
+    Shared counts the pages a forked worker still shares with the master
+    """
+    resident = shared = None
+    try:
+        with open("/proc/self/smaps_rollup") as smaps:
+            fields = {line.split(":")[0]: int(line.split()[1]) * 1024 for line in smaps if line.endswith("kB\n")}
+        resident = fields.get("Rss")
+        shared = fields.get("Shared_Clean", 0) + fields.get("Shared_Dirty", 0)
+    except (OSError, ValueError):
+        pass
+    return resident, shared
+
+
+def _load_face_models():
+    # face_recognition loads every dlib model (HOG and CNN detectors, landmarks, encoder) when it is imported
+    import face_recognition
+    return face_recognition
+
+def _dlib_uses_cuda():
+    # A CUDA context does not survive a fork, with CUDA every worker initializes dlib on its first frame
+    import dlib
+    return dlib.DLIB_USE_CUDA
+
+def _warm_up_face_models(face_recognition):
+    if _dlib_uses_cuda():
+        return
+    image = np.zeros((WARM_UP_SIZE, WARM_UP_SIZE, 3), dtype=np.uint8)
+    face_recognition.face_locations(image, model="cnn")
+    face_recognition.face_encodings(image, [(0, WARM_UP_SIZE, WARM_UP_SIZE, 0)])
+
+def _load_ppe_detector():
+    from ultralytics import YOLO
+    from flaskr.ML.ppe_recognition.ppe_recognition_impl import MODEL_PATH
+    return YOLO(os.getenv("PPE_MODEL_PATH", MODEL_PATH), task="detect")
+
+def _warm_up_ppe_detector(model):
+    image_size = int(os.getenv("PPE_IMAGE_SIZE", 640))
+    # The first predict builds the predictor and allocates the inference buffers
+    model.predict([np.zeros((image_size, image_size, 3), dtype=np.uint8)], imgsz=image_size, device="cpu", verbose=False)
+
+# name: (load, warm up)
+LOADERS = {
+    FACE_MODELS: (_load_face_models, _warm_up_face_models),
+    PPE_DETECTOR: (_load_ppe_detector, _warm_up_ppe_detector),
+}
+
+
+class ModelRegistry:
+    """
+    Loads every model of the process once and keeps it with its load time and memory.
+
+    Under gunicorn (see gunicorn.conf.py) the app is preloaded in the master, which loads
+    and warms the configured models before forking the workers. The workers inherit the
+    weights and share their pages with the master copy-on-write instead of loading their own.
+    Models only run inference in the workers, the master never starts threads that a fork
+    would lose. A model that was not preloaded is loaded on first use in the worker.
+    The face encoding pool forks its processes from a worker holding the preloaded face models
+    (see FaceEncodingService), so they share the same pages.
+
+    The memory of a model is the growth of the resident memory while it loaded and warmed up.
+    """
+
+    def __init__(self):
+        self.lock = Lock()
+        self.models = {}  # name: model
+        self.errors = {}  # name: exception of the failed load
+        self.stats = {}  # name: load time and memory
+        self.loaded_in = {}  # name: pid of the process that loaded the model
+
+    def get(self, name):
+        """The model, loaded and warmed up on first use. Raises the load error, a failed load is not retried"""
+        with self.lock:
+            if name in self.errors:
+                raise RuntimeError(f"Model {name} is not available: {self.errors[name]}")
+            if name not in self.models:
+                self._load(name)
+            return self.models[name]
+
+    def is_loaded(self, name):
+        with self.lock:
+            return name in self.models
+
+    def load_all(self, names=MODELS):
+        """Loads and warms up the models, a model that fails is reported and skipped"""
+        for name in names:
+            try:
+                self.get(name)
+            except Exception as e:
+                print(f"Could not load model {name}: {e}")
+
+    def get_stats(self):
+        resident, shared = get_memory_usage()
+        with self.lock:
+            return {
+                "pid": os.getpid(),
+                "resident_mb": round(resident / 2 ** 20, 1) if resident is not None else None,
+                "shared_mb": round(shared / 2 ** 20, 1) if shared is not None else None,
+                "models": {name: {**stats, "preloaded": self.loaded_in[name] != os.getpid()}
+                           for name, stats in self.stats.items()},
+                "errors": {name: str(error) for name, error in self.errors.items()}
+            }
+
+    def _load(self, name):
+        load, warm_up = LOADERS[name]
+        resident_before, _ = get_memory_usage()
+        try:
+            started = time.monotonic()
+            model = load()
+            loaded = time.monotonic()
+            warm_up(model)
+            warmed_up = time.monotonic()
+        except Exception as e:
+            self.errors[name] = e
+            raise
+        resident_after, _ = get_memory_usage()
+
+        self.models[name] = model
+        self.loaded_in[name] = os.getpid()
+        self.stats[name] = {
+            "load_seconds": round(loaded - started, 3),
+            "warm_up_seconds": round(warmed_up - loaded, 3),
+            "resident_mb": round((resident_after - resident_before) / 2 ** 20, 1)
+            if resident_before is not None and resident_after is not None else None
+        }
+        print(f"Model {name} loaded in {loaded - started:.2f}s, warmed up in {warmed_up - loaded:.2f}s")
+
+
+model_registry = None
+model_registry_lock = Lock()
+def get_model_registry():
+    global model_registry
+    with model_registry_lock:
+        if model_registry == None:
+            model_registry = ModelRegistry()
+    return model_registry
+
+def get_configured_models():
+    """Models loaded at startup, MODEL_PRELOAD is a comma separated list of names (all by default)"""
+    names = os.getenv("MODEL_PRELOAD")
+    if names is None:
+        return MODELS
+    return tuple(name.strip() for name in names.split(",") if name.strip() in LOADERS)
+
+def warm_up_models():
+    get_model_registry().load_all(get_configured_models())
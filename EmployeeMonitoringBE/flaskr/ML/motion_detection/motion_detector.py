@@ -0,0 +1,66 @@
+import time
+import cv2 as cv
+import numpy as np
+
+# Width the frames are downscaled to before differencing
+MOTION_WIDTH = 160
+
+
+class MotionDetector:
+    """
+    Decides if a frame is worth a full analysis pass.
+
+    Frames are downscaled and blurred, then compared with the previous checked
+    frame. When the camera has zones only the pixels inside them are compared.
+    A full pass is still forced every keep_alive seconds so people standing
+    still are seen again now and then.
+    """
+
+    def __init__(self, keep_alive=10.0, pixel_threshold=25, min_changed_ratio=0.002):
+        self.keep_alive = keep_alive
+        self.pixel_threshold = pixel_threshold
+        self.min_changed_ratio = min_changed_ratio
+
+        self.camera_zones = None  # CameraZones of the camera
+        self._previous = None
+        self._last_forced = 0
+
+        self.frames_with_motion = 0
+        self.frames_without_motion = 0
+        self.keep_alive_passes = 0
+
+    def set_zones(self, camera_zones):
+        self.camera_zones = camera_zones
+
+    def should_analyze(self, frame):
+        height = max(int(frame.shape[0] * MOTION_WIDTH / frame.shape[1]), 1)
+        small_frame = cv.resize(frame, (MOTION_WIDTH, height), interpolation=cv.INTER_AREA)
+        small_frame = cv.GaussianBlur(cv.cvtColor(small_frame, cv.COLOR_BGR2GRAY), (5, 5), 0)
+        previous, self._previous = self._previous, small_frame
+
+        now = time.monotonic()
+        if previous is None or now - self._last_forced >= self.keep_alive:
+            self._last_forced = now
+            self.keep_alive_passes += 1
+            return True
+
+        changed = cv.absdiff(small_frame, previous) > self.pixel_threshold
+        zones = self.camera_zones.prepare(MOTION_WIDTH, height) if self.camera_zones is not None else None
+        if zones is not None and zones.area > 0:
+            changed &= zones.union
+            area = zones.area
+        else:
+            area = changed.size
+
+        if np.count_nonzero(changed) >= area * self.min_changed_ratio:
+            self.frames_with_motion += 1
+            return True
+        self.frames_without_motion += 1
+        return False
+
+    def get_stats(self):
+        return {
+            "motion": self.frames_with_motion,
+            "no_motion": self.frames_without_motion,
+            "keep_alive": self.keep_alive_passes
+        }
@@ -0,0 +1,58 @@
+import cv2 as cv
+
+# Part of a person box, from its top, where their face is looked for
+FACE_REGION_HEIGHT = 0.5
+# Space added on each side of the face region, relative to the person box width
+FACE_REGION_MARGIN = 0.1
+
+
+def _merge_regions(regions):
+    """Replaces overlapping (top, right, bottom, left) regions by their bounding box until none overlap"""
+    regions = list(regions)
+    merged = True
+    while merged:
+        merged = False
+        for i in range(len(regions)):
+            for j in range(i + 1, len(regions)):
+                a, b = regions[i], regions[j]
+                if a[0] < b[2] and b[0] < a[2] and a[3] < b[1] and b[3] < a[1]:
+                    regions[i] = (min(a[0], b[0]), max(a[1], b[1]), max(a[2], b[2]), min(a[3], b[3]))
+                    del regions[j]
+                    merged = True
+                    break
+            if merged:
+                break
+    return regions
+
+def get_face_regions(persons, size, scale=1, roi=None):
+    """
+    Regions (top, right, bottom, left) of a frame downscaled scale times to size (width, height)
+    where the faces of the persons can be: the upper part of every person box, the PPE found
+    outside of a person grown by its own size. Regions are clipped to roi and do not overlap
+    """
+    width, height = size
+    top_limit, right_limit, bottom_limit, left_limit = roi if roi is not None else (0, width, height, 0)
+    regions = []
+    for person in persons:
+        x1, y1, x2, y2 = person.box
+        if person.is_person:
+            margin = (x2 - x1) * FACE_REGION_MARGIN
+            top, right, bottom, left = y1, x2 + margin, y1 + (y2 - y1) * FACE_REGION_HEIGHT, x1 - margin
+        else:
+            box_width, box_height = x2 - x1, y2 - y1
+            top, right, bottom, left = y1 - box_height, x2 + box_width, y2 + box_height, x1 - box_width
+        region = (max(int(top // scale), top_limit), min(int(right // scale) + 1, right_limit),
+                  min(int(bottom // scale) + 1, bottom_limit), max(int(left // scale), left_limit))
+        if region[0] < region[2] and region[3] < region[1]:
+            regions.append(region)
+    return _merge_regions(regions)
+
+def draw_persons(frame, persons):
+    """Draws the person boxes over the frame in place, with the name of the recognized employees"""
+    for person in persons:
+        if not person.is_person:
+            continue
+        x1, y1, x2, y2 = person.box
+        cv.rectangle(frame, (x1, y1), (x2, y2), (255, 128, 0), 2)
+        if person.name:
+            cv.putText(frame, person.name, (x1 + 4, y2 - 8), cv.FONT_HERSHEY_DUPLEX, 0.6, (255, 128, 0), 1)
@@ -0,0 +1,103 @@
+import os
+import cv2 as cv
+
+MODEL_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "PPE_model", "my_model.pt")
+
+HELMET = "helmet"
+MASK = "mask"
+VEST = "vest"
+PPE_KINDS = (HELMET, MASK, VEST)
+
+# Class of the trained model: (PPE kind, worn)
+PPE_CLASSES = {
+    "Hardhat": (HELMET, True),
+    "NO-Hardhat": (HELMET, False),
+    "Mask": (MASK, True),
+    "NO-Mask": (MASK, False),
+    "Safety Vest": (VEST, True),
+    "NO-Safety Vest": (VEST, False),
+}
+PERSON_CLASS = "Person"
+
+
+class PersonPPE:
+    """
+    A detected person and the PPE found on them, box is (x1, y1, x2, y2) in frame coordinates.
+    is_person is False for PPE found outside of every person box, box is then the PPE's
+    """
+
+    def __init__(self, box, is_person=True):
+        self.box = box
+        self.is_person = is_person
+        self.ppe = {}  # PPE kind: (worn, confidence)
+        self.employee_id = None
+        self.name = None
+
+    def add(self, kind, worn, confidence):
+        # A worn and a missing detection of the same PPE on one person: the surest one wins
+        if kind not in self.ppe or self.ppe[kind][1] < confidence:
+            self.ppe[kind] = (worn, confidence)
+
+    def missing(self):
+        return [kind for kind, (worn, _) in self.ppe.items() if not worn]
+
+    def worn(self, kind):
+        """True, False or None when the PPE was not seen either way"""
+        return self.ppe[kind][0] if kind in self.ppe else None
+
+
+def parse_result(result, names):
+    """(class name, (x1, y1, x2, y2), confidence) of every box of an ultralytics result"""
+    boxes = result.boxes
+    coordinates = boxes.xyxy.cpu().numpy().astype(int)
+    classes = boxes.cls.cpu().numpy().astype(int)
+    confidences = boxes.conf.cpu().numpy()
+    return [(names[int(class_id)], tuple(int(value) for value in box), float(confidence))
+            for box, class_id, confidence in zip(coordinates, classes, confidences)]
+
+def _contains(box, x, y):
+    return box[0] <= x <= box[2] and box[1] <= y <= box[3]
+
+def _area(box):
+    return (box[2] - box[0]) * (box[3] - box[1])
+
+def group_by_person(detections):
+    """
+    Assigns every PPE box to the smallest person box containing its center.
+    PPE boxes outside of every person (or a model without a person class)
+    become a person of their own, so a missing PPE is still reported
+    """
+    persons = [PersonPPE(box) for label, box, _ in detections if label == PERSON_CLASS]
+    for label, box, confidence in detections:
+        if label not in PPE_CLASSES:
+            continue
+        kind, worn = PPE_CLASSES[label]
+        x, y = (box[0] + box[2]) // 2, (box[1] + box[3]) // 2
+        owners = [person for person in persons if _contains(person.box, x, y)]
+        if owners:
+            owner = min(owners, key=lambda person: _area(person.box))
+        else:
+            owner = PersonPPE(box, is_person=False)
+            persons.append(owner)
+        owner.add(kind, worn, confidence)
+    return persons
+
+def assign_faces(persons, faces):
+    """Gives every person the identity of the recognized face whose center is inside their box"""
+    for (top, right, bottom, left), employee_id, name in faces or []:
+        x, y = (left + right) // 2, (top + bottom) // 2
+        owners = [person for person in persons if _contains(person.box, x, y)]
+        if owners:
+            owner = min(owners, key=lambda person: _area(person.box))
+            owner.employee_id, owner.name = employee_id, name
+
+def draw_ppe(frame, persons):
+    """Draws the persons over the frame in place, red when some PPE is missing"""
+    for person in persons:
+        x1, y1, x2, y2 = person.box
+        missing = person.missing()
+        color = (0, 0, 255) if missing else (0, 200, 0)
+        cv.rectangle(frame, (x1, y1), (x2, y2), color, 2)
+        label = "No " + ", ".join(missing) if missing else ", ".join(kind for kind in PPE_KINDS if person.worn(kind))
+        if label:
+            cv.putText(frame, label, (x1 + 4, max(y1 - 8, 12)), cv.FONT_HERSHEY_DUPLEX, 0.6, color, 1)
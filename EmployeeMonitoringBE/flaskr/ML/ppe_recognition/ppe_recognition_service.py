@@ -0,0 +1,112 @@
+import os
+import queue
+import time
+from concurrent.futures import Future
+from threading import Lock, Thread
+from flaskr.ML.model_registry import PPE_DETECTOR, get_model_registry
+from flaskr.ML.ppe_recognition.ppe_recognition_impl import parse_result
+
+# Exponential moving average weight of the newest batch latency
+LATENCY_SMOOTHING = 0.2
+
+
+class PPERecognitionService:
+    """
+    Runs the YOLO PPE model for every camera of the process.
+
+    The model comes loaded and warmed up from the ModelRegistry, so the first
+    camera does not pay for the lazy initialization of the model. Camera threads
+    submit frames and get a Future back. A single inference thread owns the model,
+    groups the frames the cameras submitted meanwhile into one batch of up to
+    batch_size images and runs them in one CPU forward pass.
+    """
+
+    def __init__(self, model, batch_size=8, batch_timeout=0.01, image_size=640, confidence=0.4):
+        self.model = model
+        self.names = model.names
+        self.batch_size = batch_size
+        self.batch_timeout = batch_timeout
+        self.image_size = image_size
+        self.confidence = confidence
+
+        self._requests = queue.Queue()
+        self.lock = Lock()
+        self.batches = 0
+        self.frames = 0
+        self.batch_latency = None  # Smoothed seconds per batch
+        self.last_batch_latency = None
+        self.max_batch_latency = 0
+
+        Thread(target=self._dispatch, daemon=True).start()
+
+    def detect(self, frame) -> Future:
+        """Future of the (class name, (x1, y1, x2, y2), confidence) detections of a BGR frame"""
+        future = Future()
+        self._requests.put((frame, future))
+        return future
+
+    def get_stats(self):
+        with self.lock:
+            return {
+                "queued_frames": self._requests.qsize(),
+                "batches": self.batches,
+                "frames": self.frames,
+                "average_batch_size": self.frames / self.batches if self.batches else 0,
+                "batch_latency_ms": round(self.batch_latency * 1000, 1) if self.batch_latency is not None else None,
+                "last_batch_latency_ms": round(self.last_batch_latency * 1000, 1)
+                if self.last_batch_latency is not None else None,
+                "max_batch_latency_ms": round(self.max_batch_latency * 1000, 1)
+            }
+
+    def _predict(self, frames):
+        return self.model.predict(frames, imgsz=self.image_size, conf=self.confidence, device="cpu", verbose=False)
+
+    def _dispatch(self):
+        while True:
+            requests = [self._requests.get()]
+            deadline = time.monotonic() + self.batch_timeout
+            while len(requests) < self.batch_size:
+                try:
+                    requests.append(self._requests.get(timeout=max(deadline - time.monotonic(), 0)))
+                except queue.Empty:
+                    break
+
+            started = time.monotonic()
+            try:
+                results = self._predict([frame for frame, _ in requests])
+                detections = [parse_result(result, self.names) for result in results]
+            except Exception as e:
+                for _, future in requests:
+                    future.set_exception(e)
+                continue
+            latency = time.monotonic() - started
+
+            with self.lock:
+                self.batches += 1
+                self.frames += len(requests)
+                self.last_batch_latency = latency
+                self.max_batch_latency = max(self.max_batch_latency, latency)
+                self.batch_latency = latency if self.batch_latency is None else \
+                    LATENCY_SMOOTHING * latency + (1 - LATENCY_SMOOTHING) * self.batch_latency
+            for (_, future), frame_detections in zip(requests, detections):
+                future.set_result(frame_detections)
+
+
+ppe_recognition_service = None
+ppe_recognition_service_lock = Lock()
+def get_ppe_recognition_service():
+    """
+    The service of the process, started in the worker that uses it since its thread would not survive a fork.
+    Raises when the model is not available, a model that failed to load is not retried until the process restarts
+    """
+    global ppe_recognition_service
+    with ppe_recognition_service_lock:
+        if ppe_recognition_service == None:
+            ppe_recognition_service = PPERecognitionService(
+                get_model_registry().get(PPE_DETECTOR),
+                batch_size=int(os.getenv("PPE_BATCH_SIZE", 8)),
+                batch_timeout=float(os.getenv("PPE_BATCH_TIMEOUT", 0.01)),
+                image_size=int(os.getenv("PPE_IMAGE_SIZE", 640)),
+                confidence=float(os.getenv("PPE_CONFIDENCE", 0.4))
+            )
+    return ppe_recognition_service
@@ -17,6 +17,7 @@ def create_app(test_config=None):
         USERS_DATABASE_URL = os.getenv("USERS_DATABASE_URL"),
         PROFILE_PICTURES_PATH = os.path.join(app.root_path, 'static\\profile_pictures'),
         MASK_ZONES_PATH = os.path.join(app.root_path, 'static\\mask_zones'),
+        SCREENSHOTS_PATH = os.path.join(app.root_path, 'static', 'screenshots'),
         ALLOWED_EXTENSIONS = ['png', 'jpg', 'jpeg']
     )
 
@@ -26,6 +27,19 @@ def create_app(test_config=None):
     from flaskr.routes import register_blueprints
     register_blueprints(app)
 
+    from flaskr.cli import register_commands
+    register_commands(app)
+
+    # The models are loaded and warmed up at startup instead of by the first viewer of a camera.
+    # gunicorn.conf.py loads them before forking the workers (sync), the development server off the startup path
+    model_warm_up = os.getenv("MODEL_WARM_UP", "background").lower()
+    from flaskr.ML.model_registry import warm_up_models
+    if model_warm_up == "sync":
+        warm_up_models()
+    elif model_warm_up == "background":
+        from threading import Thread
+        Thread(target=warm_up_models, daemon=True).start()
+
     # from flaskr.init_auth_db import init_auth_db
     # with app.app_context():
     #     init_auth_db(app)
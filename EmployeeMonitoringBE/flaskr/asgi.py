@@ -0,0 +1,168 @@
+"""
+ASGI entry point: camera and alert streams are served by an asyncio handler, every other request by the Flask app.
+
+Each MJPEG viewer is a coroutine waiting on the camera's FrameHub through an AsyncFrameFeed instead
+of a WSGI thread sleeping in wait_for_frame, so one event loop serves thousands of viewers.
+The stream shares the token check, the camera pipelines and their frame hubs with the Flask app,
+which runs in the same process. Frames are encoded by the first viewer that pulls them, on a thread
+pool so the event loop never runs an encoding, the viewers of the same variant then share the bytes.
+Alert consoles wait on their tenant's AlertHub through an AsyncFeed the same way.
+
+Run with: WORKER_CLASS=uvicorn.workers.UvicornWorker gunicorn -c gunicorn.conf.py flaskr.asgi:application
+or a single process: uvicorn flaskr.asgi:application --host 0.0.0.0 --port 5000
+"""
+import asyncio
+import json
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl
+from a2wsgi import WSGIMiddleware
+from flaskr import create_app
+from flaskr.routes import AlertRouter
+from flaskr.routes.VideoCameraRouter import (STREAM_MIMETYPE, STREAM_HEADERS, format_stream_part,
+                                             open_camera_stream, close_camera_stream)
+from flaskr.services.AsyncFeed import AsyncFrameFeed, get_feed, release_feed
+
+STREAM_PATH = re.compile(r"^/video-cameras/([^/]+)/stream/?$")
+ALERT_STREAM_PATH = re.compile(r"^/alerts/stream/?$")
+# Seconds a viewer waits for a frame before checking that the camera still runs
+STREAM_IDLE_TIMEOUT = 1
+
+flask_app = create_app()
+# Threads of the Flask requests
+wsgi_app = WSGIMiddleware(flask_app, workers=int(os.getenv("ASGI_WSGI_THREADS", 64)))
+# Threads encoding the frames pulled by the async viewers, and opening the streams (database queries)
+stream_executor = ThreadPoolExecutor(int(os.getenv("ASGI_STREAM_THREADS", os.cpu_count() or 4)),
+                                     thread_name_prefix="stream")
+
+
+async def application(scope, receive, send):
+    if scope["type"] == "lifespan":
+        await _lifespan(receive, send)
+        return
+    if scope["type"] == "http" and scope["method"] == "GET":
+        match = STREAM_PATH.match(scope["path"])
+        if match:
+            await stream_camera(scope, receive, send, match.group(1))
+            return
+        if ALERT_STREAM_PATH.match(scope["path"]):
+            await stream_alerts(scope, receive, send)
+            return
+    await wsgi_app(scope, receive, send)
+
+
+async def stream_camera(scope, receive, send, camera_name):
+    loop = asyncio.get_running_loop()
+    args = dict(parse_qsl(scope["query_string"].decode("latin-1")))
+    res, code = await loop.run_in_executor(stream_executor, _in_app_context, open_camera_stream, camera_name, args)
+    if code != 200:
+        await _send_json(send, code, res)
+        return
+    pipeline, subscription, camera_key = res
+
+    feed = get_feed(pipeline.hub, AsyncFrameFeed)
+    try:
+        await _send_until_disconnect(receive, send, _send_frames(send, pipeline, subscription, feed))
+    finally:
+        release_feed(feed)
+        close_camera_stream(pipeline, subscription, camera_key)
+
+
+async def stream_alerts(scope, receive, send):
+    """The alert Server-Sent Events of AlertRouter.stream_alerts, see there"""
+    loop = asyncio.get_running_loop()
+    args = dict(parse_qsl(scope["query_string"].decode("latin-1")))
+    last_event_id = dict(scope["headers"]).get(b"last-event-id", b"").decode("latin-1")
+    res, code = await loop.run_in_executor(stream_executor, _in_app_context, AlertRouter.open_alert_stream,
+                                           args, last_event_id)
+    if code != 200:
+        await _send_json(send, code, res)
+        return
+    hub, sequence, first_messages = res
+
+    hub.connect()
+    feed = get_feed(hub)
+    try:
+        await _send_until_disconnect(receive, send, _send_events(send, hub, sequence, first_messages, feed))
+    finally:
+        release_feed(feed)
+        hub.disconnect()
+
+
+def _in_app_context(function, *args):
+    with flask_app.app_context():
+        return function(*args)
+
+
+async def _send_until_disconnect(receive, send, sending):
+    """Runs the coroutine sending the response until it is done or the client disconnects"""
+    sending = asyncio.create_task(sending)
+    disconnect = asyncio.create_task(_wait_for_disconnect(receive))
+    try:
+        done, _ = await asyncio.wait({sending, disconnect}, return_when=asyncio.FIRST_COMPLETED)
+        if sending in done:
+            sending.result()
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+    finally:
+        sending.cancel()
+        disconnect.cancel()
+
+
+async def _send_frames(send, pipeline, subscription, feed):
+    await _send_start(send, STREAM_MIMETYPE, {"Cache-Control": "no-cache", **STREAM_HEADERS})
+    sequence = 0
+    while pipeline.running:
+        if not await feed.wait(sequence, STREAM_IDLE_TIMEOUT):
+            continue
+        sequence, frame = await feed.get_frame(subscription, sequence, stream_executor)
+        if frame is None:
+            continue
+        # Waits while the client's socket is full, a slow viewer skips frames instead of queueing them
+        await send({"type": "http.response.body", "body": format_stream_part(frame), "more_body": True})
+
+
+async def _send_events(send, hub, sequence, first_messages, feed):
+    await _send_start(send, AlertRouter.STREAM_MIMETYPE, AlertRouter.STREAM_HEADERS)
+    await send({"type": "http.response.body", "body": AlertRouter.RETRY_MESSAGE + b"".join(first_messages),
+                "more_body": True})
+    while True:
+        if await feed.wait(sequence, AlertRouter.STREAM_HEARTBEAT):
+            sequence, messages = hub.get_events(sequence)
+        elif hub.closed:
+            return
+        else:
+            messages = [AlertRouter.KEEP_ALIVE_MESSAGE]
+        if messages is None:
+            return
+        await send({"type": "http.response.body", "body": b"".join(messages), "more_body": True})
+
+
+async def _send_start(send, mimetype, headers):
+    await send({
+        "type": "http.response.start",
+        "status": 200,
+        "headers": [(b"content-type", mimetype.encode())]
+                   + [(name.lower().encode(), value.encode()) for name, value in headers.items()]
+    })
+
+
+async def _wait_for_disconnect(receive):
+    while (await receive())["type"] != "http.disconnect":
+        pass
+
+
+async def _send_json(send, status, body):
+    await send({"type": "http.response.start", "status": status,
+                "headers": [(b"content-type", b"application/json")]})
+    await send({"type": "http.response.body", "body": json.dumps(body).encode()})
+
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await send({"type": "lifespan.shutdown.complete"})
+            return
@@ -0,0 +1,40 @@
+import click
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from flaskr.db import engine_registry, get_tenant_session, setup_tenant_db
+from flaskr.entities.auth_db.Tenant import Tenant
+from flaskr.migrations import upgrade_tenant_db
+from flaskr.services import DetectionRollups
+
+
+@click.command("backfill-rollups")
+@click.argument("tenant_id")
+def backfill_rollups(tenant_id):
+    """Rebuilds the detection rollups of a tenant from its stored presence intervals"""
+    if tenant_id not in engine_registry:
+        setup_tenant_db(tenant_id)
+    session = get_tenant_session(tenant_id)
+    try:
+        count = DetectionRollups.backfill(session)
+    finally:
+        session.close()
+    click.echo(f"Rolled up {count} presence intervals of tenant {tenant_id}")
+
+
+@click.command("upgrade-tenant-dbs")
+@click.argument("tenant_ids", nargs=-1)
+def upgrade_tenant_dbs(tenant_ids):
+    """Adds the columns and indexes new entity fields need to existing tenant databases (all tenants by default)"""
+    if not tenant_ids:
+        with Session(bind=engine_registry["users"]) as session:
+            tenant_ids = [str(tenant_id) for tenant_id in session.scalars(select(Tenant.id))]
+    for tenant_id in tenant_ids:
+        if tenant_id not in engine_registry:
+            setup_tenant_db(tenant_id)
+        changes = upgrade_tenant_db(engine_registry[tenant_id])
+        click.echo(f"Tenant {tenant_id}: {', '.join(changes) if changes else 'up to date'}")
+
+
+def register_commands(app):
+    app.cli.add_command(backfill_rollups)
+    app.cli.add_command(upgrade_tenant_dbs)
@@ -85,6 +85,13 @@ def get_tenant_db() -> RoutingSession:
 
     return g.tenant_db_session
 
+def get_tenant_session(tenant_id) -> Session:
+    """
+    Open a session on a tenant database outside of a request (camera threads).
+    The tenant database must have been set up by a request before. The caller closes the session.
+    """
+    return Session(bind=engine_registry[tenant_id], autoflush=False)
+
 def close_session(e=None):
     """Close database session at end of request"""
     session = g.pop('db_session', None)
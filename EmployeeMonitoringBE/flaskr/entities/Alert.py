@@ -2,7 +2,8 @@ from flaskr.entities.BaseEntity import Entity, mapped_column, Mapped
 from enum import Enum
 from datetime import datetime
 from sqlalchemy import DateTime
-from sqlalchemy import ForeignKey
+from sqlalchemy import ForeignKey, Index
+from typing import Optional
 
 class AlertType(Enum):
     PERSON_DETECTED = "person_detected"
@@ -23,19 +24,29 @@ class AlertStatus(Enum):
 
 class Alert(Entity):
     __tablename__ = "alerts"
+    # Keyset pagination orders by (timestamp, id), the filters the list endpoint accepts lead the indexes
+    __table_args__ = (
+        Index("ix_alerts_timestamp_id", "timestamp", "id"),
+        Index("ix_alerts_status_timestamp_id", "status", "timestamp", "id"),
+        Index("ix_alerts_zone_timestamp_id", "zone_id", "timestamp", "id"),
+        Index("ix_alerts_employee_timestamp_id", "employee_id", "timestamp", "id"),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True)
     type: Mapped[AlertType] = mapped_column()
     level: Mapped[AlertLevel] = mapped_column()
     timestamp: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=datetime.now)
 
-    screenshot: Mapped[str] = mapped_column()
-    status: Mapped[AlertStatus] = mapped_column()
-    explanation: Mapped[str] = mapped_column()
-    resolved_at: Mapped[datetime] = mapped_column(DateTime(timezone=True))
+    screenshot: Mapped[Optional[str]] = mapped_column()
+    status: Mapped[AlertStatus] = mapped_column(default=AlertStatus.ACTIVE)
+    explanation: Mapped[Optional[str]] = mapped_column()
+    resolved_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True))
 
-    employee_id: Mapped[int] = mapped_column(ForeignKey("employees.id"))
-    zone_id: Mapped[int] = mapped_column(ForeignKey("zones.id"))
+    # Unknown persons and alerts outside of a zone have no employee/zone
+    employee_id: Mapped[Optional[int]] = mapped_column(ForeignKey("employees.id"))
+    zone_id: Mapped[Optional[int]] = mapped_column(ForeignKey("zones.id"))
 
     def to_dict(self):
-         return {column.name: getattr(self, column.name) for column in self.__table__.columns}
\ No newline at end of file
+         data = {column.name: getattr(self, column.name) for column in self.__table__.columns}
+         # Enums by value so the dict can be serialized to JSON
+         return {key: value.value if isinstance(value, Enum) else value for key, value in data.items()}
\ No newline at end of file
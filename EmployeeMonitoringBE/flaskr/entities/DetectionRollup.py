@@ -0,0 +1,34 @@
+from flaskr.entities.BaseEntity import Entity, mapped_column, Mapped
+from enum import Enum
+from datetime import datetime
+from sqlalchemy import DateTime, ForeignKey, UniqueConstraint
+
+class RollupGranularity(Enum):
+    MINUTE = "minute"
+    HOUR = "hour"
+    DAY = "day"
+
+class DetectionRollup(Entity):
+    """Presence intervals of one camera and zone aggregated over a minute, hour or day"""
+    __tablename__ = "detection_rollups"
+    __table_args__ = (
+        UniqueConstraint("granularity", "bucket_start", "video_camera_id", "zone_id",
+                         name="uq_detection_rollups_bucket"),
+    )
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    granularity: Mapped[RollupGranularity] = mapped_column()
+    bucket_start: Mapped[datetime] = mapped_column(DateTime)
+
+    video_camera_id: Mapped[int] = mapped_column(ForeignKey("video_cameras.id"))
+    # 0 outside of the camera's zones. Not a foreign key so the history outlives deleted zones
+    zone_id: Mapped[int] = mapped_column(default=0)
+
+    # Intervals that started in the bucket and the frames they cover
+    detections: Mapped[int] = mapped_column(default=0)
+    frames: Mapped[int] = mapped_column(default=0)
+    # Seconds of the intervals that fall inside the bucket
+    presence_seconds: Mapped[float] = mapped_column(default=0)
+
+    def to_dict(self):
+        return {column.name: getattr(self, column.name) for column in self.__table__.columns}
@@ -6,4 +6,10 @@ class PPERecognition(Entity):
 
     id: Mapped[int] = mapped_column(primary_key=True)
     person_detected_id: Mapped[int] = mapped_column(ForeignKey("persons_detected.id"))
-    ppe_id: Mapped[int] = mapped_column(ForeignKey("ppes.id"))
\ No newline at end of file
+    ppe_id: Mapped[int] = mapped_column(ForeignKey("ppes.id"))
+    # Analyzed frames of the presence interval where the PPE was seen worn / missing
+    worn_frames: Mapped[int] = mapped_column(default=0, server_default="0")
+    missing_frames: Mapped[int] = mapped_column(default=0, server_default="0")
+
+    def to_dict(self):
+        return {column.name: getattr(self, column.name) for column in self.__table__.columns}
@@ -1,18 +1,31 @@
 from flaskr.entities.BaseEntity import Entity, mapped_column, Mapped
 from datetime import datetime
 from sqlalchemy import DateTime
-from sqlalchemy import ForeignKey
+from sqlalchemy import ForeignKey, Index
 from sqlalchemy.orm import relationship
-from typing import List
+from typing import List, Optional
 
 class PersonDetected(Entity):
     __tablename__ = "persons_detected"
+    # Keyset pagination orders by (detected_at, id), the filters the list endpoint accepts lead the indexes
+    __table_args__ = (
+        Index("ix_persons_detected_detected_at_id", "detected_at", "id"),
+        Index("ix_persons_detected_camera_detected_at_id", "video_camera_id", "detected_at", "id"),
+        Index("ix_persons_detected_employee_detected_at_id", "employee_id", "detected_at", "id"),
+        Index("ix_persons_detected_zone_detected_at_id", "zone_id", "detected_at", "id"),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True)
+    # One row is one presence interval: continuous sightings of the employee by the camera
     detected_at: Mapped[datetime] = mapped_column(DateTime)
+    # Rows stored before intervals were single sightings, flask upgrade-tenant-dbs sets their ended_at to detected_at
+    ended_at: Mapped[datetime] = mapped_column(DateTime)
+    frame_count: Mapped[int] = mapped_column(default=1, server_default="1")
 
     employee_id: Mapped[int] = mapped_column(ForeignKey("employees.id"))
     video_camera_id: Mapped[int] = mapped_column(ForeignKey("video_cameras.id"))
+    # Zone the employee stood in, None outside of the camera's zones
+    zone_id: Mapped[Optional[int]] = mapped_column(ForeignKey("zones.id", ondelete="SET NULL"))
     
     ppe_recognitions: Mapped[List["PPERecognition"]] = relationship()
 
@@ -23,5 +23,17 @@ class VideoCamera(Entity):
 
     status: Mapped[CameraStatus] = mapped_column()
 
+    class FaceDetectionMode(Enum):
+        CNN = "cnn"
+        HOG = "hog"
+        # HOG finds candidates, the CNN confirms them
+        CASCADE = "cascade"
+
+    # The server defaults fill the rows of cameras created before the columns (flask upgrade-tenant-dbs)
+    face_detection_mode: Mapped[FaceDetectionMode] = mapped_column(default=FaceDetectionMode.CNN,
+                                                                   server_default=FaceDetectionMode.CNN.name)
+    # Weight of the camera when the analysis scheduler shares the CPU between cameras
+    priority: Mapped[float] = mapped_column(default=1.0, server_default="1.0")
+
     persons_detected: Mapped[List["PersonDetected"]] = relationship()
     zones: Mapped[List["Zone"]] = relationship()
\ No newline at end of file
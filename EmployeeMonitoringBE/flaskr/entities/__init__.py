@@ -6,4 +6,5 @@ from flaskr.entities.PPERecognition import PPERecognition
 from flaskr.entities.Alert import Alert
 from flaskr.entities.Zone import Zone
 from flaskr.entities.Blacklist import Blacklist
-from flaskr.entities.PersonDetected import PersonDetected
\ No newline at end of file
+from flaskr.entities.PersonDetected import PersonDetected
+from flaskr.entities.DetectionRollup import DetectionRollup
\ No newline at end of file
@@ -21,6 +21,8 @@ def init_auth_db(app):
 
     get_alerts_permission = Permission(name="GET_ALERTS")
     db.add(get_alerts_permission)
+    resolve_alert_permission = Permission(name="RESOLVE_ALERT")
+    db.add(resolve_alert_permission)
     create_blacklist_permission = Permission(name="CREATE_BLACKLIST")
     db.add(create_blacklist_permission)
     delete_blacklist_permission = Permission(name="DELETE_BLACKLIST")
@@ -49,6 +51,7 @@ def init_auth_db(app):
 
     db.flush()
     db.add(RolePermission(role_id=super_admin_role.id, permission_id=get_alerts_permission.id))
+    db.add(RolePermission(role_id=super_admin_role.id, permission_id=resolve_alert_permission.id))
     db.add(RolePermission(role_id=super_admin_role.id, permission_id=create_blacklist_permission.id))
     db.add(RolePermission(role_id=super_admin_role.id, permission_id=delete_blacklist_permission.id))
     db.add(RolePermission(role_id=super_admin_role.id, permission_id=create_employee_permission.id))
@@ -61,6 +64,7 @@ def init_auth_db(app):
     db.add(RolePermission(role_id=super_admin_role.id, permission_id=delete_zone_permission.id))
 
     db.add(RolePermission(role_id=admin_role.id, permission_id=get_alerts_permission.id))
+    db.add(RolePermission(role_id=admin_role.id, permission_id=resolve_alert_permission.id))
     db.add(RolePermission(role_id=admin_role.id, permission_id=create_blacklist_permission.id))
     db.add(RolePermission(role_id=admin_role.id, permission_id=delete_blacklist_permission.id))
     db.add(RolePermission(role_id=admin_role.id, permission_id=create_employee_permission.id))
@@ -72,6 +76,7 @@ def init_auth_db(app):
     db.add(RolePermission(role_id=admin_role.id, permission_id=create_video_camera_permission.id))
 
     db.add(RolePermission(role_id=security_guard_role.id, permission_id=get_alerts_permission.id))
+    db.add(RolePermission(role_id=security_guard_role.id, permission_id=resolve_alert_permission.id))
     db.add(RolePermission(role_id=security_guard_role.id, permission_id=get_persons_detected.id))
     db.add(RolePermission(role_id=security_guard_role.id, permission_id=read_video_stream.id))
 
@@ -32,4 +32,28 @@ def auth_required(f):
         g.tenant_id = logged_user.tenant_id
         
         return f(logged_user, *args, **kwargs)
-    return decorated
\ No newline at end of file
+    return decorated
+
+def validate_token(token):
+    """
+    Authenticates a token passed outside of the Authorization header,
+    e.g. as a query parameter by <img> and EventSource clients that cannot set headers
+    """
+    try:
+        data = jwt.decode(token, app.config["JWT_SECRET"], algorithms=["HS256"])
+        db = get_users_db()
+        logged_user = db.query(User).filter_by(id=data["user_id"]).first()
+        if logged_user == None:
+            print("Invalid token")
+            return {
+                "message": "Invalid token",
+            }, 401
+    except Exception as e:
+        print(e)
+        return {
+            "message": "Something went wrong",
+        }, 500
+
+    # Set the tenant database such that it will query that specific one
+    g.tenant_id = logged_user.tenant_id
+    return logged_user, 200
@@ -0,0 +1,75 @@
+from sqlalchemy import Column, MetaData, Table, inspect, text
+from flaskr.entities.BaseEntity import Entity
+
+# Values of the columns added to tables with existing rows that cannot come from a server default,
+# (table, column): statement run once after the column was added
+BACKFILLS = {
+    ("persons_detected", "ended_at"): "UPDATE persons_detected SET ended_at = detected_at WHERE ended_at IS NULL",
+}
+
+
+def upgrade_tenant_db(engine):
+    """
+    Brings an existing tenant database up to the entities. create_all only creates the missing tables,
+    this adds the columns and indexes that were added to existing tables and drops the NOT NULL of
+    columns that became optional (PostgreSQL, SQLite cannot alter a column). Returns the changes made
+    """
+    changes = []
+    with engine.begin() as connection:
+        inspector = inspect(connection)
+        existing_tables = set(inspector.get_table_names())
+        for table in Entity.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            existing_columns = {column["name"]: column for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing_columns:
+                    _add_column(connection, column)
+                    changes.append(f"added column {table.name}.{column.name}")
+                elif column.nullable and not existing_columns[column.name]["nullable"]:
+                    changes.append(_drop_not_null(connection, column))
+            existing_indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in existing_indexes:
+                    index.create(connection)
+                    changes.append(f"created index {index.name}")
+    return changes
+
+
+def _drop_not_null(connection, column):
+    dialect = connection.dialect
+    if dialect.name != "postgresql":
+        return f"{column.table.name}.{column.name} is still NOT NULL, {dialect.name} cannot alter it"
+    table_name = dialect.identifier_preparer.format_table(column.table)
+    column_name = dialect.identifier_preparer.format_column(column)
+    connection.execute(text(f"ALTER TABLE {table_name} ALTER COLUMN {column_name} DROP NOT NULL"))
+    return f"dropped NOT NULL of {column.table.name}.{column.name}"
+
+
+def _add_column(connection, column):
+    """
+    Adds an entity column to its existing table. A NOT NULL column needs a server default for the existing rows,
+    or a backfill: it is then added as nullable, filled, and made NOT NULL where the database can alter it
+    """
+    dialect = connection.dialect
+    backfill = BACKFILLS.get((column.table.name, column.name))
+    if not column.nullable and column.server_default is None and backfill is None:
+        raise ValueError(f"Column {column.table.name}.{column.name} is NOT NULL without a server default or backfill")
+    nullable = column.nullable or column.server_default is None
+    if hasattr(column.type, "create"):
+        # Types with their own schema object, e.g. PostgreSQL enums
+        column.type.create(connection, checkfirst=True)
+
+    # Compiled on a detached copy so the nullability can differ from the entity
+    server_default = column.server_default.arg if column.server_default is not None else None
+    copy = Column(column.name, column.type, nullable=nullable, server_default=server_default)
+    Table(column.table.name, MetaData(), copy)
+    specification = dialect.ddl_compiler(dialect, None).get_column_specification(copy)
+    table_name = dialect.identifier_preparer.format_table(column.table)
+    connection.execute(text(f"ALTER TABLE {table_name} ADD COLUMN {specification}"))
+
+    if backfill is not None:
+        connection.execute(text(backfill))
+        if not column.nullable and dialect.name == "postgresql":
+            column_name = dialect.identifier_preparer.format_column(column)
+            connection.execute(text(f"ALTER TABLE {table_name} ALTER COLUMN {column_name} SET NOT NULL"))
@@ -1,7 +1,27 @@
-from flask import Blueprint, request
+from flask import Blueprint, request, current_app as app, send_file, Response, g
+from datetime import datetime
+import os
+from sqlalchemy import select
 from flaskr.entities.Alert import Alert, AlertType, AlertLevel, AlertStatus
+from flaskr.entities.Zone import Zone
 from flaskr.db import get_tenant_db
-from flaskr.middlewares.PermissionMiddleware import permission_required
+from flaskr.middlewares.PermissionMiddleware import permission_required, has_permission
+from flaskr.middlewares.AuthMiddleware import validate_token
+from flaskr.services.Pagination import PaginationError, paginate, parse_datetime, parse_int, parse_enum
+from flaskr.services.ScreenshotWriter import get_thumbnail_path
+from flaskr.services.AlertHub import RESOLVED, get_alert_hub, publish_alerts
+
+# Seconds between keep-alive comments on an idle alert stream, they also detect closed connections
+STREAM_HEARTBEAT = 15
+STREAM_MIMETYPE = "text/event-stream"
+STREAM_HEADERS = {
+    "Cache-Control": "no-cache",
+    # Proxies must not buffer the stream
+    "X-Accel-Buffering": "no"
+}
+# Tells the browser how long to wait before reconnecting
+RETRY_MESSAGE = b"retry: 3000\n\n"
+KEEP_ALIVE_MESSAGE = b": keep-alive\n\n"
 
 bp = Blueprint("alerts", __name__, url_prefix="/alerts")
 
@@ -12,9 +32,139 @@ bp = Blueprint("alerts", __name__, url_prefix="/alerts")
 
 @bp.route("/", methods=["GET"])
 @permission_required("GET_ALERTS")
-def get_alerts():
-    # TODO: Pagination/filtering
-    query_params = request.args
-    db = get_tenant_db()
-    alerts = db.query(Alert).all()
-    return {"alerts": [alert.to_dict() for alert in alerts]}
+def get_alerts(current_user):
+    """
+    Alerts, newest first, one page at a time: pass the returned next_cursor as cursor to get the next page.
+    Filters: from, to (ISO datetimes), camera_id, zone_id, employee_id, type, level, status
+    """
+    try:
+        args = request.args
+        db = get_tenant_db()
+        query = db.query(Alert)
+
+        start = parse_datetime(args, "from")
+        end = parse_datetime(args, "to")
+        if start is not None:
+            query = query.filter(Alert.timestamp >= start)
+        if end is not None:
+            query = query.filter(Alert.timestamp <= end)
+
+        camera_id = parse_int(args, "camera_id")
+        if camera_id is not None:
+            # Alerts reference the zone they were raised in, the zone belongs to a camera
+            query = query.filter(Alert.zone_id.in_(select(Zone.id).where(Zone.video_camera_id == camera_id)))
+        for name, column in (("zone_id", Alert.zone_id), ("employee_id", Alert.employee_id)):
+            value = parse_int(args, name)
+            if value is not None:
+                query = query.filter(column == value)
+        for name, column, enum in (("type", Alert.type, AlertType), ("level", Alert.level, AlertLevel),
+                                   ("status", Alert.status, AlertStatus)):
+            value = parse_enum(args, name, enum)
+            if value is not None:
+                query = query.filter(column == value)
+
+        alerts, next_cursor = paginate(query, [Alert.timestamp, Alert.id], args)
+        return {"alerts": [alert.to_dict() for alert in alerts], "next_cursor": next_cursor}, 200
+
+    except PaginationError as e:
+        return {"message": str(e)}, 400
+    except Exception as e:
+        app.logger.error(e)
+        return {"message": "Something went wrong"}, 500
+
+
+@bp.route("/<int:alert_id>/screenshot", methods=["GET"])
+@permission_required("GET_ALERTS")
+def get_alert_screenshot(current_user, alert_id):
+    """Screenshot of the alert, its small version with ?thumbnail=true"""
+    try:
+        db = get_tenant_db()
+        alert = db.query(Alert).filter_by(id=alert_id).first()
+        if alert is None:
+            return {"message": "Alert not found"}, 404
+        if alert.screenshot is None:
+            return {"message": "Alert has no screenshot"}, 404
+
+        path = alert.screenshot
+        if request.args.get("thumbnail", "false").lower() not in ("false", "0"):
+            path = get_thumbnail_path(path)
+        if not os.path.exists(path):
+            return {"message": "Screenshot file not found"}, 404
+        # Content-addressed files never change
+        return send_file(path, mimetype="image/jpeg", max_age=31536000)
+    except Exception as e:
+        app.logger.error(e)
+        return {"message": "Something went wrong"}, 500
+
+
+@bp.route("/<int:alert_id>/resolve", methods=["PUT"])
+@permission_required("RESOLVE_ALERT")
+def resolve_alert(current_user, alert_id):
+    try:
+        db = get_tenant_db()
+        alert = db.query(Alert).filter_by(id=alert_id).first()
+        if alert is None:
+            return {"message": "Alert not found"}, 404
+        if alert.status == AlertStatus.RESOLVED:
+            return {"message": "Alert is already resolved"}, 400
+
+        alert.status = AlertStatus.RESOLVED
+        alert.resolved_at = datetime.now()
+        db.commit()
+        resolved = alert.to_dict()
+        publish_alerts(g.tenant_id, RESOLVED, [resolved])
+        return {"alert": resolved}, 200
+    except Exception as e:
+        app.logger.error(e)
+        return {"message": "Something went wrong"}, 500
+
+
+def open_alert_stream(args, last_event_id):
+    """
+    Authenticates the token of the query arguments and finds where the console resumes.
+    Needs an application context. Returns ((hub, sequence, first messages), 200) or the
+    error response and its code. Shared by this blueprint and the asyncio server (flaskr.asgi)
+    """
+    res, code = validate_token(args.get("token"))
+    if code != 200:
+        return res, code
+    if not has_permission(res, "GET_ALERTS"):
+        return {"message": "Unauthorized"}, 401
+
+    hub = get_alert_hub(g.tenant_id)
+    sequence, first_messages = hub.resume(last_event_id or args.get("last_event_id"))
+    return (hub, sequence, first_messages), 200
+
+@bp.route("/stream", methods=["GET"])
+def stream_alerts():
+    """
+    Server-Sent Events stream of the created and resolved alerts of the tenant.
+    EventSource cannot set headers, the token is passed as a query parameter.
+    A reconnecting client sends Last-Event-ID and gets the events it missed,
+    a reset event tells it to reload the alerts when they are no longer buffered
+    """
+    res, code = open_alert_stream(request.args, request.headers.get("Last-Event-ID"))
+    if code != 200:
+        return res, code
+    hub, sequence, first_messages = res
+
+    def generate_events():
+        nonlocal sequence
+        hub.connect()
+        try:
+            yield RETRY_MESSAGE + b"".join(first_messages)
+            while True:
+                sequence, messages = hub.wait_for_events(sequence, timeout=STREAM_HEARTBEAT)
+                if messages is None:
+                    return
+                yield b"".join(messages) if messages else KEEP_ALIVE_MESSAGE
+        finally:
+            hub.disconnect()
+
+    return Response(generate_events(), mimetype=STREAM_MIMETYPE, headers=STREAM_HEADERS)
+
+
+@bp.route("/stream/stats", methods=["GET"])
+@permission_required("GET_ALERTS")
+def get_alert_stream_stats(current_user):
+    return get_alert_hub(g.tenant_id).get_stats(), 200
@@ -1,9 +1,10 @@
-from flask import Blueprint, current_app as app, request
+from flask import Blueprint, current_app as app, request, g
 from flaskr.middlewares.PermissionMiddleware import permission_required
 from flaskr.db import get_tenant_db
 from flaskr.entities.Employee import Employee
 from flaskr.entities.Zone import Zone
 from flaskr.entities.Blacklist import Blacklist
+from flaskr.services import BlacklistEngine
 
 bp = Blueprint("blacklist", __name__, url_prefix="/blacklist")
 
@@ -62,6 +63,7 @@ def create_blacklist(current_user):
         if new_blacklist_entries:
             db.bulk_save_objects(new_blacklist_entries)
             db.commit()
+            BlacklistEngine.add_to_blacklist(g.tenant_id, zone_id, [entry.employee_id for entry in new_blacklist_entries])
 
         return {"message": "Blacklist created successfully"}, 201
 
@@ -83,8 +85,8 @@ def delete_blacklist(current_user):
 
         db = get_tenant_db()
 
-        employees = db.query(Employee.id).filter(Employee.id.in_(employees_ids), zone_id=zone_id).all()
-        # TODO: Asigura-te ca merg cum trebuie liniile urmatore de cod
+        employees = db.query(Blacklist.employee_id.label("id")).filter(
+            Blacklist.employee_id.in_(employees_ids), Blacklist.zone_id == zone_id).all()
         correct_employee_ids = {employee.id for employee in employees}
         wrong_employees = set(employees_ids) - correct_employee_ids
 
@@ -93,6 +95,7 @@ def delete_blacklist(current_user):
 
         db.query(Blacklist).filter(Blacklist.employee_id.in_(correct_employee_ids), Blacklist.zone_id == zone_id).delete(synchronize_session=False)
         db.commit()
+        BlacklistEngine.remove_from_blacklist(g.tenant_id, zone_id, correct_employee_ids)
 
         return {"message": "Blacklist deleted successfully"}, 200
     except Exception as e:
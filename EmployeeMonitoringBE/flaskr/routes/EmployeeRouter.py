@@ -1,8 +1,12 @@
-from flask import Blueprint, request, jsonify, current_app as app
+from flask import Blueprint, request, jsonify, current_app as app, g
 from flaskr.middlewares.PermissionMiddleware import permission_required
 from flaskr.db import get_tenant_db
 from flaskr.entities.Employee import Employee
 from flaskr.ML.face_recognition import face_recognition_impl 
+from flaskr.services import FaceGallery, BlacklistEngine
+from flaskr.entities.Blacklist import Blacklist
+from sqlalchemy.exc import IntegrityError
+from flaskr.services.Pagination import PaginationError, paginate
 import numpy as np
 import io
 
@@ -54,6 +58,8 @@ def create_employee(current_user):
         db.add(employee)
         db.flush()
         db.commit()
+        # Running cameras pick up the new employee on their next analyzed frame
+        FaceGallery.upsert_employee(g.tenant_id, employee, encoded_face)
         return {"message": "Employee created successfully. Face encoded sucessfuly.",
                 "employee": {
                     "id": employee.id,
@@ -68,22 +74,52 @@ def create_employee(current_user):
         print(e)
         return jsonify({"message": "Something went wrong"}), 500
 
-# TODO: Pagination/sorting can be implemented 
-# Get all employees
+def employee_to_dict(employee):
+    return {
+        "id": employee.id,
+        "firstName": employee.firstName,
+        "lastName": employee.lastName,
+        "phoneNumber": employee.phoneNumber,
+        "role": employee.role,
+        "department": employee.department
+    }
+
+# Get all employees. With cursor or limit one page at a time ordered by id, {employees, next_cursor}:
+# pass the returned next_cursor as cursor. Without them the plain list of every employee, as before pagination
 @bp.route("/", methods=["GET"])
 def get_all_employees():
     try:
         db = get_tenant_db()
-        employees = db.query(Employee).all()
-        return jsonify([{
-            "id": employee.id,
-            "firstName": employee.firstName,
-            "lastName": employee.lastName,
-            "phoneNumber": employee.phoneNumber,
-            "role": employee.role,
-            "department": employee.department
-        } for employee in employees]), 200
+        if "cursor" not in request.args and "limit" not in request.args:
+            return jsonify([employee_to_dict(employee) for employee in db.query(Employee).order_by(Employee.id)]), 200
+        employees, next_cursor = paginate(db.query(Employee), [Employee.id], request.args, descending=False)
+        return jsonify({"employees": [employee_to_dict(employee) for employee in employees],
+                        "next_cursor": next_cursor}), 200
+    except PaginationError as e:
+        return jsonify({"message": str(e)}), 400
+    except Exception as e:
+        print(e)
+        return jsonify({"message": "Something went wrong"}), 500
+
+@bp.route("/<int:employee_id>", methods=["DELETE"])
+@permission_required("DELETE_EMPLOYEE")
+def delete_employee(current_user, employee_id):
+    try:
+        db = get_tenant_db()
+        employee = db.query(Employee).filter_by(id=employee_id).first()
+        if employee is None:
+            return jsonify({"message": "Employee not found"}), 404
+
+        db.query(Blacklist).filter_by(employee_id=employee_id).delete(synchronize_session=False)
+        db.delete(employee)
+        db.commit()
+        FaceGallery.remove_employee(g.tenant_id, employee_id)
+        BlacklistEngine.remove_employee(g.tenant_id, employee_id)
+        return jsonify({"message": "Employee deleted successfully"}), 200
+    except IntegrityError as e:
+        db.rollback()
+        print(e)
+        return jsonify({"message": "Employee has detections or alerts recorded"}), 400
     except Exception as e:
         print(e)
         return jsonify({"message": "Something went wrong"}), 500
-    
@@ -1,21 +1,48 @@
 from flask import Blueprint, request, current_app as app
+from datetime import timedelta
 from flaskr.db import get_tenant_db
 from flaskr.middlewares.PermissionMiddleware import permission_required
 from flaskr.entities.PersonDetected import PersonDetected
+from flaskr.services.Pagination import PaginationError, paginate, parse_datetime, parse_int
+from flaskr.services.PresenceSessionizer import get_max_interval_duration
 
 bp = Blueprint("persons-detected", __name__, url_prefix="/persons-detected")
 
 # Person detected post is creating internally in the backend so no need for a route
 
-# TODO: Add filtering/pagination
 @bp.route("/", methods=["GET"])
 @permission_required("GET_PERSONS_DETECTED")
 def get_persons_detected(current_user):
+    """
+    Presence intervals, newest first, one page at a time: pass the returned next_cursor as cursor.
+    from/to (ISO datetimes) return the intervals overlapping that time range,
+    camera_id, zone_id and employee_id filter by camera, zone and employee
+    """
     try:
+        args = request.args
         db = get_tenant_db()
-        persons_detected = db.query(PersonDetected).all()
-        return {"persons_detected": [person_detected.to_dict() for person_detected in persons_detected]}
+        query = db.query(PersonDetected)
 
+        start = parse_datetime(args, "from")
+        end = parse_datetime(args, "to")
+        if start is not None:
+            # Intervals are at most the max duration long, bounding their start keeps the scan on the index
+            query = query.filter(PersonDetected.ended_at >= start,
+                                 PersonDetected.detected_at >= start - timedelta(seconds=get_max_interval_duration()))
+        if end is not None:
+            query = query.filter(PersonDetected.detected_at <= end)
+        for name, column in (("camera_id", PersonDetected.video_camera_id), ("zone_id", PersonDetected.zone_id),
+                             ("employee_id", PersonDetected.employee_id)):
+            value = parse_int(args, name)
+            if value is not None:
+                query = query.filter(column == value)
+
+        persons_detected, next_cursor = paginate(query, [PersonDetected.detected_at, PersonDetected.id], args)
+        return {"persons_detected": [person_detected.to_dict() for person_detected in persons_detected],
+                "next_cursor": next_cursor}
+
+    except PaginationError as e:
+        return {"message": str(e)}, 400
     except Exception as e:
         app.logger.error(e)
         return {"message": "Something went wrong"}, 500
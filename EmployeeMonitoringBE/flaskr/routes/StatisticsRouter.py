@@ -0,0 +1,52 @@
+from flask import Blueprint, request, current_app as app
+from flaskr.db import get_tenant_db
+from flaskr.middlewares.PermissionMiddleware import permission_required
+from flaskr.entities.DetectionRollup import RollupGranularity
+from flaskr.services import DetectionRollups
+from flaskr.services.Pagination import PaginationError, parse_datetime, parse_int, parse_enum
+
+bp = Blueprint("statistics", __name__, url_prefix="/statistics")
+
+
+@bp.route("/detections", methods=["GET"])
+@permission_required("GET_PERSONS_DETECTED")
+def get_detection_statistics(current_user):
+    """
+    Presence counters per camera and zone (zone 0 is outside of the zones) over [from, to).
+    Without bucket the totals of the range are returned, read from the coarsest rollups that fit,
+    with bucket (minute, hour, day) one entry per bucket.
+    Presence intervals are counted when they close, so recent buckets lag behind by up to
+    PRESENCE_MAX_DURATION + PRESENCE_GAP (about an hour by default): complete_before is the
+    time before which the counters are final
+    """
+    try:
+        args = request.args
+        start = parse_datetime(args, "from")
+        end = parse_datetime(args, "to")
+        if start is None or end is None:
+            return {"message": "from and to are required"}, 400
+        if start >= end:
+            return {"message": "from must be before to"}, 400
+        granularity = parse_enum(args, "bucket", RollupGranularity)
+        camera_id = parse_int(args, "camera_id")
+        zone_id = parse_int(args, "zone_id")
+
+        db = get_tenant_db()
+        if granularity is None:
+            rows = DetectionRollups.query_totals(db, start, end, camera_id, zone_id)
+        else:
+            rows = DetectionRollups.query_series(db, start, end, granularity, camera_id, zone_id)
+        return {"statistics": [{
+            **({"bucket_start": row.bucket_start.isoformat()} if granularity is not None else {}),
+            "camera_id": row.video_camera_id,
+            "zone_id": row.zone_id,
+            "detections": row.detections,
+            "frames": row.frames,
+            "presence_seconds": row.presence_seconds
+        } for row in rows], "complete_before": DetectionRollups.get_complete_before().isoformat()}, 200
+
+    except PaginationError as e:
+        return {"message": str(e)}, 400
+    except Exception as e:
+        app.logger.error(e)
+        return {"message": "Something went wrong"}, 500
@@ -1,23 +1,26 @@
 from flask import current_app as app, Blueprint, request, Response, g
-from flaskr.db import get_tenant_db, get_users_db
+from flaskr.db import get_tenant_db
 from flaskr.middlewares.PermissionMiddleware import permission_required
+from flaskr.middlewares.AuthMiddleware import validate_token
 from flaskr.entities.VideoCamera import VideoCamera
-from flaskr.entities.auth_db.User import User
 import re
-from flaskr.entities.Employee import Employee
-import jwt
-import cv2 as cv
-import numpy as np
-import face_recognition
-import io
-from threading import Thread, Lock
-import time
-import dlib
+import os
+from threading import Lock
+from flaskr.services.CameraPipeline import CameraPipeline, FILTERS
+from flaskr.ML.face_recognition import face_encoding_service
+from flaskr.ML.ppe_recognition import ppe_recognition_service
+from flaskr.ML.model_registry import get_model_registry
+from flaskr.services.FaceGallery import get_face_gallery
+from flaskr.services.AnalysisScheduler import get_analysis_scheduler
+from flaskr.services.ZoneMaskCache import get_camera_zones
+from flaskr.services.BlacklistEngine import get_blacklist
+from flaskr.services.PPEMonitor import get_ppe_ids
+from flaskr.services import WriteBehindBuffer, ScreenshotWriter, JpegLadder
 
 bp = Blueprint("video-cameras", __name__, url_prefix="/video-cameras")
 
-active_cameras = {}  # camera_name: {"frame": bytes, "clients": count, "running": bool}
-camera_locks = {}    # camera_name: Lock
+active_cameras = {}  # (tenant_id, camera_name): CameraPipeline
+active_cameras_lock = Lock()
 
 
 # def is_valid_ip(ip):
@@ -29,28 +32,17 @@ camera_locks = {}    # camera_name: Lock
 def is_valid_port(port):
     return 0 <= int(port) <= 65535
 
-def validate_token(token):
-        try:
-            data = jwt.decode(token, app.config["JWT_SECRET"], algorithms=["HS256"])
-            db = get_users_db()
-            logged_user = db.query(User).filter_by(id=data["user_id"]).first()
-            print(logged_user)
-            if logged_user == None:
-                print("Invalid token")
-                return {
-                    "message": "Invalid token",
-                }, 401
-        except Exception as e:
-            print(e)
-            return {
-                "message": "Something went wrong",
-            }, 500
-        
-        # Set the tenant database such that it will query that specific one
-        g.tenant_id = logged_user.tenant_id
-        return logged_user, 200
-        
+def is_valid_priority(priority):
+    return isinstance(priority, (int, float)) and priority > 0
 
+def get_requested_filters(args):
+    """Filters are enabled by passing them as query arguments, e.g. ?face_recognition=true"""
+    return frozenset(f for f in FILTERS if args.get(f, "false").lower() not in ("false", "0"))
+
+def get_requested_variant(args):
+    """Size and quality of the stream, e.g. ?variant=low for a phone, None for an unknown variant"""
+    variant = args.get("variant", JpegLadder.DEFAULT_VARIANT).lower()
+    return variant if variant in JpegLadder.VARIANTS else None
 
 @bp.route("/", methods=["POST"])
 @permission_required("CREATE_VIDEO_CAMERA")
@@ -70,6 +62,13 @@ def create_video_camera(current_user):
 
         if not is_valid_port(data.get("port")):
             return {"message": "Invalid port number"}, 400
+
+        if "priority" in data and not is_valid_priority(data.get("priority")):
+            return {"message": "Priority must be a positive number"}, 400
+
+        face_detection_modes = [mode.value for mode in VideoCamera.FaceDetectionMode]
+        if data.get("face_detection_mode", "cnn") not in face_detection_modes:
+            return {"message": f"Face detection mode must be one of {face_detection_modes}"}, 400
         
         ip = data.get("ip")
         port = data.get("port")
@@ -77,6 +76,8 @@ def create_video_camera(current_user):
         password = data.get("password")
         name = data.get("name")
         location = data.get("location")
+        priority = data.get("priority", 1.0)
+        face_detection_mode = VideoCamera.FaceDetectionMode(data.get("face_detection_mode", "cnn"))
 
         db = get_tenant_db()
         if db.query(VideoCamera).filter(VideoCamera.name == name).first():
@@ -89,6 +90,8 @@ def create_video_camera(current_user):
             password=password,
             name=name,
             location=location,
+            priority=priority,
+            face_detection_mode=face_detection_mode,
             status=VideoCamera.CameraStatus.INACTIVE
         )
 
@@ -104,119 +107,39 @@ def create_video_camera(current_user):
         print(e)
         return {"message": "Internal server error"}, 500
 
-def process_camera_frames(camera_name, rtsp_url,
-                          face_recognition_filter=False,
-                            person_detection_filter=False,
-                            ppe_recognition_filter=False,
-                            known_face_encodings=[],
-                            known_face_names=[]):
-
-    cuda_available = dlib.DLIB_USE_CUDA
-    print(f"CUDA available: {cuda_available}")
-
-    cap = cv.VideoCapture(rtsp_url)
-    # Reduced buffer size: solution 1
-    cap.set(cv.CAP_PROP_BUFFERSIZE, 2)
-    if not cap.isOpened():
-        print(f"Could not open stream for camera: {camera_name}")
-        with camera_locks[camera_name]:
-            active_cameras[camera_name]["running"] = False
-        return
-    
-    process_this_frame = True
-
-    while True:
-        with camera_locks[camera_name]:
-            if active_cameras[camera_name]["clients"] <= 0:
-                active_cameras[camera_name]["running"] = False
-                print(f"No more clients for camera {camera_name}, stopping stream")
-                break
-        
-        success, frame = cap.read()
-        if not success:
-            print(f"Failed to read frame for camera {camera_name}")
-            continue
-        
-        if process_this_frame:
-            try:
-                if face_recognition_filter and known_face_encodings:
-                    small_frame = cv.resize(frame, (0, 0), fx=0.25, fy=0.25)
-                    rgb_small_frame = np.ascontiguousarray(small_frame[:, :, ::-1])
-                    face_locations = face_recognition.face_locations(rgb_small_frame, model="cnn")
-                    face_encodings = face_recognition.face_encodings(rgb_small_frame, face_locations)
-                    
-                    face_names = []
-                    for face_encoding in face_encodings:
-                        matches = face_recognition.compare_faces(known_face_encodings, face_encoding)
-                        name = "Unknown"
-                        
-                        if len(known_face_encodings) > 0:
-                            face_distances = face_recognition.face_distance(known_face_encodings, face_encoding)
-                            best_match_index = np.argmin(face_distances)
-                            if matches[best_match_index]:
-                                name = known_face_names[best_match_index]
-                        face_names.append(name)
-                    
-                    for (top, right, bottom, left), name in zip(face_locations, face_names):
-                        top *= 4
-                        right *= 4
-                        bottom *= 4
-                        left *= 4
-                        cv.rectangle(frame, (left, top), (right, bottom), (0, 0, 255), 2)
-                        cv.rectangle(frame, (left, bottom - 35), (right, bottom), (0, 0, 255), cv.FILLED)
-                        font = cv.FONT_HERSHEY_DUPLEX
-                        cv.putText(frame, name, (left + 6, bottom - 6), font, 1.0, (255, 255, 255), 1)
-            except Exception as e:
-                print(f"Error in face recognition: {e}")
-            
-            # Add other filter processing as needed
-            if person_detection_filter:
-                # Person detection code
-                pass
-                
-            if ppe_recognition_filter:
-                # PPE recognition code
-                pass
-                
-        process_this_frame = not process_this_frame
-
-        success, jpeg_frame = cv.imencode('.jpg', frame)
-        if not success:
-            print(f"Failed to encode frame for camera: {camera_name}")
-            continue
+STREAM_MIMETYPE = "multipart/x-mixed-replace; boundary=frame"
+STREAM_HEADERS = {
+    'Access-Control-Allow-Origin': 'http://127.0.0.1:5500',
+    'Access-Control-Allow-Credentials': 'true'
+}
 
-        frame_bytes = jpeg_frame.tobytes()
-        with camera_locks[camera_name]:
-            active_cameras[camera_name]["frame"] = frame_bytes
+def format_stream_part(frame):
+    return b'--frame\r\nContent-Type: image/jpeg\r\n\r\n' + frame + b'\r\n\r\n'
 
-        cv.waitKey(1)
-        
-    cap.release()
-    print(f"Camera stream for {camera_name} has stopped")
-
-@bp.route("/<string:camera_name>/stream", methods=["GET"])
-def get_camera(camera_name):
-    res, code = validate_token(request.args.get("token"))
+def open_camera_stream(camera_name, args):
+    """
+    Authenticates the token of the query arguments and subscribes the client to the camera,
+    starting its pipeline for the first client. Needs an application context.
+    Returns ((pipeline, subscription, camera_key), 200) or the error response and its code.
+    Shared by this blueprint and the asyncio stream server (flaskr.asgi)
+    """
+    res, code = validate_token(args.get("token"))
     if code != 200:
         return res, code
-    current_user = res
-    face_recognition_filter = request.args.get("face_recognition", False)
-    person_detection_filter = request.args.get("person_detection", False)
-    ppe_recognition_filter = request.args.get("ppe_recognition", False)
+    filters = get_requested_filters(args)
+    variant = get_requested_variant(args)
+    if variant is None:
+        return {"message": f"Variant must be one of {', '.join(JpegLadder.VARIANTS)}"}, 400
 
     db = get_tenant_db()
     camera = db.query(VideoCamera).filter_by(name=camera_name).first()
     if not camera:
         return {"message": "Camera not found"}, 404
     
-    known_face_encodings = []
-    known_face_names = []
-    if face_recognition_filter:
+    face_gallery = None
+    if "face_recognition" in filters:
         try:
-            employees = db.query(Employee).all()
-            known_face_encodings = [np.load(io.BytesIO(employee.encodedFace)) for employee in employees if hasattr(employee, 'encodedFace') and employee.encodedFace]
-            known_face_names = [f"{employee.firstName} {employee.lastName}" for employee in employees if hasattr(employee, 'encodedFace') and employee.encodedFace]
-            print(f"Loaded {len(known_face_encodings)} face encodings for recognition")
+            face_gallery = get_face_gallery(db, g.tenant_id)
         except Exception as e:
             print(f"Error loading face data: {e}")
             return {"message": "Internal server error"}, 500
@@ -225,59 +148,127 @@ def get_camera(camera_name):
     # Here the RTSP stream should be read and returned
     rtsp_url = f"rtsp://{camera.username}:{camera.password}@{camera.ip}:{camera.port}/stream2"
     #rtsp_url = 0
-    if camera_name not in active_cameras:
-        active_cameras[camera_name] = {
-            "frame": None,
-            "clients": 0,
-            "running": False
-        }
-        camera_locks[camera_name] = Lock()
-
-    with camera_locks[camera_name]:
-        active_cameras[camera_name]["clients"] += 1
-        clients = active_cameras[camera_name]["clients"]
-        running = active_cameras[camera_name]["running"]
-
-        print(f"New client connected to camera {camera_name}. Total clients: {clients}")
-
-        if not running:
-            active_cameras[camera_name]["running"] = True
-            process_thread = Thread(target=process_camera_frames,
-                                    args=(camera_name, rtsp_url, face_recognition_filter, person_detection_filter, ppe_recognition_filter,
-                                          known_face_encodings, known_face_names))
-            process_thread.daemon = True
-            process_thread.start()
-    
+    camera_key = (g.tenant_id, camera_name)
+    with active_cameras_lock:
+        pipeline = active_cameras.get(camera_key)
+        if pipeline is None or not pipeline.running:
+            pipeline = CameraPipeline(camera_name, rtsp_url, camera.priority, camera.face_detection_mode.value,
+                                      g.tenant_id, camera.id)
+            pipeline.set_camera_zones(get_camera_zones(db, g.tenant_id, camera.id))
+            pipeline.set_blacklist(get_blacklist(db, g.tenant_id))
+            pipeline.set_ppe_ids(get_ppe_ids(db))
+            pipeline.set_screenshots_path(os.path.join(app.config["SCREENSHOTS_PATH"], str(g.tenant_id)))
+            active_cameras[camera_key] = pipeline
+            pipeline.start()
+        if face_gallery is not None:
+            pipeline.set_face_gallery(face_gallery)
+        subscription = pipeline.subscribe(filters, variant)
+        print(f"New client connected to camera {camera_name}. Total clients: {pipeline.clients}")
+    return (pipeline, subscription, camera_key), 200
+
+def close_camera_stream(pipeline, subscription, camera_key):
+    """Unsubscribes a disconnected client, the pipeline stops with its last client"""
+    with active_cameras_lock:
+        remaining = pipeline.unsubscribe(subscription)
+        print(f"Client disconnected from camera {pipeline.camera_name}. Remaining clients: {remaining}")
+        if remaining <= 0:
+            print(f"No more clients for camera {pipeline.camera_name}, stopping stream")
+            pipeline.stop()
+            if active_cameras.get(camera_key) is pipeline:
+                del active_cameras[camera_key]
+
+@bp.route("/<string:camera_name>/stream", methods=["GET"])
+def get_camera(camera_name):
+    res, code = open_camera_stream(camera_name, request.args)
+    if code != 200:
+        return res, code
+    pipeline, subscription, camera_key = res
+
     def generate_frames_for_client():
+        sequence = 0
         try:
-            while True:
-                # Check if camera is still running and get current frame
-                with camera_locks[camera_name]:
-                    if not camera_name in active_cameras or not active_cameras[camera_name]["running"]:
-                        break
-                    
-                    frame = active_cameras[camera_name]["frame"]
-                
-                if frame is not None:
-                    yield (b'--frame\r\n'
-                          b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n\r\n')
-                else:
-                    time.sleep(0.1)
+            while pipeline.running:
+                # Blocks until the camera publishes a frame newer than the last one sent
+                sequence, frame = pipeline.hub.wait_for_frame(subscription, sequence, timeout=1)
+                if frame is None:
                     continue
-                
-                time.sleep(0.066) # ~ 15 fps
+
+                yield format_stream_part(frame)
         finally:
             # Decrement client count when this client disconnects
-            if camera_name in active_cameras and camera_name in camera_locks:
-                with camera_locks[camera_name]:
-                    active_cameras[camera_name]["clients"] -= 1
-                    remaining = active_cameras[camera_name]["clients"]
-                    print(f"Client disconnected from camera {camera_name}. Remaining clients: {remaining}")
+            close_camera_stream(pipeline, subscription, camera_key)
                 
-    return Response(generate_frames_for_client(), mimetype='multipart/x-mixed-replace; boundary=frame', headers={
-        'Access-Control-Allow-Origin': 'http://127.0.0.1:5500',
-        'Access-Control-Allow-Credentials': 'true'
-    })
+    return Response(generate_frames_for_client(), mimetype=STREAM_MIMETYPE, headers=STREAM_HEADERS)
+
+
+@bp.route("/<string:camera_name>/stats", methods=["GET"])
+@permission_required("READ_VIDEO_STREAM")
+def get_camera_stats(current_user, camera_name):
+    with active_cameras_lock:
+        pipeline = active_cameras.get((g.tenant_id, camera_name))
+    if pipeline is None:
+        return {"message": "Camera is not streaming"}, 404
+    stats = {"camera": camera_name, "stages": pipeline.get_stats()}
+    if face_encoding_service.face_encoding_service is not None:
+        stats["face_encoding"] = face_encoding_service.face_encoding_service.get_stats()
+    if ppe_recognition_service.ppe_recognition_service is not None:
+        stats["ppe_recognition"] = ppe_recognition_service.ppe_recognition_service.get_stats()
+    if ScreenshotWriter.screenshot_writer is not None:
+        stats["screenshots"] = ScreenshotWriter.screenshot_writer.get_stats()
+    return stats, 200
+
+
+@bp.route("/scheduler", methods=["GET"])
+@permission_required("READ_VIDEO_STREAM")
+def get_analysis_schedule(current_user):
+    """Analysis rates chosen for the streaming cameras of the tenant"""
+    with active_cameras_lock:
+        pipelines = [pipeline for (tenant_id, _), pipeline in active_cameras.items() if tenant_id == g.tenant_id]
+    return get_analysis_scheduler().get_stats(pipelines), 200
+
+
+@bp.route("/write-buffer", methods=["GET"])
+@permission_required("READ_VIDEO_STREAM")
+def get_write_buffer_stats(current_user):
+    """Queue depth and flush latency of the rows the tenant's cameras produce"""
+    with WriteBehindBuffer.write_buffers_lock:
+        buffer = WriteBehindBuffer.write_buffers.get(g.tenant_id)
+    if buffer is None:
+        return {"message": "No rows were written yet"}, 404
+    return buffer.get_stats(), 200
+
+
+@bp.route("/models", methods=["GET"])
+@permission_required("READ_VIDEO_STREAM")
+def get_model_stats(current_user):
+    """Load time and memory of the models of the worker that answers, and whether it inherited them from the master"""
+    return get_model_registry().get_stats(), 200
+
+
+@bp.route("/<string:camera_name>/priority", methods=["PUT"])
+@permission_required("CREATE_VIDEO_CAMERA")
+def set_camera_priority(current_user, camera_name):
+    try:
+        data = request.get_json()
+        if not data or not is_valid_priority(data.get("priority")):
+            return {"message": "Priority must be a positive number"}, 400
+
+        db = get_tenant_db()
+        camera = db.query(VideoCamera).filter_by(name=camera_name).first()
+        if not camera:
+            return {"message": "Camera not found"}, 404
+        camera.priority = data["priority"]
+        db.commit()
+
+        with active_cameras_lock:
+            pipeline = active_cameras.get((g.tenant_id, camera_name))
+        if pipeline is not None:
+            pipeline.priority = camera.priority
+            get_analysis_scheduler().set_priority(pipeline, camera.priority)
+        return {"message": "Priority updated", "priority": camera.priority}, 200
+    except Exception as e:
+        print(e)
+        return {"message": "Internal server error"}, 500
 
 
 @bp.route('/video-cameras/<camera_name>/stream', methods=['OPTIONS'])
@@ -1,10 +1,13 @@
-from flask import Blueprint, current_app as app, request
+from flask import Blueprint, current_app as app, request, g
 from flaskr.middlewares.PermissionMiddleware import permission_required
 from werkzeug.utils import secure_filename
 from flaskr.db import get_tenant_db
 from flaskr.entities.Zone import Zone
+from flaskr.entities.Blacklist import Blacklist
+from flaskr.services.ZoneMaskCache import refresh_camera_zones
+from flaskr.services import BlacklistEngine
 
-bp = Blueprint("zone", __name__, "/zone")
+bp = Blueprint("zone", __name__, url_prefix="/zone")
 
 
 """
@@ -49,21 +52,24 @@ def create_zone(current_user):
         mask = request.files["mask"]
         video_camera_id = request.form.get("video_camera_id")
 
+        db = get_tenant_db()
         zone = db.query(Zone).filter_by(name=name).first()
         if zone:
             return {"message": "Zone with that name already exists"}, 400
+
+        filename = secure_filename(mask.filename)
         zone = Zone(
             name=name,
-            mask=f"{app.config['MASK_ZONES_PATH']}/{mask.filename}.png",
+            mask=f"{app.config['MASK_ZONES_PATH']}/{filename}.png",
             video_camera_id=video_camera_id
         )
 
-        filename = secure_filename(mask.filename)
         mask.save(f"{app.config['MASK_ZONES_PATH']}/{filename}.png")
-        db = get_tenant_db()
         db.add(zone)
         db.flush()
         db.commit()
+        # Running cameras use the new mask from their next frame
+        refresh_camera_zones(db, g.tenant_id, zone.video_camera_id)
         return {"message": "Zone created sucessfuly.", "zone":{
             "id": zone.id,
             "name": zone.name,
@@ -82,9 +88,16 @@ def delete_zone(current_user):
             return {"message": "Zone id is required"}, 400
         zone_id = data["zone_id"]
         db = get_tenant_db()
+        zone = db.query(Zone).filter_by(id=zone_id).first()
+        if zone is None:
+            return {"message": "Zone not found"}, 404
+        video_camera_id = zone.video_camera_id
         # TODO: Afla ce face syncrohnize session
+        db.query(Blacklist).filter_by(zone_id=zone_id).delete(synchronize_session=False)
         db.query(Zone).filter_by(id=zone_id).delete(synchronize_session=False)
         db.commit()
+        refresh_camera_zones(db, g.tenant_id, video_camera_id)
+        BlacklistEngine.remove_zone(g.tenant_id, zone_id)
         return {"message": "Zone deleted sucessfuly"}, 200
     except Exception as e:
         app.logger.error(e)
@@ -8,6 +8,7 @@ from .BlacklistRouter import bp as blacklist_bp
 from .ZoneRouter import bp as zones_bp
 from .PersonDetectedRouter import bp as persons_detected_bp
 from .PPERouter import pperouter as ppe_router
+from .StatisticsRouter import bp as statistics_bp
 
 
 def register_blueprints(app):
@@ -20,4 +21,5 @@ def register_blueprints(app):
     app.register_blueprint(blacklist_bp)
     app.register_blueprint(zones_bp)
     app.register_blueprint(persons_detected_bp)
-    app.register_blueprint(ppe_router)
\ No newline at end of file
+    app.register_blueprint(ppe_router)
+    app.register_blueprint(statistics_bp)
\ No newline at end of file
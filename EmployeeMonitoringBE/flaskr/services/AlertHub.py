@@ -0,0 +1,152 @@
+import json
+import os
+import uuid
+from collections import deque
+from datetime import datetime
+from enum import Enum
+from itertools import islice
+from threading import Condition, Lock
+
+CREATED = "created"
+RESOLVED = "resolved"
+# Sent when the events a client missed are no longer in the replay buffer, it should reload the alerts
+RESET = "reset"
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, Enum):
+        return value.value
+    return str(value)
+
+
+class AlertHub:
+    """
+    Broadcasts the alert changes of one tenant to its connected consoles as Server-Sent Events.
+
+    Every event is serialized once when it is published, the consoles only copy the bytes.
+    The last replay_size events are kept so a console that reconnects with Last-Event-ID
+    receives what it missed. Event ids are "<epoch>-<sequence>", the epoch changes with
+    every process so ids from before a restart are recognized and answered with a reset.
+
+    Listeners are called without arguments after every publish and on close, from the
+    publishing thread, they let asyncio consoles (AsyncFeed) wait without a thread.
+    """
+
+    def __init__(self, replay_size=1000):
+        self._condition = Condition()
+        self._events = deque(maxlen=replay_size)  # (sequence, encoded SSE message)
+        self._closed = False
+        self._listeners = []
+        self.epoch = uuid.uuid4().hex[:8]
+        self.sequence = 0
+        self.clients = 0
+
+    def publish(self, event, alerts):
+        """Broadcasts an event (CREATED, RESOLVED) for every alert dict"""
+        with self._condition:
+            for alert in alerts:
+                self.sequence += 1
+                self._events.append((self.sequence, self._format(event, json.dumps(alert, default=_json_default))))
+            self._condition.notify_all()
+            listeners = list(self._listeners)
+        for listener in listeners:
+            listener()
+
+    @property
+    def closed(self):
+        return self._closed
+
+    def add_listener(self, listener):
+        with self._condition:
+            self._listeners.append(listener)
+
+    def remove_listener(self, listener):
+        with self._condition:
+            self._listeners.remove(listener)
+
+    def resume(self, last_event_id):
+        """
+        Sequence a client starts after and the messages it must get first.
+        Without a Last-Event-ID the client only gets new events
+        """
+        with self._condition:
+            if not last_event_id:
+                return self.sequence, []
+            epoch, _, sequence = last_event_id.partition("-")
+            if epoch != self.epoch or not sequence.isdigit() or int(sequence) > self.sequence:
+                return self.sequence, [self._reset_message()]
+        return int(sequence), []
+
+    def wait_for_events(self, after_sequence, timeout=None):
+        """
+        Blocks until there are events newer than after_sequence.
+        Returns (sequence, messages), messages is empty on timeout and None once the hub is closed
+        """
+        with self._condition:
+            self._condition.wait_for(lambda: self.sequence > after_sequence or self._closed, timeout)
+            return self._get_events(after_sequence)
+
+    def get_events(self, after_sequence):
+        """The events newer than after_sequence without waiting, returns like wait_for_events"""
+        with self._condition:
+            return self._get_events(after_sequence)
+
+    def connect(self):
+        with self._condition:
+            self.clients += 1
+
+    def disconnect(self):
+        with self._condition:
+            self.clients -= 1
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+            listeners = list(self._listeners)
+        for listener in listeners:
+            listener()
+
+    def get_stats(self):
+        with self._condition:
+            return {"clients": self.clients, "sequence": self.sequence, "buffered": len(self._events),
+                    "replay_size": self._events.maxlen}
+
+    def _get_events(self, after_sequence):
+        if self._closed:
+            return after_sequence, None
+        missed = self.sequence - after_sequence
+        if missed <= 0:
+            return after_sequence, []
+        if missed > len(self._events):
+            # The client fell behind the replay buffer
+            return self.sequence, [self._reset_message()]
+        # Sequences are contiguous, the newest events are at the end
+        messages = [message for _, message in islice(reversed(self._events), missed)]
+        messages.reverse()
+        return self.sequence, messages
+
+    def _format(self, event, data):
+        return f"id: {self.epoch}-{self.sequence}\nevent: {event}\ndata: {data}\n\n".encode()
+
+    def _reset_message(self):
+        return self._format(RESET, "{}")
+
+
+# Process wide hubs, tenant_id: AlertHub
+alert_hubs = {}
+alert_hubs_lock = Lock()
+
+def get_alert_hub(tenant_id) -> AlertHub:
+    with alert_hubs_lock:
+        hub = alert_hubs.get(tenant_id)
+        if hub is None:
+            hub = AlertHub(replay_size=int(os.getenv("ALERT_REPLAY_SIZE", 1000)))
+            alert_hubs[tenant_id] = hub
+        return hub
+
+def publish_alerts(tenant_id, event, alerts):
+    if alerts:
+        get_alert_hub(tenant_id).publish(event, alerts)
@@ -0,0 +1,30 @@
+from datetime import datetime
+from flaskr.services.WriteBehindBuffer import get_write_buffer
+from flaskr.entities.Alert import Alert, AlertType, AlertLevel
+
+
+def create_unauthorized_alert(employee_id, name, zone_id, camera_name):
+    return Alert(
+        type=AlertType.UNAUTHORIZED_PERSON_DETECTED,
+        level=AlertLevel.HIGH,
+        # Set when the person is seen, the write buffer may insert the alert much later
+        timestamp=datetime.now(),
+        employee_id=employee_id,
+        zone_id=zone_id,
+        explanation=f"{name} was detected by camera {camera_name} in a zone they are blacklisted from"
+    )
+
+def create_missing_ppe_alert(alert_type, ppe_name, employee_id, name, zone_id, camera_name):
+    person = name if employee_id is not None else "An unknown person"
+    return Alert(
+        type=alert_type,
+        level=AlertLevel.MEDIUM,
+        timestamp=datetime.now(),
+        employee_id=employee_id,
+        zone_id=zone_id,
+        explanation=f"{person} was detected by camera {camera_name} without a {ppe_name.lower()}"
+    )
+
+def save_alerts(tenant_id, alerts):
+    """Queues alerts raised outside of a request, e.g. by a camera pipeline, to the tenant's write buffer"""
+    return get_write_buffer(tenant_id).put(alerts)
@@ -0,0 +1,146 @@
+import os
+import time
+from threading import Lock
+
+# Exponential moving average weight of the newest latency sample
+LATENCY_SMOOTHING = 0.2
+
+
+class ScheduledCamera:
+    def __init__(self, name, priority, target_fps):
+        self.name = name
+        self.priority = priority
+        self.target_fps = target_fps
+        self.latency = None  # Smoothed seconds per analyzed frame
+        self.rate = target_fps  # Analyzed frames per second chosen by the scheduler
+        self.next_due = time.monotonic()
+
+
+class AnalysisScheduler:
+    """
+    Chooses how many frames per second every camera analyzes.
+
+    Each camera reports how long its analysis passes take. A camera analyzing
+    at rate r costs latency * r seconds of analysis per second, the scheduler
+    shares the CPU budget (analysis seconds per second, e.g. the number of cores
+    it may use) between the cameras in proportion to their priority: cameras
+    that need less than their share get their target fps, the rest of the
+    budget is split again between the others.
+
+    When the smoothed latency of a camera goes over latency_slo the host is
+    overloaded and the budget is cut in half (at most once per second), it
+    grows back slowly while the latency is within the SLO.
+    """
+
+    def __init__(self, cpu_budget=None, target_fps=10.0, min_fps=0.5, latency_slo=0.5):
+        self.max_cpu_budget = cpu_budget or os.cpu_count() * 0.75
+        self.cpu_budget = self.max_cpu_budget
+        self.target_fps = target_fps
+        self.min_fps = min_fps
+        self.latency_slo = latency_slo
+
+        self.lock = Lock()
+        self.cameras = {}  # camera key: ScheduledCamera
+        self._last_budget_cut = 0
+
+    def register(self, camera_key, name, priority=1.0, target_fps=None):
+        with self.lock:
+            self.cameras[camera_key] = ScheduledCamera(name, priority, target_fps or self.target_fps)
+            self._allocate()
+
+    def unregister(self, camera_key):
+        with self.lock:
+            self.cameras.pop(camera_key, None)
+            self._allocate()
+
+    def set_priority(self, camera_key, priority):
+        with self.lock:
+            if camera_key in self.cameras:
+                self.cameras[camera_key].priority = priority
+                self._allocate()
+
+    def time_until_due(self, camera_key):
+        """Seconds the camera should wait before its next analysis pass"""
+        with self.lock:
+            camera = self.cameras.get(camera_key)
+            return max(camera.next_due - time.monotonic(), 0) if camera else 0
+
+    def report(self, camera_key, latency):
+        """Records the duration of an analysis pass and schedules the next one"""
+        with self.lock:
+            camera = self.cameras.get(camera_key)
+            if camera is None:
+                return
+            camera.latency = latency if camera.latency is None else \
+                LATENCY_SMOOTHING * latency + (1 - LATENCY_SMOOTHING) * camera.latency
+
+            now = time.monotonic()
+            if camera.latency > self.latency_slo:
+                if now - self._last_budget_cut >= 1:
+                    self.cpu_budget = max(self.cpu_budget / 2, self.min_fps * camera.latency)
+                    self._last_budget_cut = now
+            else:
+                self.cpu_budget = min(self.cpu_budget + 0.01 * self.max_cpu_budget, self.max_cpu_budget)
+            self._allocate()
+            # The interval starts when the pass started so the rate includes the analysis itself
+            camera.next_due = now - latency + 1 / camera.rate
+
+    def skip(self, camera_key):
+        """Schedules the next pass of a camera that decided to skip this one, without a latency sample"""
+        with self.lock:
+            camera = self.cameras.get(camera_key)
+            if camera is not None:
+                camera.next_due = time.monotonic() + 1 / camera.rate
+
+    def get_stats(self, camera_keys=None):
+        with self.lock:
+            return {
+                "cpu_budget": round(self.cpu_budget, 3),
+                "max_cpu_budget": self.max_cpu_budget,
+                "cameras": [{
+                    "camera": camera.name,
+                    "priority": camera.priority,
+                    "target_fps": camera.target_fps,
+                    "fps": round(camera.rate, 3),
+                    "latency_ms": round(camera.latency * 1000, 1) if camera.latency is not None else None
+                } for camera_key, camera in self.cameras.items() if camera_keys is None or camera_key in camera_keys]
+            }
+
+    def _allocate(self):
+        """Weighted water-filling of the CPU budget, must be called with the lock held"""
+        budget = self.cpu_budget
+        pending = {}
+        for camera in self.cameras.values():
+            if camera.latency is None:
+                # Not measured yet, analyze at the target rate to get a measurement
+                camera.rate = camera.target_fps
+            else:
+                pending[camera] = camera.latency * camera.target_fps
+
+        while pending:
+            total_priority = sum(camera.priority for camera in pending)
+            satisfied = [camera for camera, demand in pending.items()
+                         if demand <= budget * camera.priority / total_priority]
+            if not satisfied:
+                for camera in pending:
+                    share = budget * camera.priority / total_priority
+                    camera.rate = max(share / camera.latency, self.min_fps)
+                break
+            for camera in satisfied:
+                camera.rate = camera.target_fps
+                budget -= pending.pop(camera)
+
+
+analysis_scheduler = None
+analysis_scheduler_lock = Lock()
+def get_analysis_scheduler():
+    global analysis_scheduler
+    with analysis_scheduler_lock:
+        if analysis_scheduler == None:
+            cpu_budget = os.getenv("ANALYSIS_CPU_BUDGET")
+            analysis_scheduler = AnalysisScheduler(
+                cpu_budget=float(cpu_budget) if cpu_budget else None,
+                target_fps=float(os.getenv("ANALYSIS_TARGET_FPS", 10)),
+                latency_slo=float(os.getenv("ANALYSIS_LATENCY_SLO", 0.5))
+            )
+    return analysis_scheduler
@@ -0,0 +1,96 @@
+import asyncio
+
+
+class AsyncFeed:
+    """
+    Lets the asyncio clients of one hub (FrameHub, AlertHub) wait for its new sequences without a thread each.
+
+    The hub calls the feed from the publishing thread after every publish, the feed
+    hands a single wake-up per publish to the event loop, which resolves the future every
+    waiting client of the hub is awaiting. One feed serves all the clients of a hub on a loop.
+    """
+
+    def __init__(self, hub, loop):
+        self.hub = hub
+        self.loop = loop
+        self.clients = 0
+        self._published = loop.create_future()
+        hub.add_listener(self._on_publish)
+
+    async def wait(self, after_sequence, timeout):
+        """True once the hub's sequence is newer than after_sequence, False on timeout or when the hub closed"""
+        deadline = self.loop.time() + timeout
+        while self.hub.sequence <= after_sequence and not self.hub.closed:
+            remaining = deadline - self.loop.time()
+            if remaining <= 0:
+                return False
+            try:
+                # Shielded, a client timing out must not cancel the future the other clients await
+                await asyncio.wait_for(asyncio.shield(self._published), remaining)
+            except asyncio.TimeoutError:
+                return False
+        return not self.hub.closed
+
+    def close(self):
+        self.hub.remove_listener(self._on_publish)
+        self._wake()
+
+    def _on_publish(self):
+        try:
+            self.loop.call_soon_threadsafe(self._wake)
+        except RuntimeError:
+            # The event loop was closed, e.g. the server is shutting down
+            pass
+
+    def _wake(self):
+        published, self._published = self._published, self.loop.create_future()
+        if not published.done():
+            published.set_result(None)
+
+
+class AsyncFrameFeed(AsyncFeed):
+    """
+    Feed of a FrameHub. Frames are pulled from the hub on an executor, once per
+    subscription key for all the clients sharing it.
+    """
+
+    def __init__(self, hub, loop):
+        super().__init__(hub, loop)
+        self._pulls = {}  # key: future of the pull in progress
+
+    async def get_frame(self, key, after_sequence, executor):
+        """(sequence, frame) of the latest frame encoded for key, like FrameHub.wait_for_frame without waiting for a new one"""
+        result = self.hub.get_encoded(key, after_sequence)
+        if result is not None:
+            return result
+        pull = self._pulls.get(key)
+        # A done pull returned an older frame, awaiting it again would not even yield to the loop
+        if pull is None or pull.done():
+            pull = self.loop.run_in_executor(executor, self.hub.wait_for_frame, key, after_sequence, 0)
+            self._pulls[key] = pull
+            pull.add_done_callback(lambda done: self._pulls.pop(key) if self._pulls.get(key) is done else None)
+        # The pull may have started before the frame after_sequence was published
+        sequence, frame = await asyncio.shield(pull)
+        if sequence <= after_sequence:
+            return after_sequence, None
+        return sequence, frame
+
+
+# Feeds of the event loop, hub: feed. Only used from the event loop thread
+feeds = {}
+
+def get_feed(hub, feed_type=AsyncFeed):
+    """The feed of the hub on the running loop, every get_feed must be followed by a release_feed"""
+    feed = feeds.get(hub)
+    if feed is None:
+        feed = feed_type(hub, asyncio.get_running_loop())
+        feeds[hub] = feed
+    feed.clients += 1
+    return feed
+
+def release_feed(feed):
+    feed.clients -= 1
+    if feed.clients <= 0:
+        feed.close()
+        if feeds.get(feed.hub) is feed:
+            del feeds[feed.hub]
@@ -0,0 +1,148 @@
+import time
+from threading import Lock
+from flaskr.entities.Blacklist import Blacklist
+from flaskr.ML.face_recognition.face_recognition_impl import ANALYSIS_SCALE, get_analysis_size
+
+
+class TenantBlacklist:
+    """
+    Blacklist of one tenant kept in memory: zone id -> set of blacklisted employee ids.
+    Changes replace the set of the changed zone, so the cameras read it without locking.
+    """
+
+    def __init__(self):
+        self.lock = Lock()
+        self._zones = {}  # zone id: frozenset of employee ids
+
+    def __len__(self):
+        return sum(len(employee_ids) for employee_ids in self._zones.values())
+
+    def load(self, entries):
+        zones = {}
+        for entry in entries:
+            zones.setdefault(entry.zone_id, set()).add(entry.employee_id)
+        with self.lock:
+            self._zones = {zone_id: frozenset(employee_ids) for zone_id, employee_ids in zones.items()}
+
+    def add(self, zone_id, employee_ids):
+        with self.lock:
+            self._zones[zone_id] = self._zones.get(zone_id, frozenset()) | frozenset(employee_ids)
+
+    def remove(self, zone_id, employee_ids):
+        with self.lock:
+            remaining = self._zones.get(zone_id, frozenset()) - frozenset(employee_ids)
+            if remaining:
+                self._zones[zone_id] = remaining
+            else:
+                self._zones.pop(zone_id, None)
+
+    def remove_zone(self, zone_id):
+        with self.lock:
+            self._zones.pop(zone_id, None)
+
+    def remove_employee(self, employee_id):
+        with self.lock:
+            for zone_id in [zone_id for zone_id, employee_ids in self._zones.items() if employee_id in employee_ids]:
+                remaining = self._zones[zone_id] - {employee_id}
+                if remaining:
+                    self._zones[zone_id] = remaining
+                else:
+                    del self._zones[zone_id]
+
+    def is_blacklisted(self, employee_id, zone_id):
+        return employee_id in self._zones.get(zone_id, ())
+
+
+class BlacklistEngine:
+    """
+    Finds recognized employees standing in a zone they are blacklisted from, for one camera.
+
+    The zones of the camera are rasterized into a bitmap at the face detection
+    resolution (PreparedZones.bitmap), so the zones under a face are a single
+    pixel lookup and the blacklist check a single set lookup per zone.
+    The same employee in the same zone is reported at most once per cooldown seconds.
+    """
+
+    def __init__(self, blacklist: TenantBlacklist, cooldown=60.0):
+        self.blacklist = blacklist
+        self.cooldown = cooldown
+        self._last_reported = {}  # (employee_id, zone_id): monotonic time of the last violation
+
+        self.checked_faces = 0
+        self.violations = 0
+
+    def check(self, frame, faces, camera_zones):
+        """
+        faces are the results of face_recognition_impl.recognize_faces.
+        Returns (employee_id, name, zone_id) for every new violation
+        """
+        if camera_zones is None:
+            return []
+        zones = camera_zones.prepare(*get_analysis_size(frame))
+        if zones is None:
+            return []
+
+        now = time.monotonic()
+        violations = []
+        for location, employee_id, name in faces:
+            if employee_id is None:
+                continue
+            self.checked_faces += 1
+            for zone_id in zones.zones_at_location(location, ANALYSIS_SCALE):
+                if not self.blacklist.is_blacklisted(employee_id, zone_id):
+                    continue
+                if now - self._last_reported.get((employee_id, zone_id), -self.cooldown) < self.cooldown:
+                    continue
+                self._last_reported[(employee_id, zone_id)] = now
+                violations.append((employee_id, name, zone_id))
+
+        if len(self._last_reported) > 1000:
+            self._last_reported = {key: reported for key, reported in self._last_reported.items()
+                                   if now - reported < self.cooldown}
+        self.violations += len(violations)
+        return violations
+
+    def get_stats(self):
+        return {"checked_faces": self.checked_faces, "violations": self.violations}
+
+
+# Process wide cache, tenant_id: TenantBlacklist
+blacklists = {}
+blacklists_lock = Lock()
+
+def get_blacklist(db, tenant_id) -> TenantBlacklist:
+    """Returns the blacklist of the tenant, loading it from the tenant database on first use"""
+    with blacklists_lock:
+        blacklist = blacklists.get(tenant_id)
+        if blacklist is None:
+            # Loaded under the registry lock so blacklist changes made meanwhile are applied after the load
+            blacklist = TenantBlacklist()
+            blacklist.load(db.query(Blacklist).all())
+            blacklists[tenant_id] = blacklist
+        return blacklist
+
+def _loaded_blacklist(tenant_id):
+    with blacklists_lock:
+        return blacklists.get(tenant_id)
+
+def add_to_blacklist(tenant_id, zone_id, employee_ids):
+    """Applies created blacklist entries to the tenant's blacklist if it was loaded"""
+    blacklist = _loaded_blacklist(tenant_id)
+    if blacklist is not None:
+        blacklist.add(zone_id, employee_ids)
+
+def remove_from_blacklist(tenant_id, zone_id, employee_ids):
+    """Applies deleted blacklist entries to the tenant's blacklist if it was loaded"""
+    blacklist = _loaded_blacklist(tenant_id)
+    if blacklist is not None:
+        blacklist.remove(zone_id, employee_ids)
+
+def remove_zone(tenant_id, zone_id):
+    blacklist = _loaded_blacklist(tenant_id)
+    if blacklist is not None:
+        blacklist.remove_zone(zone_id)
+
+def remove_employee(tenant_id, employee_id):
+    blacklist = _loaded_blacklist(tenant_id)
+    if blacklist is not None:
+        blacklist.remove_employee(employee_id)
@@ -0,0 +1,455 @@
+from collections import Counter
+from threading import Condition, Lock, Thread
+import os
+import time
+import cv2 as cv
+import dlib
+from flaskr.ML.face_recognition import face_recognition_impl
+from flaskr.ML.face_recognition.face_tracker import FaceTracker
+from flaskr.ML.face_recognition.face_detection import CNN
+from flaskr.ML.motion_detection.motion_detector import MotionDetector
+from flaskr.ML.ppe_recognition import ppe_recognition_impl
+from flaskr.ML.person_detection import person_detection
+from flaskr.ML.ppe_recognition.ppe_recognition_service import get_ppe_recognition_service
+from flaskr.services.FrameHub import FrameHub
+from flaskr.services import JpegLadder
+from flaskr.services.AnalysisScheduler import get_analysis_scheduler
+from flaskr.services.BlacklistEngine import BlacklistEngine
+from flaskr.services.PPEMonitor import PPEMonitor, PPE_NAMES, ALERT_TYPES, get_person_zones
+from flaskr.services import AlertService
+from flaskr.services.PresenceSessionizer import PresenceSessionizer, get_max_interval_duration, get_interval_gap
+from flaskr.services.WriteBehindBuffer import get_write_buffer
+from flaskr.services.ScreenshotWriter import get_screenshot_writer
+
+
+class LatestFrameSlot:
+    """
+    Hand-off between two pipeline stages that holds a single item.
+    A put overwrites the item that was not taken yet, so a slow stage
+    always receives the newest frame instead of a growing backlog.
+    """
+
+    def __init__(self):
+        self._condition = Condition()
+        self._item = None
+        self._closed = False
+        self.dropped = 0
+
+    def put(self, item):
+        with self._condition:
+            if self._item is not None:
+                self.dropped += 1
+            self._item = item
+            self._condition.notify()
+
+    def take(self, timeout=None):
+        """Wait for an item, returns None on timeout or after close"""
+        with self._condition:
+            self._condition.wait_for(lambda: self._item is not None or self._closed, timeout)
+            item, self._item = self._item, None
+            return item
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+
+FACE_RECOGNITION = "face_recognition"
+PERSON_DETECTION = "person_detection"
+PPE_RECOGNITION = "ppe_recognition"
+FILTERS = (FACE_RECOGNITION, PERSON_DETECTION, PPE_RECOGNITION)
+
+# filter: function(frame, results) drawing that filter's cached results in place
+OVERLAYS = {
+    FACE_RECOGNITION: face_recognition_impl.draw_faces,
+    PERSON_DETECTION: person_detection.draw_persons,
+    PPE_RECOGNITION: ppe_recognition_impl.draw_ppe,
+}
+
+
+class CameraPipeline:
+    """
+    Reads a camera stream with two threads:
+    capture -> drains the RTSP stream at the camera's native rate and publishes the raw frames
+    analysis -> runs the filters on the newest captured frame, drops the rest
+
+    The stages are joined by a LatestFrameSlot so a slow analysis never stalls capture.
+    The AnalysisScheduler decides how often the analysis stage runs, depending on
+    the cost of the analysis, the load of the host and the priority of the camera.
+    Frames where nothing moved inside the camera's zones skip the analysis.
+
+    Clients subscribe with the set of filters they want to see and a JpegLadder variant.
+    The analysis runs once for the union of the requested filters and every subscriber
+    gets a frame with only its own overlays, drawn from the cached results. The FrameHub
+    keeps the raw latest frame and the client threads encode it when they pull it,
+    once per (overlays, variant) pair: subscribers that ask for the same pair share the
+    JPEG, variants nobody watches and frames replaced before anyone pulled them are
+    never encoded.
+
+    Recognized faces are checked against the tenant's blacklist and raise
+    an alert when an employee is seen in a zone they are blacklisted from.
+    The alert's screenshot is the analyzed frame with every overlay in full size, the JPEG a
+    client already pulled for it when there is one, else the ScreenshotWriter encodes it.
+    The ScreenshotWriter stores it and queues the alert to the write buffer.
+    Their sightings are merged into presence intervals stored as PersonDetected rows.
+
+    Persons are found by a single pass of the PPE model (process wide PPERecognitionService),
+    which detects the persons and their PPE at once. Faces are then only detected around
+    the heads of those persons, a frame without people costs that one pass. Persons
+    missing a PPE raise an alert the same way, recognized employees get the PPE seen
+    on them counted in their presence interval.
+    """
+
+    def __init__(self, camera_name, rtsp_url, priority=1.0, face_detection_mode=CNN, tenant_id=None, camera_id=None):
+        self.camera_name = camera_name
+        self.tenant_id = tenant_id
+        self.camera_id = camera_id
+        self.rtsp_url = rtsp_url
+        self.priority = priority
+        self.face_detection_mode = face_detection_mode
+        self.face_gallery = None  # FaceGallery of the camera's tenant
+        self.face_tracker = FaceTracker()
+        self.motion_detector = MotionDetector(keep_alive=float(os.getenv("MOTION_KEEP_ALIVE", 10)))
+        self.camera_zones = None  # CameraZones of the camera
+        self.blacklist_engine = None
+        self.ppe_monitor = PPEMonitor(cooldown=float(os.getenv("PPE_ALERT_COOLDOWN", 60)))
+        # Face detection only looks at the persons found by the person pass
+        self.person_gating = os.getenv("PERSON_GATED_FACE_DETECTION", "true").lower() not in ("false", "0")
+        self.person_detection_available = True
+        self.screenshots_path = None  # Folder of the tenant's alert screenshots
+        self.pending_alerts = []  # Alerts raised by the current analysis pass, waiting for its screenshot
+        self.presence = PresenceSessionizer(camera_id, gap=get_interval_gap(),
+                                            max_duration=get_max_interval_duration())
+
+        self.analysis_slot = LatestFrameSlot()
+
+        self.lock = Lock()
+        self.running = False
+        self.subscriptions = Counter()  # (frozenset of filters, variant): number of clients
+        # (raw frame, results of the analysis when it was captured), encoded per subscription
+        self.hub = FrameHub(self._encode, self._get_cache_key)
+        self.results = {}  # filter: latest analysis results
+
+        self.frames_captured = 0
+        self.frames_failed = 0
+        self.frames_analyzed = 0
+        self.variants_encoded = Counter()  # variant: JPEGs encoded
+        self.person_passes = 0
+        self.frames_without_persons = 0
+
+    @property
+    def clients(self):
+        return sum(self.subscriptions.values())
+
+    def start(self):
+        self.running = True
+        get_analysis_scheduler().register(self, self.camera_name, self.priority)
+        for stage in (self._capture_frames, self._analyze_frames):
+            Thread(target=stage, daemon=True).start()
+
+    def stop(self):
+        with self.lock:
+            if not self.running:
+                return
+            self.running = False
+        get_analysis_scheduler().unregister(self)
+        self.analysis_slot.close()
+        self.hub.close()
+
+    def subscribe(self, filters, variant=JpegLadder.DEFAULT_VARIANT):
+        """Register a client that wants to see the given filters in a variant, returns the key of its frames"""
+        subscription = (frozenset(filters), variant)
+        with self.lock:
+            self.subscriptions[subscription] += 1
+        return subscription
+
+    def unsubscribe(self, subscription):
+        """Returns the number of clients left"""
+        with self.lock:
+            self.subscriptions[subscription] -= 1
+            if self.subscriptions[subscription] <= 0:
+                del self.subscriptions[subscription]
+            return sum(self.subscriptions.values())
+
+    def set_face_gallery(self, face_gallery):
+        with self.lock:
+            self.face_gallery = face_gallery
+
+    def set_camera_zones(self, camera_zones):
+        """Restricts motion and face detection to the camera's zones"""
+        self.camera_zones = camera_zones
+        self.motion_detector.set_zones(camera_zones)
+
+    def set_blacklist(self, blacklist):
+        """Enables the blacklist checks with the TenantBlacklist of the camera's tenant"""
+        self.blacklist_engine = BlacklistEngine(blacklist, cooldown=float(os.getenv("BLACKLIST_ALERT_COOLDOWN", 60)))
+
+    def set_ppe_ids(self, ppe_ids):
+        """Stores the PPE seen on the employees with their presence intervals"""
+        self.presence.set_ppe_ids(ppe_ids)
+
+    def set_screenshots_path(self, screenshots_path):
+        self.screenshots_path = screenshots_path
+
+    def get_active_filters(self):
+        """Union of the filters requested by the subscribed clients"""
+        with self.lock:
+            return frozenset().union(*(filters for filters, _ in self.subscriptions))
+
+    def get_stats(self):
+        return {
+            "capture": {"frames": self.frames_captured, "dropped": self.frames_failed},
+            "analysis": {"frames": self.frames_analyzed, "dropped": self.analysis_slot.dropped,
+                         "schedule": get_analysis_scheduler().get_stats([self])["cameras"],
+                         "motion": self.motion_detector.get_stats(),
+                         "person_detection": {"frames": self.person_passes,
+                                              "without_persons": self.frames_without_persons}},
+            # Captured frames published to the clients, how many were encoded and how many nobody pulled
+            "encode": {**self.hub.get_stats(), "variants": dict(self.variants_encoded)},
+            "face_tracking": self.face_tracker.get_stats(),
+            "blacklist": self.blacklist_engine.get_stats() if self.blacklist_engine is not None else None,
+            "ppe": self.ppe_monitor.get_stats(),
+            "presence": self.presence.get_stats(),
+            "subscriptions": [{"filters": sorted(filters), "variant": variant, "clients": clients}
+                              for (filters, variant), clients in self.subscriptions.items()]
+        }
+
+    def _capture_frames(self):
+        cap = cv.VideoCapture(self.rtsp_url)
+        # Reduced buffer size: solution 1
+        cap.set(cv.CAP_PROP_BUFFERSIZE, 2)
+        if not cap.isOpened():
+            print(f"Could not open stream for camera: {self.camera_name}")
+            self.stop()
+            return
+
+        while self.running:
+            success, frame = cap.read()
+            if not success:
+                self.frames_failed += 1
+                print(f"Failed to read frame for camera {self.camera_name}")
+                continue
+
+            self.frames_captured += 1
+            self.analysis_slot.put(frame)
+            with self.lock:
+                results = self.results
+            self.hub.publish((frame, results))
+
+        cap.release()
+        print(f"Camera stream for {self.camera_name} has stopped")
+
+    def _analyze_frames(self):
+        print(f"CUDA available: {dlib.DLIB_USE_CUDA}")
+        scheduler = get_analysis_scheduler()
+
+        while self.running:
+            delay = scheduler.time_until_due(self)
+            if delay > 0:
+                # Frames captured meanwhile are overwritten in the slot, the next pass gets the newest one
+                time.sleep(min(delay, 1))
+                continue
+
+            frame = self.analysis_slot.take(timeout=1)
+            if frame is None:
+                continue
+
+            filters = self.get_active_filters()
+            if not filters:
+                continue
+
+            if not self.motion_detector.should_analyze(frame):
+                # Nothing moved, the results of the last pass are still valid
+                scheduler.skip(self)
+                continue
+
+            started = time.monotonic()
+            results = {}
+            with self.lock:
+                face_gallery = self.face_gallery
+            # The gallery picks up employee changes made since the last frame
+            recognize_faces = FACE_RECOGNITION in filters and face_gallery is not None and len(face_gallery) > 0
+            persons = None
+            if PERSON_DETECTION in filters or PPE_RECOGNITION in filters or (recognize_faces and self.person_gating):
+                persons = self._detect_persons(frame)
+
+            if recognize_faces:
+                try:
+                    results[FACE_RECOGNITION] = face_recognition_impl.recognize_faces(
+                        frame, face_gallery, self.face_tracker, self.face_detection_mode,
+                        self._get_face_regions(frame, persons))
+                    self._check_blacklist(frame, results[FACE_RECOGNITION])
+                except Exception as e:
+                    print(f"Error in face recognition: {e}")
+
+            if persons is not None:
+                ppe_recognition_impl.assign_faces(persons, results.get(FACE_RECOGNITION))
+                if PERSON_DETECTION in filters:
+                    results[PERSON_DETECTION] = persons
+                if PPE_RECOGNITION in filters:
+                    results[PPE_RECOGNITION] = persons
+                    self._check_ppe(frame, persons)
+
+            with self.lock:
+                self.results = results
+            self.frames_analyzed += 1
+            scheduler.report(self, time.monotonic() - started)
+            self._record_presence(frame, results.get(FACE_RECOGNITION), results.get(PPE_RECOGNITION))
+            if self.pending_alerts:
+                self._attach_screenshot(self._get_screenshot(frame, results))
+
+        self._save_presence(self.presence.close_all())
+        self._attach_screenshot(None)
+
+    def _check_blacklist(self, frame, faces):
+        if self.blacklist_engine is None or self.tenant_id is None:
+            return
+        violations = self.blacklist_engine.check(frame, faces, self.camera_zones)
+        if not violations:
+            return
+        self._raise_alerts([AlertService.create_unauthorized_alert(employee_id, name, zone_id, self.camera_name)
+                            for employee_id, name, zone_id in violations])
+
+    def _detect_persons(self, frame):
+        """
+        Persons on the frame with the PPE found on them, from a single pass of the PPE model.
+        None when the model is not available
+        """
+        try:
+            service = get_ppe_recognition_service()
+        except Exception as e:
+            if self.person_detection_available:
+                print(f"Person detection is disabled for camera {self.camera_name}: {e}")
+                self.person_detection_available = False
+            return None
+        try:
+            persons = ppe_recognition_impl.group_by_person(service.detect(frame).result())
+        except Exception as e:
+            print(f"Error in person detection: {e}")
+            return None
+        self.person_passes += 1
+        if not any(person.is_person for person in persons):
+            self.frames_without_persons += 1
+        return persons
+
+    def _get_face_regions(self, frame, persons):
+        """
+        Regions of the downscaled frame the faces are detected in: the heads of the detected persons
+        inside the zones, or the zones when persons were not detected. None for the whole frame
+        """
+        roi = self._get_roi(frame)
+        if persons is None or not self.person_gating:
+            return [roi] if roi is not None else None
+        return person_detection.get_face_regions(persons, face_recognition_impl.get_analysis_size(frame),
+                                                 face_recognition_impl.ANALYSIS_SCALE, roi)
+
+    def _check_ppe(self, frame, persons):
+        if self.tenant_id is None:
+            return
+        violations = self.ppe_monitor.check(persons, self._get_zones(frame))
+        self._raise_alerts([AlertService.create_missing_ppe_alert(ALERT_TYPES[kind], PPE_NAMES[kind], employee_id,
+                                                                  name, zone_id, self.camera_name)
+                            for kind, employee_id, name, zone_id in violations])
+
+    def _raise_alerts(self, alerts):
+        if not alerts:
+            return
+        if self.screenshots_path is None:
+            self._save_alerts(alerts)
+            return
+        with self.lock:
+            self.pending_alerts.extend(alerts)
+
+    def _save_alerts(self, alerts, screenshot=None):
+        for alert in alerts:
+            alert.screenshot = screenshot
+        try:
+            AlertService.save_alerts(self.tenant_id, alerts)
+        except Exception as e:
+            print(f"Could not save the alerts of camera {self.camera_name}: {e}")
+
+    def _get_screenshot(self, frame, results):
+        """
+        JPEG of the frame that raised the alerts with every overlay, from the stream when a client
+        already pulled the frame in full size, else a function the screenshot writer encodes it with
+        """
+        latest = self.hub.get_latest((frozenset(OVERLAYS), JpegLadder.DEFAULT_VARIANT))
+        if latest is not None:
+            (published_frame, _), jpeg = latest
+            if published_frame is frame and jpeg is not None:
+                return jpeg
+        overlays = frozenset(f for f in OVERLAYS if results.get(f))
+        return lambda: self._encode((frame, results), (overlays, JpegLadder.DEFAULT_VARIANT))
+
+    def _attach_screenshot(self, jpeg):
+        """Hands the screenshot of the pending alerts (see ScreenshotWriter.submit) to the screenshot writers"""
+        with self.lock:
+            alerts, self.pending_alerts = self.pending_alerts, []
+        if not alerts:
+            return
+        if jpeg is None or not get_screenshot_writer().submit(
+                jpeg, self.screenshots_path, lambda path: self._save_alerts(alerts, path)):
+            # The alerts matter more than their screenshot
+            self._save_alerts(alerts)
+
+    def _record_presence(self, frame, faces, persons=None):
+        if faces:
+            zones = self._get_zones(frame)
+            sightings = []
+            for location, employee_id, _ in faces:
+                if employee_id is None:
+                    continue
+                zone_ids = zones.zones_at_location(location, face_recognition_impl.ANALYSIS_SCALE) if zones else []
+                sightings.extend((employee_id, zone_id) for zone_id in zone_ids or [None])
+            # PPE seen on the recognized employees, counted in the interval of the zone they stand in
+            ppe = {}
+            for person in persons or []:
+                if person.employee_id is not None:
+                    for zone_id in get_person_zones(zones, person) or [None]:
+                        ppe[(person.employee_id, zone_id)] = {kind: worn for kind, (worn, _) in person.ppe.items()}
+            closed = self.presence.update(sightings, ppe=ppe)
+        else:
+            closed = self.presence.close_expired()
+        self._save_presence(closed)
+
+    def _save_presence(self, intervals):
+        if intervals and self.tenant_id is not None and self.camera_id is not None:
+            get_write_buffer(self.tenant_id).put(intervals)
+
+    def _get_zones(self, frame):
+        """PreparedZones at the face detection resolution, None when the camera has no zones"""
+        if self.camera_zones is None:
+            return None
+        return self.camera_zones.prepare(*face_recognition_impl.get_analysis_size(frame))
+
+    def _get_roi(self, frame):
+        """Bounding box of the zones at the face detection resolution, None for the whole frame"""
+        zones = self._get_zones(frame)
+        return zones.roi if zones is not None else None
+
+    def _get_cache_key(self, published, subscription):
+        """Subscribers whose filters draw the same overlays on a frame share its encoding"""
+        _, results = published
+        filters, variant = subscription
+        return frozenset(f for f in filters if f in OVERLAYS and results.get(f)), variant
+
+    def _encode(self, published, cache_key):
+        """JPEG of a published frame with the overlays of cache_key drawn, in its variant"""
+        frame, results = published
+        overlays, variant = cache_key
+        jpeg = JpegLadder.encode(self._render(frame, overlays, results), variant)
+        if jpeg is None:
+            print(f"Failed to encode frame for camera: {self.camera_name}")
+            return None
+        with self.lock:
+            self.variants_encoded[variant] += 1
+        return jpeg
+
+    def _render(self, frame, overlays, results):
+        if overlays:
+            # The analysis stage and other clients may still be reading the captured frame
+            frame = frame.copy()
+            for overlay in overlays:
+                OVERLAYS[overlay](frame, results[overlay])
+        return frame
@@ -0,0 +1,168 @@
+from collections import defaultdict
+from datetime import datetime, timedelta
+from sqlalchemy import and_, delete, func, or_, select, text
+from flaskr.entities.DetectionRollup import DetectionRollup, RollupGranularity
+from flaskr.entities.PersonDetected import PersonDetected
+from flaskr.services.PresenceSessionizer import get_max_interval_duration, get_interval_gap
+
+MINUTE = RollupGranularity.MINUTE
+HOUR = RollupGranularity.HOUR
+DAY = RollupGranularity.DAY
+# Coarsest first
+GRANULARITIES = (DAY, HOUR, MINUTE)
+
+# Rows per upsert statement, keeps the number of bound parameters low
+UPSERT_CHUNK = 1000
+
+
+def bucket_start(time: datetime, granularity):
+    if granularity == MINUTE:
+        return time.replace(second=0, microsecond=0)
+    if granularity == HOUR:
+        return time.replace(minute=0, second=0, microsecond=0)
+    return time.replace(hour=0, minute=0, second=0, microsecond=0)
+
+def next_bucket(time: datetime, granularity):
+    if granularity == MINUTE:
+        return time + timedelta(minutes=1)
+    if granularity == HOUR:
+        return time + timedelta(hours=1)
+    return time + timedelta(days=1)
+
+def aggregate(intervals):
+    """
+    Rollup counters of presence intervals, (granularity, bucket start, camera id, zone id): [detections, frames, seconds].
+    An interval counts as a detection in the bucket it started in, its duration is split over the buckets it spans
+    """
+    counters = defaultdict(lambda: [0, 0, 0.0])
+    for interval in intervals:
+        zone_id = interval.zone_id or 0
+        for granularity in GRANULARITIES:
+            start = bucket_start(interval.detected_at, granularity)
+            counter = counters[(granularity, start, interval.video_camera_id, zone_id)]
+            counter[0] += 1
+            counter[1] += interval.frame_count or 0
+
+            while start < interval.ended_at:
+                end = next_bucket(start, granularity)
+                overlap = min(end, interval.ended_at) - max(start, interval.detected_at)
+                counters[(granularity, start, interval.video_camera_id, zone_id)][2] += overlap.total_seconds()
+                start = end
+    return counters
+
+def _insert(session):
+    dialect = session.get_bind().dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        raise NotImplementedError(f"Rollups need INSERT ... ON CONFLICT, not supported for {dialect}")
+    return insert(DetectionRollup)
+
+def update_rollups(session, intervals):
+    """Adds stored presence intervals to the rollups, in the transaction that stores them"""
+    counters = aggregate(intervals)
+    rows = [{
+        "granularity": granularity, "bucket_start": start, "video_camera_id": camera_id, "zone_id": zone_id,
+        "detections": detections, "frames": frames, "presence_seconds": seconds
+    } for (granularity, start, camera_id, zone_id), (detections, frames, seconds) in counters.items()]
+
+    for index in range(0, len(rows), UPSERT_CHUNK):
+        statement = _insert(session).values(rows[index:index + UPSERT_CHUNK])
+        statement = statement.on_conflict_do_update(
+            index_elements=["granularity", "bucket_start", "video_camera_id", "zone_id"],
+            set_={
+                "detections": DetectionRollup.detections + statement.excluded.detections,
+                "frames": DetectionRollup.frames + statement.excluded.frames,
+                "presence_seconds": DetectionRollup.presence_seconds + statement.excluded.presence_seconds
+            }
+        )
+        session.execute(statement)
+
+def backfill(session, chunk_size=5000):
+    """
+    Rebuilds the rollups from the stored presence intervals, returns the number of intervals.
+    Safe while the server writes: the rollups are locked against writes for the whole rebuild.
+    A write buffer flush committed before the lock is rebuilt from its intervals, one that has not
+    committed yet waits on its rollup upsert until the rebuild commits and adds its own intervals then.
+    PostgreSQL takes an EXCLUSIVE lock (reads go on), SQLite's delete takes the database write lock
+    """
+    if session.get_bind().dialect.name == "postgresql":
+        session.execute(text(f"LOCK TABLE {DetectionRollup.__tablename__} IN EXCLUSIVE MODE"))
+    session.execute(delete(DetectionRollup))
+    count = 0
+    intervals = []
+    for interval in session.scalars(select(PersonDetected).execution_options(yield_per=chunk_size)):
+        intervals.append(interval)
+        if len(intervals) >= chunk_size:
+            update_rollups(session, intervals)
+            count += len(intervals)
+            intervals = []
+    update_rollups(session, intervals)
+    session.commit()
+    return count + len(intervals)
+
+def get_complete_before(now=None):
+    """
+    Buckets starting before this time are final. Intervals are rolled up when they close, up to
+    PRESENCE_GAP after the last sighting or PRESENCE_MAX_DURATION after they started, and count
+    as a detection in their starting bucket: newer buckets still grow as open intervals close
+    """
+    now = now or datetime.now()
+    return now - timedelta(seconds=get_max_interval_duration() + get_interval_gap())
+
+def plan_buckets(start, end, granularities=GRANULARITIES):
+    """
+    Splits [start, end) into (granularity, from, to) ranges that use the coarsest
+    buckets fully inside the range, finer ones only on its edges.
+    Minutes are the finest buckets, partial minutes at the edges are counted whole
+    """
+    granularity, finer = granularities[0], granularities[1:]
+    if not finer:
+        return [(granularity, bucket_start(start, granularity), end)] if start < end else []
+
+    inner_start = bucket_start(start, granularity)
+    if inner_start < start:
+        inner_start = next_bucket(inner_start, granularity)
+    inner_end = bucket_start(end, granularity)
+    if inner_start >= inner_end:
+        return plan_buckets(start, end, finer)
+    return plan_buckets(start, inner_start, finer) + [(granularity, inner_start, inner_end)] \
+        + plan_buckets(inner_end, end, finer)
+
+def _filters(camera_id, zone_id):
+    filters = []
+    if camera_id is not None:
+        filters.append(DetectionRollup.video_camera_id == camera_id)
+    if zone_id is not None:
+        filters.append(DetectionRollup.zone_id == zone_id)
+    return filters
+
+def _sums():
+    return (func.sum(DetectionRollup.detections).label("detections"),
+            func.sum(DetectionRollup.frames).label("frames"),
+            func.sum(DetectionRollup.presence_seconds).label("presence_seconds"))
+
+def query_totals(session, start, end, camera_id=None, zone_id=None):
+    """Totals per camera and zone over [start, end), read from the coarsest buckets that fit"""
+    plan = plan_buckets(start, end)
+    if not plan:
+        return []
+    ranges = or_(*[and_(DetectionRollup.granularity == granularity, DetectionRollup.bucket_start >= range_start,
+                        DetectionRollup.bucket_start < range_end)
+                   for granularity, range_start, range_end in plan])
+    query = select(DetectionRollup.video_camera_id, DetectionRollup.zone_id, *_sums()) \
+        .where(ranges, *_filters(camera_id, zone_id)) \
+        .group_by(DetectionRollup.video_camera_id, DetectionRollup.zone_id)
+    return session.execute(query).all()
+
+def query_series(session, start, end, granularity, camera_id=None, zone_id=None):
+    """Counters per bucket, camera and zone over [start, end) at one granularity"""
+    query = select(DetectionRollup.bucket_start, DetectionRollup.video_camera_id, DetectionRollup.zone_id, *_sums()) \
+        .where(DetectionRollup.granularity == granularity,
+               DetectionRollup.bucket_start >= bucket_start(start, granularity),
+               DetectionRollup.bucket_start < end, *_filters(camera_id, zone_id)) \
+        .group_by(DetectionRollup.bucket_start, DetectionRollup.video_camera_id, DetectionRollup.zone_id) \
+        .order_by(DetectionRollup.bucket_start)
+    return session.execute(query).all()
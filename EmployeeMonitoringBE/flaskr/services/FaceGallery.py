@@ -0,0 +1,140 @@
+import io
+import os
+from threading import Lock
+import numpy as np
+from flaskr.entities.Employee import Employee
+from flaskr.ML.face_recognition.face_matcher import FaceMatcher
+from flaskr.ML.face_recognition.ann_index import ANNIndex
+
+UNKNOWN_FACE = "Unknown"
+
+
+class GallerySnapshot:
+    """Immutable view of a gallery, employee_ids and names are parallel to the matcher's gallery"""
+
+    def __init__(self, version, employee_ids, names, encodings):
+        self.version = version
+        self.employee_ids = employee_ids
+        self.names = names
+        self.matcher = FaceMatcher(encodings)
+
+    def identify(self, face_encodings):
+        best_match_indices, _ = self.matcher.match(face_encodings)
+        return [(self.employee_ids[index], self.names[index]) if index >= 0 else (None, UNKNOWN_FACE)
+                for index in best_match_indices]
+
+
+class FaceGallery:
+    """
+    Decoded face encodings of the employees of one tenant.
+    Changes are applied incrementally: only the changed employee is decoded,
+    and the matcher is rebuilt lazily the next time a camera asks for a snapshot,
+    so running cameras pick up new employees without restarting.
+
+    Large galleries can use an ANNIndex instead, which is updated in place on
+    every change instead of being rebuilt.
+    """
+
+    def __init__(self, ann_index: ANNIndex = None):
+        self.lock = Lock()
+        self.version = 0
+        self.ann_index = ann_index
+        self._employees = {}  # employee id: (name, encoding)
+        self._snapshot = GallerySnapshot(0, [], [], [])
+
+    def load(self, employees):
+        employees = {employee.id: (get_employee_name(employee), decode_face(employee.encodedFace))
+                     for employee in employees if employee.encodedFace}
+        with self.lock:
+            self._employees = employees
+            self.version += 1
+            if self.ann_index is not None:
+                for employee_id, (_, encoding) in employees.items():
+                    self.ann_index.add(employee_id, encoding)
+
+    def upsert_employee(self, employee_id, name, encoding):
+        with self.lock:
+            self._employees[employee_id] = (name, np.asarray(encoding, dtype=np.float32))
+            self.version += 1
+            if self.ann_index is not None:
+                self.ann_index.add(employee_id, encoding)
+
+    def remove_employee(self, employee_id):
+        with self.lock:
+            if self._employees.pop(employee_id, None) is not None:
+                self.version += 1
+                if self.ann_index is not None:
+                    self.ann_index.remove(employee_id)
+
+    def identify(self, face_encodings):
+        """Returns (employee_id, name) for every face, (None, "Unknown") for the unknown ones"""
+        if self.ann_index is None:
+            return self.snapshot().identify(face_encodings)
+
+        employee_ids, _ = self.ann_index.search(face_encodings)
+        with self.lock:
+            employees = self._employees
+            return [(employee_id, employees[employee_id][0]) if employee_id in employees else (None, UNKNOWN_FACE)
+                    for employee_id in employee_ids]
+
+    def snapshot(self) -> GallerySnapshot:
+        with self.lock:
+            if self._snapshot.version != self.version:
+                employee_ids = list(self._employees)
+                names = [name for name, _ in self._employees.values()]
+                encodings = [encoding for _, encoding in self._employees.values()]
+                self._snapshot = GallerySnapshot(self.version, employee_ids, names, encodings)
+            return self._snapshot
+
+    def __len__(self):
+        return len(self._employees)
+
+
+def get_employee_name(employee):
+    return f"{employee.firstName} {employee.lastName}"
+
+def decode_face(encoded_face):
+    return np.load(io.BytesIO(encoded_face)).astype(np.float32)
+
+
+def create_ann_index():
+    """
+    The ANN index is enabled with FACE_ANN_INDEX=true, FACE_ANN_NPROBE trades recall for latency
+    and galleries smaller than FACE_ANN_EXACT_THRESHOLD are still searched exactly
+    """
+    if os.getenv("FACE_ANN_INDEX", "false").lower() in ("false", "0"):
+        return None
+    return ANNIndex(nprobe=int(os.getenv("FACE_ANN_NPROBE", 8)),
+                    exact_threshold=int(os.getenv("FACE_ANN_EXACT_THRESHOLD", 5000)))
+
+
+# Process wide cache, tenant_id: FaceGallery
+face_galleries = {}
+face_galleries_lock = Lock()
+
+def get_face_gallery(db, tenant_id) -> FaceGallery:
+    """Returns the gallery of the tenant, loading it from the tenant database on first use"""
+    with face_galleries_lock:
+        gallery = face_galleries.get(tenant_id)
+        if gallery is None:
+            # Loaded under the registry lock so employee changes made meanwhile are applied after the load
+            employees = db.query(Employee).filter(Employee.encodedFace.isnot(None)).all()
+            gallery = FaceGallery(create_ann_index())
+            gallery.load(employees)
+            face_galleries[tenant_id] = gallery
+            print(f"Loaded {len(gallery)} face encodings for tenant {tenant_id}")
+        return gallery
+
+def upsert_employee(tenant_id, employee, encoding):
+    """Applies a created or updated employee to the tenant's gallery if it was loaded"""
+    with face_galleries_lock:
+        gallery = face_galleries.get(tenant_id)
+    if gallery is not None:
+        gallery.upsert_employee(employee.id, get_employee_name(employee), encoding)
+
+def remove_employee(tenant_id, employee_id):
+    """Removes a deleted employee from the tenant's gallery if it was loaded"""
+    with face_galleries_lock:
+        gallery = face_galleries.get(tenant_id)
+    if gallery is not None:
+        gallery.remove_employee(employee_id)
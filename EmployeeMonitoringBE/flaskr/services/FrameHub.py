@@ -0,0 +1,130 @@
+from threading import Condition
+
+
+class FrameHub:
+    """
+    Fan-out of the frames of one camera to its clients.
+    Every published frame gets a monotonically increasing sequence number,
+    clients block until a frame newer than the last one they sent exists
+    so they are woken as soon as it is published and never get a duplicate.
+
+    Only the raw latest frame is kept. It is encoded when a client pulls it,
+    by the client's own thread, with encode(frame, cache_key). cache_key(frame, key)
+    maps the key a client asked with to the encoding it needs, clients with the same
+    cache key share one encoding of a sequence and wait while another one is encoding it.
+    Frames replaced before any client pulled them are never encoded.
+
+    Listeners are called without arguments after every publish and on close, from the
+    publishing thread, they let asyncio clients (AsyncFrameFeed) wait without a thread.
+    """
+
+    def __init__(self, encode, cache_key=lambda frame, key: key):
+        self._encode = encode
+        self._cache_key = cache_key
+        self._condition = Condition()
+        self._sequence = 0
+        self._frame = None  # Raw frame of the latest sequence
+        self._encoded = {}  # cache key: encoded frame of the latest sequence
+        self._encoding = set()  # cache keys of the latest sequence being encoded
+        self._closed = False
+        self._listeners = []
+
+        self.frames_encoded = 0  # Sequences encoded at least once
+        self.encodings = 0
+
+    @property
+    def sequence(self):
+        return self._sequence
+
+    @property
+    def closed(self):
+        return self._closed
+
+    def add_listener(self, listener):
+        with self._condition:
+            self._listeners.append(listener)
+
+    def remove_listener(self, listener):
+        with self._condition:
+            self._listeners.remove(listener)
+
+    def publish(self, frame):
+        """Publish a raw frame, it replaces the previous one"""
+        with self._condition:
+            self._sequence += 1
+            self._frame = frame
+            self._encoded = {}
+            self._encoding = set()
+            self._condition.notify_all()
+            listeners = list(self._listeners)
+        for listener in listeners:
+            listener()
+
+    def get_encoded(self, key, after_sequence):
+        """(sequence, frame) when the latest frame is newer than after_sequence and already encoded for key, else None"""
+        with self._condition:
+            if self._sequence <= after_sequence:
+                return None
+            cache_key = self._cache_key(self._frame, key)
+            if cache_key not in self._encoded:
+                return None
+            return self._sequence, self._encoded[cache_key]
+
+    def get_latest(self, key):
+        """(raw frame, its encoding for key or None) of the latest sequence without encoding it, None before the first publish"""
+        with self._condition:
+            if self._sequence == 0:
+                return None
+            return self._frame, self._encoded.get(self._cache_key(self._frame, key))
+
+    def wait_for_frame(self, key, after_sequence, timeout=None):
+        """
+        Wait for a frame newer than after_sequence and return it encoded for key.
+        Returns (sequence, frame), frame is None on timeout, when the hub was closed
+        or when the frame could not be encoded.
+        """
+        with self._condition:
+            if not self._condition.wait_for(lambda: self._closed or self._sequence > after_sequence, timeout) \
+                    or self._closed:
+                return after_sequence, None
+            while True:
+                sequence, frame = self._sequence, self._frame
+                cache_key = self._cache_key(frame, key)
+                if cache_key in self._encoded:
+                    return sequence, self._encoded[cache_key]
+                if cache_key not in self._encoding:
+                    break
+                # Another client is encoding it, woken when it is done or a newer frame is published
+                self._condition.wait()
+                if self._closed:
+                    return after_sequence, None
+            if not self._encoded and not self._encoding:
+                self.frames_encoded += 1
+            self._encoding.add(cache_key)
+
+        encoded = None
+        try:
+            encoded = self._encode(frame, cache_key)
+        except Exception as e:
+            print(f"Failed to encode frame {sequence}: {e}")
+        with self._condition:
+            if self._sequence == sequence:
+                # A failed encoding is kept too so it is not retried for this sequence
+                self._encoding.discard(cache_key)
+                self._encoded[cache_key] = encoded
+            self.encodings += 1
+            self._condition.notify_all()
+        return sequence, encoded
+
+    def get_stats(self):
+        with self._condition:
+            return {"published": self._sequence, "encoded": self.frames_encoded,
+                    "skipped": self._sequence - self.frames_encoded, "encodings": self.encodings}
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+            listeners = list(self._listeners)
+        for listener in listeners:
+            listener()
@@ -0,0 +1,23 @@
+import cv2 as cv
+
+# Variants a client can watch a camera in, name: (maximum width, JPEG quality).
+# Frames are never upscaled, full keeps the captured size at OpenCV's default quality
+VARIANTS = {
+    "full": (None, 95),
+    "high": (1280, 80),
+    "medium": (854, 70),
+    "low": (480, 60),
+}
+DEFAULT_VARIANT = "full"
+
+
+def encode(frame, variant):
+    """JPEG bytes of a BGR frame in the given variant, None when encoding failed"""
+    max_width, quality = VARIANTS[variant]
+    if max_width is not None and frame.shape[1] > max_width:
+        height = max(int(frame.shape[0] * max_width / frame.shape[1]), 1)
+        frame = cv.resize(frame, (max_width, height), interpolation=cv.INTER_AREA)
+    success, jpeg_frame = cv.imencode(".jpg", frame, [cv.IMWRITE_JPEG_QUALITY, quality])
+    if not success:
+        return None
+    return jpeg_frame.tobytes()
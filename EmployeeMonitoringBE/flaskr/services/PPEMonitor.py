@@ -0,0 +1,82 @@
+import time
+from flaskr.entities.PPE import PPE
+from flaskr.entities.Alert import AlertType
+from flaskr.ML.face_recognition.face_recognition_impl import ANALYSIS_SCALE
+from flaskr.ML.ppe_recognition.ppe_recognition_impl import HELMET, MASK, VEST
+
+# Name of the PPE rows the recognitions reference
+PPE_NAMES = {HELMET: "Helmet", MASK: "Mask", VEST: "Safety vest"}
+
+ALERT_TYPES = {
+    HELMET: AlertType.NO_HELMET_DETECTED,
+    MASK: AlertType.NO_MASK_DETECTED,
+    VEST: AlertType.NO_VEST_DETECTED,
+}
+
+
+def get_ppe_ids(db):
+    """PPE kind: id of its PPE row, the missing rows are created"""
+    ppes = {ppe.name: ppe for ppe in db.query(PPE).filter(PPE.name.in_(PPE_NAMES.values())).all()}
+    created = False
+    for name in PPE_NAMES.values():
+        if name not in ppes:
+            ppes[name] = PPE(name=name)
+            db.add(ppes[name])
+            created = True
+    if created:
+        db.commit()
+    return {kind: ppes[name].id for kind, name in PPE_NAMES.items()}
+
+def get_person_zones(zones, person):
+    """
+    Ids of the zones a person stands in, from the point under their feet.
+    zones are the PreparedZones at the face detection resolution, None when the camera has none
+    """
+    if zones is None:
+        return []
+    x1, _, x2, y2 = person.box
+    return zones.zones_at_location((y2, x2, y2, x1), ANALYSIS_SCALE)
+
+
+class PPEMonitor:
+    """
+    Finds the persons seen by one camera without their PPE.
+    The same person (employee, or any unknown person) missing the same PPE
+    in the same zone is reported at most once per cooldown seconds.
+    """
+
+    def __init__(self, cooldown=60.0):
+        self.cooldown = cooldown
+        self._last_reported = {}  # (employee_id, zone_id, PPE kind): monotonic time of the last violation
+
+        self.checked_persons = 0
+        self.violations = 0
+
+    def check(self, persons, zones):
+        """
+        persons are PersonPPE's of ppe_recognition_impl.group_by_person.
+        Returns (PPE kind, employee_id, name, zone_id) for every new violation
+        """
+        now = time.monotonic()
+        violations = []
+        for person in persons:
+            self.checked_persons += 1
+            missing = person.missing()
+            if not missing:
+                continue
+            for zone_id in get_person_zones(zones, person) or [None]:
+                for kind in missing:
+                    key = (person.employee_id, zone_id, kind)
+                    if now - self._last_reported.get(key, -self.cooldown) < self.cooldown:
+                        continue
+                    self._last_reported[key] = now
+                    violations.append((kind, person.employee_id, person.name, zone_id))
+
+        if len(self._last_reported) > 1000:
+            self._last_reported = {key: reported for key, reported in self._last_reported.items()
+                                   if now - reported < self.cooldown}
+        self.violations += len(violations)
+        return violations
+
+    def get_stats(self):
+        return {"checked_persons": self.checked_persons, "violations": self.violations}
@@ -0,0 +1,82 @@
+import base64
+import json
+from datetime import datetime
+from sqlalchemy import tuple_
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+
+class PaginationError(Exception):
+    pass
+
+
+def encode_cursor(values):
+    """Opaque cursor of the sort key of the last row of a page"""
+    values = [value.isoformat() if isinstance(value, datetime) else value for value in values]
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+def decode_cursor(cursor, columns):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if not isinstance(values, list) or len(values) != len(columns):
+            raise ValueError("Wrong number of values")
+        return [datetime.fromisoformat(value) if column.type.python_type is datetime else value
+                for value, column in zip(values, columns)]
+    except (ValueError, TypeError, UnicodeError) as e:
+        raise PaginationError("Invalid cursor") from e
+
+def get_page_size(args):
+    try:
+        limit = int(args.get("limit", DEFAULT_PAGE_SIZE))
+    except ValueError:
+        raise PaginationError("limit must be a number")
+    if limit < 1:
+        raise PaginationError("limit must be positive")
+    return min(limit, MAX_PAGE_SIZE)
+
+def parse_datetime(args, name):
+    if name not in args:
+        return None
+    try:
+        return datetime.fromisoformat(args[name])
+    except ValueError:
+        raise PaginationError(f"{name} must be an ISO datetime")
+
+def parse_int(args, name):
+    if name not in args:
+        return None
+    try:
+        return int(args[name])
+    except ValueError:
+        raise PaginationError(f"{name} must be a number")
+
+def parse_enum(args, name, enum):
+    if name not in args:
+        return None
+    try:
+        return enum(args[name])
+    except ValueError:
+        raise PaginationError(f"{name} must be one of {', '.join(member.value for member in enum)}")
+
+def paginate(query, columns, args, descending=True):
+    """
+    Keyset pagination: rows are ordered by columns (the last one unique, e.g. the id)
+    and a page starts after the sort key of the last row of the previous page,
+    so a deep page costs the same index range scan as the first one.
+    Returns (rows, next_cursor), next_cursor is None on the last page
+    """
+    limit = get_page_size(args)
+    cursor = args.get("cursor")
+    if cursor:
+        key = tuple_(*columns)
+        values = tuple_(*decode_cursor(cursor, columns))
+        query = query.filter(key < values if descending else key > values)
+
+    query = query.order_by(*[column.desc() if descending else column.asc() for column in columns])
+    # One extra row tells if there is a next page
+    rows = query.limit(limit + 1).all()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor([getattr(rows[-1], column.key) for column in columns])
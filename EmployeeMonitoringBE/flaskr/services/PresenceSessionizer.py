@@ -0,0 +1,128 @@
+import os
+from datetime import datetime, timedelta
+from threading import Lock
+from flaskr.entities.PersonDetected import PersonDetected
+from flaskr.entities.PPERecognition import PPERecognition
+
+
+def get_max_interval_duration():
+    """Seconds after which an open interval is closed and a new one opened, PRESENCE_MAX_DURATION"""
+    return float(os.getenv("PRESENCE_MAX_DURATION", 3600))
+
+def get_interval_gap():
+    """Seconds without a sighting after which an interval is closed, PRESENCE_GAP"""
+    return float(os.getenv("PRESENCE_GAP", 30))
+
+
+class PresenceInterval:
+    def __init__(self, employee_id, zone_id, started_at):
+        self.employee_id = employee_id
+        self.zone_id = zone_id
+        self.started_at = started_at
+        self.last_seen = started_at
+        self.frames = 1
+        self.ppe = {}  # PPE kind: [worn frames, missing frames]
+
+    def observe_ppe(self, ppe):
+        for kind, worn in ppe.items():
+            counts = self.ppe.setdefault(kind, [0, 0])
+            counts[0 if worn else 1] += 1
+
+
+class PresenceSessionizer:
+    """
+    Merges the sightings of the employees recognized by one camera into presence intervals,
+    one per employee and zone they stand in (zone None outside of the camera's zones).
+
+    An interval stays open while the employee keeps being recognized and closes when
+    they were not seen for gap seconds. The gap must be longer than the time the
+    camera may go without analysis (motion keep-alive, scheduler rate) or people
+    standing still would be split into several intervals. Intervals longer than
+    max_duration are closed and a new one is opened, so long presences show up in
+    the database without waiting for the person to leave.
+    Closed intervals are returned as PersonDetected rows to be stored, with a PPERecognition
+    per PPE seen on the employee during the interval once set_ppe_ids was called.
+    """
+
+    def __init__(self, camera_id, gap=30.0, max_duration=3600.0):
+        self.camera_id = camera_id
+        self.gap = timedelta(seconds=gap)
+        self.max_duration = timedelta(seconds=max_duration)
+
+        self.lock = Lock()
+        self.open_intervals = {}  # (employee_id, zone_id): PresenceInterval
+        self.ppe_ids = None  # PPE kind: id of its PPE row
+
+        self.sightings = 0
+        self.closed_intervals = 0
+
+    def set_ppe_ids(self, ppe_ids):
+        self.ppe_ids = ppe_ids
+
+    def update(self, sightings, now=None, ppe=None):
+        """
+        Records the (employee_id, zone_id) pairs recognized on an analyzed frame,
+        returns the intervals that closed.
+        ppe maps the pairs to the PPE seen on the employee, {PPE kind: worn}
+        """
+        now = now or datetime.now()
+        ppe = ppe or {}
+        closed = []
+        with self.lock:
+            for employee_id, zone_id in set(sightings):
+                self.sightings += 1
+                interval = self.open_intervals.get((employee_id, zone_id))
+                if interval is not None and (now - interval.last_seen > self.gap
+                                             or now - interval.started_at > self.max_duration):
+                    closed.append(self._close(interval))
+                    interval = None
+                if interval is None:
+                    interval = PresenceInterval(employee_id, zone_id, now)
+                    self.open_intervals[(employee_id, zone_id)] = interval
+                else:
+                    interval.last_seen = now
+                    interval.frames += 1
+                if (employee_id, zone_id) in ppe:
+                    interval.observe_ppe(ppe[(employee_id, zone_id)])
+            closed.extend(self._close_expired(now))
+        return closed
+
+    def close_expired(self, now=None):
+        """Closes the intervals of the employees not seen for gap seconds"""
+        with self.lock:
+            return self._close_expired(now or datetime.now())
+
+    def close_all(self):
+        """Closes every open interval, e.g. when the camera stops"""
+        with self.lock:
+            closed = [self._close(interval) for interval in self.open_intervals.values()]
+            self.open_intervals = {}
+            return closed
+
+    def get_stats(self):
+        with self.lock:
+            return {"open_intervals": len(self.open_intervals), "closed_intervals": self.closed_intervals,
+                    "sightings": self.sightings}
+
+    def _close_expired(self, now):
+        expired = [interval for interval in self.open_intervals.values() if now - interval.last_seen > self.gap]
+        for interval in expired:
+            del self.open_intervals[(interval.employee_id, interval.zone_id)]
+        return [self._close(interval) for interval in expired]
+
+    def _close(self, interval):
+        self.closed_intervals += 1
+        person_detected = PersonDetected(
+            detected_at=interval.started_at,
+            ended_at=interval.last_seen,
+            frame_count=interval.frames,
+            employee_id=interval.employee_id,
+            video_camera_id=self.camera_id,
+            zone_id=interval.zone_id
+        )
+        if self.ppe_ids:
+            person_detected.ppe_recognitions = [
+                PPERecognition(ppe_id=self.ppe_ids[kind], worn_frames=worn, missing_frames=missing)
+                for kind, (worn, missing) in interval.ppe.items() if kind in self.ppe_ids
+            ]
+        return person_detected
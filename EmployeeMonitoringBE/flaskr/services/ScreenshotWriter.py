@@ -0,0 +1,119 @@
+import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock, Semaphore, get_ident
+import cv2 as cv
+import numpy as np
+
+THUMBNAIL_WIDTH = 320
+THUMBNAIL_QUALITY = 70
+
+
+def get_thumbnail_path(screenshot_path):
+    return screenshot_path[:-len(".jpg")] + "_thumb.jpg"
+
+
+class ScreenshotWriter:
+    """
+    Stores alert screenshots from a pool of threads so the camera threads never wait for the disk.
+
+    Screenshots are the JPEG bytes the stream already encoded, written as they are,
+    or a function encoding the frame that the writer calls when the stream had not encoded it.
+    Files are content-addressed (<directory>/<sha256[:2]>/<sha256>.jpg) so the same frame
+    attached to several alerts is stored once. The thumbnail is decoded straight at a
+    quarter of the size by the JPEG decoder, then shrunk to THUMBNAIL_WIDTH.
+
+    At most max_pending screenshots wait for a writer, submit refuses the others.
+    """
+
+    def __init__(self, workers=2, max_pending=64):
+        self.executor = ThreadPoolExecutor(workers, thread_name_prefix="screenshot-writer")
+        self._slots = Semaphore(max_pending)
+        self.lock = Lock()
+
+        self.written = 0
+        self.deduplicated = 0
+        self.dropped = 0
+        self.failed = 0
+
+    def submit(self, jpeg, directory, on_done):
+        """
+        Queues JPEG bytes, or a function returning them, to be stored in directory, on_done(path) is called from
+        the writer thread, with None when the screenshot could not be stored.
+        Returns False without calling on_done when too many screenshots are pending
+        """
+        if not self._slots.acquire(blocking=False):
+            with self.lock:
+                self.dropped += 1
+            return False
+        self.executor.submit(self._write, jpeg, directory, on_done)
+        return True
+
+    def store(self, jpeg, directory):
+        digest = hashlib.sha256(jpeg).hexdigest()
+        folder = os.path.join(directory, digest[:2])
+        path = os.path.join(folder, f"{digest}.jpg")
+        if os.path.exists(path):
+            with self.lock:
+                self.deduplicated += 1
+            return path
+
+        os.makedirs(folder, exist_ok=True)
+        thumbnail = cv.imdecode(np.frombuffer(jpeg, dtype=np.uint8), cv.IMREAD_REDUCED_COLOR_4)
+        if thumbnail is not None:
+            if thumbnail.shape[1] > THUMBNAIL_WIDTH:
+                height = max(int(thumbnail.shape[0] * THUMBNAIL_WIDTH / thumbnail.shape[1]), 1)
+                thumbnail = cv.resize(thumbnail, (THUMBNAIL_WIDTH, height), interpolation=cv.INTER_AREA)
+            success, thumbnail_jpeg = cv.imencode(".jpg", thumbnail, [cv.IMWRITE_JPEG_QUALITY, THUMBNAIL_QUALITY])
+            if success:
+                self._write_file(get_thumbnail_path(path), thumbnail_jpeg.tobytes())
+        # The screenshot is written last, an existing screenshot always has its thumbnail
+        self._write_file(path, jpeg)
+        with self.lock:
+            self.written += 1
+        return path
+
+    def get_stats(self):
+        with self.lock:
+            return {"written": self.written, "deduplicated": self.deduplicated,
+                    "dropped": self.dropped, "failed": self.failed}
+
+    def _write(self, jpeg, directory, on_done):
+        path = None
+        try:
+            if callable(jpeg):
+                jpeg = jpeg()
+            if jpeg is None:
+                raise ValueError("the frame could not be encoded")
+            path = self.store(jpeg, directory)
+        except Exception as e:
+            with self.lock:
+                self.failed += 1
+            print(f"Failed to store screenshot in {directory}: {e}")
+        finally:
+            self._slots.release()
+        try:
+            on_done(path)
+        except Exception as e:
+            print(f"Error after storing screenshot {path}: {e}")
+
+    @staticmethod
+    def _write_file(path, data):
+        # Written next to the target and renamed so readers never see a partial file
+        temporary_path = f"{path}.{os.getpid()}.{get_ident()}.tmp"
+        with open(temporary_path, "wb") as file:
+            file.write(data)
+        os.replace(temporary_path, path)
+
+
+screenshot_writer = None
+screenshot_writer_lock = Lock()
+def get_screenshot_writer():
+    global screenshot_writer
+    with screenshot_writer_lock:
+        if screenshot_writer == None:
+            screenshot_writer = ScreenshotWriter(
+                workers=int(os.getenv("SCREENSHOT_WRITERS", 2)),
+                max_pending=int(os.getenv("SCREENSHOT_MAX_PENDING", 64))
+            )
+    return screenshot_writer
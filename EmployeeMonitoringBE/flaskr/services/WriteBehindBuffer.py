@@ -0,0 +1,184 @@
+import atexit
+import os
+import time
+from collections import deque
+from threading import Condition, Lock, Thread
+from flaskr.db import get_tenant_session
+from flaskr.entities.PersonDetected import PersonDetected
+from flaskr.entities.Alert import Alert
+from flaskr.services.AlertHub import CREATED, publish_alerts
+from flaskr.services.DetectionRollups import update_rollups
+
+# Exponential moving average weight of the newest flush latency
+LATENCY_SMOOTHING = 0.2
+
+
+class WriteBehindBuffer:
+    """
+    Collects the rows the camera threads of one tenant produce (alerts, detections)
+    and writes them in the background, so a camera never waits for the database.
+
+    A flush starts when batch_size rows are pending or the oldest pending row waited
+    max_delay seconds. Every flush writes one batch in a single transaction, the ORM
+    sends the inserts of a batch as multi row INSERT statements. The presence intervals
+    of the batch are added to the detection rollups in the same transaction.
+    Once committed, the alerts of the batch are broadcast to the tenant's consoles.
+
+    At most max_pending rows are kept in memory. When the database falls behind and
+    the buffer is full, put waits up to put_timeout for room (backpressure on the
+    producers) and then drops the rows it could not queue. Failed flushes are retried
+    max_retries times with a growing delay, the batch is dropped after that.
+    """
+
+    def __init__(self, tenant_id, batch_size=500, max_delay=1.0, max_pending=10000, put_timeout=0.1, max_retries=3):
+        self.tenant_id = tenant_id
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self.max_pending = max_pending
+        self.put_timeout = put_timeout
+        self.max_retries = max_retries
+
+        self._condition = Condition()
+        self._pending = deque()  # (monotonic time queued, row)
+        self._closed = False
+
+        self.rows_written = 0
+        self.rows_dropped = 0
+        self.rows_failed = 0
+        self.batches = 0
+        self.failed_flushes = 0
+        self.flush_latency = None  # Smoothed seconds per flush
+        self.max_flush_latency = 0
+
+        self._flusher = Thread(target=self._flush_rows, daemon=True)
+        self._flusher.start()
+
+    def put(self, rows):
+        """Queues ORM objects to be inserted, returns how many were queued"""
+        queued = 0
+        deadline = time.monotonic() + self.put_timeout
+        with self._condition:
+            for row in rows:
+                while len(self._pending) >= self.max_pending and not self._closed:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+                if len(self._pending) >= self.max_pending or self._closed:
+                    break
+                self._pending.append((time.monotonic(), row))
+                queued += 1
+            self.rows_dropped += len(rows) - queued
+            self._condition.notify_all()
+        if queued < len(rows):
+            print(f"Write buffer of tenant {self.tenant_id} is full, dropped {len(rows) - queued} rows")
+        return queued
+
+    def close(self, timeout=10):
+        """Stops accepting rows and waits until the pending ones are written"""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self._flusher.join(timeout)
+
+    def get_stats(self):
+        with self._condition:
+            return {
+                "tenant": self.tenant_id,
+                "queue_depth": len(self._pending),
+                "max_pending": self.max_pending,
+                "rows_written": self.rows_written,
+                "rows_dropped": self.rows_dropped,
+                "rows_failed": self.rows_failed,
+                "batches": self.batches,
+                "failed_flushes": self.failed_flushes,
+                "flush_latency_ms": round(self.flush_latency * 1000, 1) if self.flush_latency is not None else None,
+                "max_flush_latency_ms": round(self.max_flush_latency * 1000, 1)
+            }
+
+    def _next_batch(self):
+        """Waits for a full batch or the oldest row to be due, returns None once closed and drained"""
+        with self._condition:
+            while True:
+                if self._pending and (self._closed or len(self._pending) >= self.batch_size
+                                      or time.monotonic() - self._pending[0][0] >= self.max_delay):
+                    batch = [self._pending.popleft()[1] for _ in range(min(self.batch_size, len(self._pending)))]
+                    # Producers blocked on a full buffer can continue
+                    self._condition.notify_all()
+                    return batch
+                if self._closed:
+                    return None
+                timeout = self.max_delay - (time.monotonic() - self._pending[0][0]) if self._pending else None
+                self._condition.wait(timeout)
+
+    def _flush_rows(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            for attempt in range(self.max_retries + 1):
+                if self._write(batch):
+                    break
+                if attempt < self.max_retries:
+                    time.sleep(0.5 * 2 ** attempt)
+            else:
+                self.rows_failed += len(batch)
+                print(f"Dropped {len(batch)} rows of tenant {self.tenant_id} after {self.max_retries} retries")
+
+    def _write(self, batch):
+        started = time.monotonic()
+        session = get_tenant_session(self.tenant_id)
+        try:
+            session.add_all(batch)
+            intervals = [row for row in batch if isinstance(row, PersonDetected)]
+            if intervals:
+                update_rollups(session, intervals)
+            # Serialized before the commit expires them, the ids are known after the flush
+            session.flush()
+            alerts = [row.to_dict() for row in batch if isinstance(row, Alert)]
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            self.failed_flushes += 1
+            print(f"Failed to write {len(batch)} rows of tenant {self.tenant_id}: {e}")
+            return False
+        finally:
+            session.close()
+
+        publish_alerts(self.tenant_id, CREATED, alerts)
+        latency = time.monotonic() - started
+        with self._condition:
+            self.flush_latency = latency if self.flush_latency is None else \
+                LATENCY_SMOOTHING * latency + (1 - LATENCY_SMOOTHING) * self.flush_latency
+            self.max_flush_latency = max(self.max_flush_latency, latency)
+            self.rows_written += len(batch)
+            self.batches += 1
+        return True
+
+
+# Process wide buffers, tenant_id: WriteBehindBuffer
+write_buffers = {}
+write_buffers_lock = Lock()
+
+def get_write_buffer(tenant_id) -> WriteBehindBuffer:
+    with write_buffers_lock:
+        buffer = write_buffers.get(tenant_id)
+        if buffer is None:
+            buffer = WriteBehindBuffer(
+                tenant_id,
+                batch_size=int(os.getenv("WRITE_BUFFER_BATCH_SIZE", 500)),
+                max_delay=float(os.getenv("WRITE_BUFFER_MAX_DELAY", 1.0)),
+                max_pending=int(os.getenv("WRITE_BUFFER_MAX_PENDING", 10000)),
+                put_timeout=float(os.getenv("WRITE_BUFFER_PUT_TIMEOUT", 0.1))
+            )
+            write_buffers[tenant_id] = buffer
+        return buffer
+
+@atexit.register
+def close_write_buffers():
+    """Writes the pending rows of every tenant before the process exits"""
+    with write_buffers_lock:
+        buffers = list(write_buffers.values())
+        write_buffers.clear()
+    for buffer in buffers:
+        buffer.close()
@@ -0,0 +1,127 @@
+from threading import Lock
+import cv2 as cv
+import numpy as np
+from flaskr.entities.Zone import Zone
+
+# Padding added around the zones bounding box, relative to its size,
+# so faces on the border of a zone are not cut by the crop
+ROI_PADDING = 0.05
+# Zones of a camera that fit in the per pixel zone bitmap
+MAX_BITMAP_ZONES = 64
+
+
+class PreparedZones:
+    """Zone masks downscaled to one frame size"""
+
+    def __init__(self, zones, width, height):
+        self.width = width
+        self.height = height
+        self.masks = {zone_id: cv.resize(mask, (width, height), interpolation=cv.INTER_NEAREST) > 0
+                      for zone_id, mask in zones.items()}
+        self.union = np.zeros((height, width), dtype=bool)
+        for mask in self.masks.values():
+            self.union |= mask
+        self.area = int(np.count_nonzero(self.union))
+
+        # Every pixel holds one bit per zone covering it, zone_ids[bit] is the zone of a bit.
+        # Finding the zones of a point is then a single array lookup
+        self.zone_ids = list(self.masks)[:MAX_BITMAP_ZONES]
+        if len(self.masks) > MAX_BITMAP_ZONES:
+            print(f"Only the first {MAX_BITMAP_ZONES} of {len(self.masks)} zones are used for zone lookups")
+        self.bitmap = np.zeros((height, width), dtype=np.uint64)
+        for bit, zone_id in enumerate(self.zone_ids):
+            self.bitmap[self.masks[zone_id]] |= np.uint64(1 << bit)
+
+        # Bounding box (top, right, bottom, left) of the drawn region, None when nothing is drawn
+        self.roi = None
+        if self.area > 0:
+            rows = np.flatnonzero(self.union.any(axis=1))
+            columns = np.flatnonzero(self.union.any(axis=0))
+            padding_y = int((rows[-1] - rows[0] + 1) * ROI_PADDING)
+            padding_x = int((columns[-1] - columns[0] + 1) * ROI_PADDING)
+            self.roi = (int(max(rows[0] - padding_y, 0)), int(min(columns[-1] + 1 + padding_x, width)),
+                        int(min(rows[-1] + 1 + padding_y, height)), int(max(columns[0] - padding_x, 0)))
+
+    def zones_at(self, x, y):
+        """Ids of the zones covering a pixel"""
+        bits = int(self.bitmap[y, x])
+        zone_ids = []
+        while bits:
+            lowest = bits & -bits
+            zone_ids.append(self.zone_ids[lowest.bit_length() - 1])
+            bits ^= lowest
+        return zone_ids
+
+    def zones_at_location(self, location, scale=1):
+        """Ids of the zones under the center of a (top, right, bottom, left) box given at scale times this size"""
+        top, right, bottom, left = location
+        x = min((left + right) // (2 * scale), self.width - 1)
+        y = min((top + bottom) // (2 * scale), self.height - 1)
+        return self.zones_at(x, y)
+
+
+class CameraZones:
+    """
+    Zone masks of one camera, read from disk once and kept prepared
+    for every frame size that asked for them (motion detection, analysis).
+    Running pipelines keep a reference, set_zones makes them use the new zones.
+    """
+
+    def __init__(self):
+        self.lock = Lock()
+        self.version = 0
+        self._zones = {}  # zone id: grayscale mask image
+        self._prepared = {}  # (width, height): PreparedZones
+
+    def __len__(self):
+        return len(self._zones)
+
+    def set_zones(self, zones):
+        with self.lock:
+            self._zones = zones
+            self._prepared = {}
+            self.version += 1
+
+    def prepare(self, width, height) -> PreparedZones:
+        """Masks at the given size, None when the camera has no zones"""
+        with self.lock:
+            if not self._zones:
+                return None
+            prepared = self._prepared.get((width, height))
+            if prepared is None:
+                prepared = PreparedZones(self._zones, width, height)
+                self._prepared[(width, height)] = prepared
+            return prepared
+
+
+def load_zone_masks(db, camera_id):
+    masks = {}
+    for zone in db.query(Zone).filter_by(video_camera_id=camera_id).all():
+        mask = cv.imread(zone.mask, cv.IMREAD_GRAYSCALE)
+        if mask is None:
+            print(f"Could not read the mask of zone {zone.name}: {zone.mask}")
+            continue
+        masks[zone.id] = mask
+    return masks
+
+
+# Process wide cache, (tenant_id, camera_id): CameraZones
+camera_zones_cache = {}
+camera_zones_cache_lock = Lock()
+
+def get_camera_zones(db, tenant_id, camera_id) -> CameraZones:
+    """Returns the zones of the camera, reading the masks on first use"""
+    with camera_zones_cache_lock:
+        camera_zones = camera_zones_cache.get((tenant_id, camera_id))
+        if camera_zones is None:
+            camera_zones = CameraZones()
+            camera_zones.set_zones(load_zone_masks(db, camera_id))
+            camera_zones_cache[(tenant_id, camera_id)] = camera_zones
+        return camera_zones
+
+def refresh_camera_zones(db, tenant_id, camera_id):
+    """Reloads the masks of a camera after its zones changed, if they were loaded"""
+    with camera_zones_cache_lock:
+        camera_zones = camera_zones_cache.get((tenant_id, camera_id))
+        if camera_zones is not None:
+            camera_zones.set_zones(load_zone_masks(db, camera_id))
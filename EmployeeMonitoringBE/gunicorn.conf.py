@@ -0,0 +1,36 @@
+# Production server: gunicorn -c gunicorn.conf.py "flaskr:create_app()" (or flaskr.asgi:application, see flaskr/asgi.py)
+import gc
+import os
+
+bind = os.getenv("BIND", "0.0.0.0:5000")
+# The camera pipelines, frame and alert hubs, write buffers, face galleries and the analysis scheduler live in
+# the worker process: a second worker would open its own RTSP connections and analysis loops for the cameras its
+# viewers watch, never see the alerts of the other one and double the analysis CPU budget. Scale with threads,
+# or with WORKER_CLASS=uvicorn.workers.UvicornWorker and flaskr.asgi:application whose streams are served by an event loop
+workers = int(os.getenv("WORKERS", 1))
+worker_class = os.getenv("WORKER_CLASS", "gthread")
+threads = int(os.getenv("THREADS", 64))
+
+# The app is created in the master, which loads and warms the models (ModelRegistry)
+# before forking the workers, they share the weights copy-on-write
+preload_app = True
+os.environ.setdefault("MODEL_WARM_UP", "sync")
+
+
+def when_ready(server):
+    # Moves the objects created so far out of the garbage collector's reach,
+    # collections in the workers would otherwise write to every shared page holding one
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    # Connections opened by the master must not be shared by the workers
+    from flaskr.db import engine_registry
+    for engine in engine_registry.values():
+        engine.dispose(close=False)
+
+    # The worker has no threads yet, its face encoding pool is forked from it now and shares the master's face models
+    from flaskr.ML.model_registry import get_model_registry, FACE_MODELS
+    from flaskr.ML.face_recognition.face_encoding_service import get_face_encoding_service
+    if get_model_registry().is_loaded(FACE_MODELS):
+        get_face_encoding_service()
@@ -0,0 +1,40 @@
+# Benchmark of the ANN index against the exact FaceMatcher: recall@1 and query latency
+# Run from the EmployeeMonitoringBE folder: python -m tests.ann_index_benchmark
+import time
+import numpy as np
+from flaskr.ML.face_recognition.face_matcher import FaceMatcher
+from flaskr.ML.face_recognition.ann_index import ANNIndex
+
+QUERIES = 500
+NPROBES = (1, 4, 8, 16, 32)
+
+
+def synthetic_gallery(rng, size):
+    # Face encodings are not uniform, people of similar appearance form groups
+    groups = rng.normal(0, 0.1, (max(size // 100, 1), 128))
+    return (groups[rng.integers(0, len(groups), size)] + rng.normal(0, 0.06, (size, 128))).astype(np.float32)
+
+
+rng = np.random.default_rng(0)
+print(f"{'employees':>10} {'nprobe':>7} {'recall@1':>9} {'ann ms':>8} {'exact ms':>9}")
+for size in (1_000, 5_000, 20_000, 50_000):
+    gallery = synthetic_gallery(rng, size)
+    # Queries are other pictures of known employees
+    queries = gallery[rng.integers(0, size, QUERIES)] + rng.normal(0, 0.03, (QUERIES, 128)).astype(np.float32)
+
+    matcher = FaceMatcher(gallery, tolerance=np.inf)
+    start = time.perf_counter()
+    expected = [matcher.match(query)[0][0] for query in queries]
+    exact_ms = (time.perf_counter() - start) / QUERIES * 1000
+
+    index = ANNIndex(exact_threshold=1_000, tolerance=np.inf)
+    for label, encoding in enumerate(gallery):
+        index.add(label, encoding)
+
+    for nprobe in NPROBES:
+        index.nprobe = nprobe
+        start = time.perf_counter()
+        found = [index.search(query)[0][0] for query in queries]
+        ann_ms = (time.perf_counter() - start) / QUERIES * 1000
+        recall = np.mean([label == expected_label for label, expected_label in zip(found, expected)])
+        print(f"{size:>10} {nprobe:>7} {recall:>9.3f} {ann_ms:>8.3f} {exact_ms:>9.3f}")
@@ -0,0 +1,54 @@
+# Benchmark of the face detection modes on recorded footage: time per frame and recall against pure CNN
+# Run from the EmployeeMonitoringBE folder: python -m tests.face_detection_benchmark <video file> [every nth frame]
+import sys
+import time
+import numpy as np
+import cv2 as cv
+from flaskr.ML.face_recognition.face_detection import CNN, HOG, CASCADE, detect_faces
+from flaskr.ML.face_recognition.face_recognition_impl import ANALYSIS_SCALE
+from flaskr.ML.face_recognition.face_tracker import iou_matrix
+
+# A face counts as found when it overlaps a CNN detection by at least this IoU
+MATCH_IOU = 0.5
+
+video_path = sys.argv[1]
+every_nth_frame = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+# Same preprocessing as the camera pipeline
+frames = []
+cap = cv.VideoCapture(video_path)
+index = 0
+while True:
+    success, frame = cap.read()
+    if not success:
+        break
+    if index % every_nth_frame == 0:
+        small_frame = cv.resize(frame, (0, 0), fx=1 / ANALYSIS_SCALE, fy=1 / ANALYSIS_SCALE)
+        frames.append(np.ascontiguousarray(small_frame[:, :, ::-1]))
+    index += 1
+cap.release()
+print(f"{len(frames)} frames from {video_path}")
+
+results = {}
+for mode in (CNN, HOG, CASCADE):
+    start = time.perf_counter()
+    results[mode] = [detect_faces(frame, mode) for frame in frames]
+    results[mode + "_ms"] = (time.perf_counter() - start) / len(frames) * 1000
+
+reference_faces = sum(len(faces) for faces in results[CNN])
+frames_without_faces = sum(1 for faces in results[CNN] if not faces)
+print(f"{reference_faces} faces found by the CNN, {frames_without_faces} frames without faces")
+print(f"{'mode':>8} {'ms/frame':>9} {'speedup':>8} {'recall':>7} {'extra':>6}")
+for mode in (CNN, HOG, CASCADE):
+    found = 0
+    extra = 0
+    for reference, detected in zip(results[CNN], results[mode]):
+        if reference and detected:
+            matched = (iou_matrix(reference, detected) >= MATCH_IOU).any(axis=1).sum()
+        else:
+            matched = 0
+        found += matched
+        extra += len(detected) - matched
+    recall = found / reference_faces if reference_faces else 1.0
+    speedup = results[CNN + "_ms"] / results[mode + "_ms"]
+    print(f"{mode:>8} {results[mode + '_ms']:>9.1f} {speedup:>7.1f}x {recall:>7.3f} {extra:>6}")
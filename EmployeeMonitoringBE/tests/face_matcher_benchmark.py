@@ -0,0 +1,42 @@
+# Micro-benchmark of matching the faces of one frame against the employees gallery
+# compare_faces + face_distance per face (previous loop) vs FaceMatcher (one matrix operation)
+# Run from the EmployeeMonitoringBE folder: python -m tests.face_matcher_benchmark
+import time
+import numpy as np
+import face_recognition
+from flaskr.ML.face_recognition.face_matcher import FaceMatcher
+
+FACES_PER_FRAME = 5
+REPEATS = 50
+
+
+def match_with_loop(known_face_encodings, face_encodings):
+    best_matches = []
+    for face_encoding in face_encodings:
+        matches = face_recognition.compare_faces(known_face_encodings, face_encoding)
+        face_distances = face_recognition.face_distance(known_face_encodings, face_encoding)
+        best_match_index = np.argmin(face_distances)
+        best_matches.append(best_match_index if matches[best_match_index] else -1)
+    return best_matches
+
+
+def measure(function, *args):
+    start = time.perf_counter()
+    for _ in range(REPEATS):
+        result = function(*args)
+    return (time.perf_counter() - start) / REPEATS * 1000, result
+
+
+rng = np.random.default_rng(0)
+print(f"{'employees':>10} {'loop ms':>10} {'matcher ms':>11} {'speedup':>8}")
+for employees in (100, 1_000, 10_000):
+    known_face_encodings = list(rng.normal(0, 0.1, (employees, 128)))
+    # Faces in the frame are noisy copies of some employees
+    face_encodings = [known_face_encodings[i] + rng.normal(0, 0.01, 128) for i in rng.integers(0, employees, FACES_PER_FRAME)]
+
+    matcher = FaceMatcher(known_face_encodings)
+    loop_ms, loop_matches = measure(match_with_loop, known_face_encodings, face_encodings)
+    matcher_ms, (matcher_matches, _) = measure(matcher.match, face_encodings)
+    assert list(loop_matches) == list(matcher_matches)
+
+    print(f"{employees:>10} {loop_ms:>10.3f} {matcher_ms:>11.3f} {loop_ms / matcher_ms:>7.1f}x")
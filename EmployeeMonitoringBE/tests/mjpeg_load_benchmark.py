@@ -0,0 +1,102 @@
+# Load test of a camera stream: memory and CPU of the server per connected viewer, and the frame rate viewers get
+# Start the server with a single worker (WORKERS=1, or plain uvicorn) and pass the pid of that worker.
+# The server's usage is read from /proc so both run on the same machine, above a few hundred viewers the
+# client needs cores of its own or it slows the viewers down instead of the server
+# Run from the EmployeeMonitoringBE folder:
+# python -m tests.mjpeg_load_benchmark "<stream url with token>" <server pid> [viewer counts, e.g. 10,100,1000] [seconds]
+import asyncio
+import os
+import resource
+import sys
+import time
+from urllib.parse import urlsplit
+
+BOUNDARY = b"--frame"
+# Seconds given to the viewers to connect before measuring
+WARM_UP = 3
+
+url = urlsplit(sys.argv[1])
+server_pid = int(sys.argv[2])
+viewer_counts = [int(count) for count in (sys.argv[3] if len(sys.argv) > 3 else "10,100,500,1000").split(",")]
+duration = float(sys.argv[4]) if len(sys.argv) > 4 else 10
+
+# Every viewer is a socket
+_, hard_limit = resource.getrlimit(resource.RLIMIT_NOFILE)
+resource.setrlimit(resource.RLIMIT_NOFILE, (hard_limit, hard_limit))
+
+
+def server_usage():
+    """(resident bytes, CPU seconds) of the server process"""
+    with open(f"/proc/{server_pid}/statm") as statm:
+        resident = int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    with open(f"/proc/{server_pid}/stat") as stat:
+        # The command may contain spaces, the fields after it are fixed
+        fields = stat.read().rsplit(")", 1)[1].split()
+    cpu_seconds = (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+    return resident, cpu_seconds
+
+
+class Viewer:
+    def __init__(self):
+        self.frames = 0
+        self.bytes = 0
+        self.error = None
+
+    async def watch(self):
+        try:
+            reader, writer = await asyncio.open_connection(url.hostname, url.port or 80)
+        except OSError as e:
+            self.error = e
+            return
+        path = url.path + ("?" + url.query if url.query else "")
+        writer.write(f"GET {path} HTTP/1.1\r\nHost: {url.netloc}\r\n\r\n".encode())
+        tail = b""
+        try:
+            while True:
+                chunk = await reader.read(65536)
+                if not chunk:
+                    break
+                self.bytes += len(chunk)
+                # The boundary may be split between two reads
+                data = tail + chunk
+                self.frames += data.count(BOUNDARY) - tail.count(BOUNDARY)
+                tail = data[-len(BOUNDARY):]
+        except OSError as e:
+            self.error = e
+        finally:
+            writer.close()
+
+
+async def measure(count):
+    idle_resident, _ = server_usage()
+    viewers = [Viewer() for _ in range(count)]
+    tasks = [asyncio.create_task(viewer.watch()) for viewer in viewers]
+    await asyncio.sleep(WARM_UP)
+
+    frames_before = sum(viewer.frames for viewer in viewers)
+    _, cpu_before = server_usage()
+    started = time.monotonic()
+    await asyncio.sleep(duration)
+    elapsed = time.monotonic() - started
+    resident, cpu_after = server_usage()
+    frames = sum(viewer.frames for viewer in viewers) - frames_before
+
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    errors = sum(1 for viewer in viewers if viewer.error is not None)
+    connected = count - errors
+    cpu = (cpu_after - cpu_before) / elapsed * 100
+    print(f"{count:>8} {connected:>10} {frames / elapsed / max(connected, 1):>11.1f} "
+          f"{(resident - idle_resident) / max(connected, 1) / 1024:>14.1f} {cpu:>8.1f} {cpu / max(connected, 1):>11.3f}")
+    # Lets the server notice the disconnections before the next step
+    await asyncio.sleep(WARM_UP)
+
+
+async def main():
+    print(f"{'viewers':>8} {'connected':>10} {'fps/viewer':>11} {'KB RSS/viewer':>14} {'CPU %':>8} "
+          f"{'CPU %/viewer':>11}")
+    for count in viewer_counts:
+        await measure(count)
+
+asyncio.run(main())
@@ -0,0 +1,95 @@
+# Benchmark of the single person pass against running every filter on its own, on recorded footage:
+# time per frame, on frames with and without people, and recall of the faces found inside the persons
+# Run from the EmployeeMonitoringBE folder: python -m tests.person_detection_benchmark <video file> [every nth frame] [detection mode]
+import sys
+import time
+import numpy as np
+import cv2 as cv
+from flaskr.ML.face_recognition.face_detection import CNN, detect_faces, detect_faces_in_regions
+from flaskr.ML.face_recognition.face_recognition_impl import ANALYSIS_SCALE, get_analysis_size
+from flaskr.ML.face_recognition.face_tracker import iou_matrix
+from flaskr.ML.person_detection.person_detection import get_face_regions
+from flaskr.ML.ppe_recognition.ppe_recognition_impl import group_by_person
+from flaskr.ML.model_registry import PPE_DETECTOR, get_model_registry
+from flaskr.ML.ppe_recognition.ppe_recognition_service import PPERecognitionService
+
+# A face counts as found when it overlaps a full frame detection by at least this IoU
+MATCH_IOU = 0.5
+
+video_path = sys.argv[1]
+every_nth_frame = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+detection_mode = sys.argv[3] if len(sys.argv) > 3 else CNN
+
+frames = []
+cap = cv.VideoCapture(video_path)
+index = 0
+while True:
+    success, frame = cap.read()
+    if not success:
+        break
+    if index % every_nth_frame == 0:
+        frames.append(frame)
+    index += 1
+cap.release()
+print(f"{len(frames)} frames from {video_path}, face detection mode {detection_mode}")
+
+# batch_size 1 so both runs measure one frame at a time, as a single camera would
+service = PPERecognitionService(get_model_registry().get(PPE_DETECTOR), batch_size=1)
+
+
+def downscale(frame):
+    small_frame = cv.resize(frame, (0, 0), fx=1 / ANALYSIS_SCALE, fy=1 / ANALYSIS_SCALE)
+    return np.ascontiguousarray(small_frame[:, :, ::-1])
+
+
+def separate_filters(frame):
+    # Person detection, PPE recognition and face detection each scan the whole frame
+    group_by_person(service.detect(frame).result())
+    group_by_person(service.detect(frame).result())
+    return detect_faces(downscale(frame), detection_mode)
+
+
+def single_pass(frame):
+    persons = group_by_person(service.detect(frame).result())
+    regions = get_face_regions(persons, get_analysis_size(frame), ANALYSIS_SCALE)
+    return detect_faces_in_regions(downscale(frame), regions, detection_mode) if regions else [], persons
+
+
+separate_ms = []
+separate_faces = []
+for frame in frames:
+    start = time.perf_counter()
+    separate_faces.append(separate_filters(frame))
+    separate_ms.append((time.perf_counter() - start) * 1000)
+
+single_ms = []
+single_faces = []
+with_persons = []
+for frame in frames:
+    start = time.perf_counter()
+    faces, persons = single_pass(frame)
+    single_ms.append((time.perf_counter() - start) * 1000)
+    single_faces.append(faces)
+    with_persons.append(any(person.is_person for person in persons))
+
+reference_faces = sum(len(faces) for faces in separate_faces)
+found = 0
+for reference, detected in zip(separate_faces, single_faces):
+    if reference and detected:
+        found += (iou_matrix(reference, detected) >= MATCH_IOU).any(axis=1).sum()
+recall = found / reference_faces if reference_faces else 1.0
+
+separate_ms = np.array(separate_ms)
+single_ms = np.array(single_ms)
+with_persons = np.array(with_persons)
+print(f"{with_persons.sum()} frames with persons, {(~with_persons).sum()} without, "
+      f"{reference_faces} faces found in the whole frames")
+print(f"{'frames':>16} {'separate ms':>12} {'single ms':>10} {'speedup':>8}")
+for label, selection in (("all", np.ones_like(with_persons)), ("with persons", with_persons),
+                         ("without persons", ~with_persons)):
+    if not selection.any():
+        continue
+    separate = separate_ms[selection].mean()
+    single = single_ms[selection].mean()
+    print(f"{label:>16} {separate:>12.1f} {single:>10.1f} {separate / single:>7.1f}x")
+print(f"face recall of the single pass: {recall:.3f}")
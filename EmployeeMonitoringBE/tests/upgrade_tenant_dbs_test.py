@@ -0,0 +1,62 @@
+# flask upgrade-tenant-dbs on tenant databases created before the presence interval columns existed
+# Run from the EmployeeMonitoringBE folder: python -m pytest tests/upgrade_tenant_dbs_test.py
+from flask import Flask
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.orm import Session
+from flaskr.cli import upgrade_tenant_dbs
+from flaskr.db import engine_registry, init_app
+from flaskr.entities.BaseEntity import Entity
+from flaskr.entities.auth_db.Tenant import Tenant
+
+
+def create_old_tenant_db(url):
+    """Tenant database whose persons_detected table still has the single sighting columns"""
+    engine = create_engine(url)
+    Entity.metadata.create_all(bind=engine)
+    with engine.begin() as connection:
+        connection.execute(text("DROP TABLE persons_detected"))
+        connection.execute(text("CREATE TABLE persons_detected (id INTEGER PRIMARY KEY, detected_at DATETIME, "
+                                "employee_id INTEGER REFERENCES employees (id), "
+                                "video_camera_id INTEGER REFERENCES video_cameras (id))"))
+        connection.execute(text("INSERT INTO persons_detected (detected_at) VALUES ('2024-01-01 08:00:00')"))
+    engine.dispose()
+
+
+def test_upgrade_all_tenants(tmp_path):
+    app = Flask(__name__)
+    app.config.update(USERS_DATABASE_URL=f"sqlite:///{tmp_path / 'users.db'}",
+                      GENERAL_DATABASE_URL=f"sqlite:///{tmp_path}")
+    init_app(app)
+
+    tenants = [Tenant(name="first"), Tenant(name="second")]
+    with Session(bind=engine_registry["users"]) as session:
+        session.add_all(tenants)
+        session.commit()
+        tenant_ids = [str(tenant.id) for tenant in tenants]
+    for tenant_id in tenant_ids:
+        create_old_tenant_db(f"sqlite:///{tmp_path / tenant_id}")
+
+    try:
+        # The flask command pushes the app context, the test runner does not
+        with app.app_context():
+            result = app.test_cli_runner().invoke(upgrade_tenant_dbs)
+        assert result.exit_code == 0, result.output
+
+        for tenant_id in tenant_ids:
+            assert f"Tenant {tenant_id}: " in result.output
+            assert "created index ix_persons_detected_zone_detected_at_id" in result.output
+            inspector = inspect(engine_registry[tenant_id])
+            columns = {column["name"] for column in inspector.get_columns("persons_detected")}
+            assert {"ended_at", "frame_count", "zone_id"} <= columns
+            indexes = {index["name"] for index in inspector.get_indexes("persons_detected")}
+            assert {index.name for index in Entity.metadata.tables["persons_detected"].indexes} <= indexes
+            with engine_registry[tenant_id].connect() as connection:
+                assert connection.execute(text("SELECT ended_at = detected_at, frame_count FROM persons_detected")).one() == (1, 1)
+        # Only the seeded tenants' databases were created
+        assert sorted(path.name for path in tmp_path.iterdir() if path.name != "users.db") == sorted(tenant_ids)
+    finally:
+        for tenant_id in tenant_ids:
+            engine = engine_registry.pop(tenant_id, None)
+            if engine is not None:
+                engine.dispose()
+        engine_registry.pop("users").dispose()